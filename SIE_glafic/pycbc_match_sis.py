@@ -8,6 +8,7 @@ from pycbc.types import FrequencySeries
 from pycbc.filter import match
 from pycbc.psd import aLIGOZeroDetHighPower
 import matplotlib as mpl
+from gw_lens_dir import amplification
 
 pd.set_option('display.float_format', lambda x: '%.3e' % x)
 plotdirName = "/Users/saifali/Desktop/gwlensing/plots/"
@@ -181,13 +182,7 @@ def amp_fact_sis_wo(y, ML, f):
         F_val : array, complex
             Amplification factor for SIS
         '''
-        F_val_sis = np.zeros_like(f, dtype = np.complex128)
-        for i in range(len(f)):
-            w = 8 * pi * ML * f[i]
-            pre_factor = exp(1j * (w / 2) * (y**2 + 2 * (y + 0.5)))
-            func = lambda n: (gamma(1 + n / 2) / fac(n)) * (2 * w * exp(1j * 3 * (pi / 2))) ** (n / 2) * hyp1f1(1 + n / 2, 1, -1j * (w / 2) * y ** 2)
-            series_sum = nsum(func, [0, inf])
-
-            F_val_sis[i] = np.complex128(pre_factor * series_sum, dtype = np.complex128)
+        # double precision series / quasi geometrical optics instead of mp.nsum at every frequency
+        F_val_sis = amplification.F_sis(np.asarray(f), ML, y)
 
         return F_val_sis
\ No newline at end of file
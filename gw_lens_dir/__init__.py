@@ -4,4 +4,23 @@ from gw_lens_dir.overlap_lensing_changed_param import overlap_dual_ann_lensing
 from gw_lens_dir.overlap_lensing_geo_wave import overlap_dual_ann_lensing_geo_wave
 from gw_lens_dir.overlap_lensing_sis import overlap_sis
 from gw_lens_dir.overlap_lensing_sie_twoimages import overlap_sie
-from gw_lens_dir.overlap_fourimages_lenstemp_check import overlap_sie_check
\ No newline at end of file
+from gw_lens_dir.overlap_fourimages_lenstemp_check import overlap_sie_check
+from gw_lens_dir.inner_product import overlap_grid, from_overlap, fft_maximize
+from gw_lens_dir.norm_cache import norm_cache, shared_norm_cache
+from gw_lens_dir.lens_sweep import sweep, sweep_overlaps, amp_fact_matrix
+from gw_lens_dir.transition_table import f_transition, w_peak_table
+from gw_lens_dir.amplification_table import amp_fact_table, F_table
+from gw_lens_dir.amp_fact_cache import amp_fact_cache, shared_amp_fact_cache, cached_F
+from gw_lens_dir.geo_overlap import correlation, geo_sweep, fit_sweep
+from gw_lens_dir.panel_quad import panel_quad, panel_overlap
+from gw_lens_dir.roq import roq_basis, build_roq
+from gw_lens_dir.relative_binning import relative_binning
+from gw_lens_dir.filon import legendre_panels
+from gw_lens_dir.geo_overlap import filon_correlation
+from gw_lens_dir.inner_product import multiband_grid
+from gw_lens_dir.warm_sweep import warm_sweep
+from gw_lens_dir.population import population_optimize
+from gw_lens_dir.lens_sweep import lockstep_sweep
+from gw_lens_dir.maximize import maximize_overlap
+from gw_lens_dir.gradients import differentiable_overlap
+from gw_lens_dir.fitting_factor import fitting_factor, ff_sweep
\ No newline at end of file
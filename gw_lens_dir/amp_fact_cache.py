@@ -0,0 +1,251 @@
+"""
+On-disk cache of amplification factor arrays, shared by the processes of a run and across runs.
+
+Every multiprocessing.Process of the sweeps (overlap_multiprocessed_lensing, pycbc_match) evaluates F on its
+own frequency grid and throws it away when it exits, although neighbouring runs keep asking for the same
+(lens, M_lz, y, grid). Here each F array is stored as a .npy file named after a hash of the lens model, the
+lens parameters, the frequency grid and the implementation of F (amplification.VERSION and TOL, so arrays of an
+older implementation are never served), and read back with np.load(mmap_mode = 'r'): concurrent workers map
+the same pages instead of holding copies.
+
+Entries are written to a temporary file and renamed, so readers never see a partial array. Reading an entry
+refreshes its modification time (when the cache is writable), and once the size of the cache, estimated from the
+entries written since the directory was last listed, is above max_bytes the least recently used entries are
+deleted.
+
+The cache is inspected and pruned with
+
+    python -m gw_lens_dir.amp_fact_cache list
+    python -m gw_lens_dir.amp_fact_cache prune --max_mb 500
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import numpy as np
+from gw_lens_dir import amplification
+
+CACHE_DIR = os.environ.get('GW_LENS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'gw_lens_dir', 'amp_fact'))
+MAX_BYTES = 2 * 1024**3
+VERSION = f'{amplification.VERSION}-tol{amplification.TOL:g}'
+
+def cache_key(lens, params, f, version = VERSION):
+    '''content hash of an F array.
+
+    Parameters
+    ----------
+    lens : str
+        lens model (e.g. 'sis', 'pm', 'sis_geo')
+    params : dict
+        lens parameters (M_lz, y, ...)
+    f : array
+        frequency grid
+    version : str
+        implementation of F
+    '''
+    f = np.ascontiguousarray(f, dtype = float)
+    identity = json.dumps([version, lens, sorted((key, repr(float(value))) for key, value in params.items())])
+
+    digest = hashlib.sha1(identity.encode())
+    digest.update(f.tobytes())
+
+    return digest.hexdigest()
+
+
+class amp_fact_cache():
+    """ Content keyed, memory-mapped cache of F arrays in a directory
+    """
+
+    def __init__(self, path = CACHE_DIR, max_bytes = MAX_BYTES):
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # bytes on disk, None until the directory is listed
+        self.size_estimate = None
+
+    def _file(self, key, ext = '.npy'):
+
+        return os.path.join(self.path, key + ext)
+
+    def load(self, key):
+        '''memory-mapped (read only) array stored under key, None if it is not cached.
+        '''
+        try:
+            F_val = np.load(self._file(key), mmap_mode = 'r')
+        except (FileNotFoundError, ValueError):
+            # not cached, or evicted / being replaced by another process
+            return None
+        try:
+            os.utime(self._file(key))
+        except OSError:
+            # read only cache, the entry just keeps its last use
+            pass
+
+        return F_val
+
+    def store(self, key, F_val, meta = None):
+
+        os.makedirs(self.path, exist_ok = True)
+        # write then rename, so that other processes only ever see complete files
+        for ext, write in [('.json', lambda fh: fh.write(json.dumps(meta or {}).encode())),
+                           ('.npy', lambda fh: np.save(fh, np.asarray(F_val)))]:
+            fd, tmp = tempfile.mkstemp(dir = self.path, suffix = '.tmp')
+            with os.fdopen(fd, 'wb') as fh:
+                write(fh)
+            os.replace(tmp, self._file(key, ext))
+
+        # the directory is only listed again once the estimate is above max_bytes
+        if self.size_estimate is None:
+            self.size_estimate = self.size()
+        else:
+            self.size_estimate += os.path.getsize(self._file(key))
+        if self.size_estimate > self.max_bytes:
+            self.prune(self.max_bytes)
+
+    def get(self, lens, params, f, func):
+        '''F array of a lens, calling func() to compute it on a miss.
+
+        Parameters
+        ----------
+        lens : str
+            lens model
+        params : dict
+            lens parameters
+        f : array
+            frequency grid
+        func : callable
+            func() returns F on f
+
+        Return
+        ----------
+        F_val : array, complex
+            read only memory map on a hit
+        '''
+        key = cache_key(lens, params, f)
+        F_val = self.load(key)
+        if F_val is not None:
+            self.hits += 1
+            return F_val
+
+        self.misses += 1
+        F_val = np.asarray(func())
+        meta = {'lens': lens, 'version': VERSION, 'params': {key_: float(value) for key_, value in params.items()}, 'n_freq': len(f),
+                'f_min': float(np.min(f)), 'f_max': float(np.max(f)), 'created': time.time()}
+        try:
+            self.store(key, F_val, meta = meta)
+        except OSError:
+            # a full or read only disk only costs the recomputation
+            pass
+
+        return F_val
+
+    def entries(self):
+        '''(key, size in bytes, last use, metadata) of every entry, least recently used first.
+        '''
+        if not os.path.isdir(self.path):
+            return []
+
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.npy'):
+                continue
+            key = name[:-4]
+            try:
+                stat = os.stat(self._file(key))
+            except FileNotFoundError:
+                continue
+            try:
+                with open(self._file(key, '.json')) as fh:
+                    meta = json.load(fh)
+            except (FileNotFoundError, ValueError):
+                meta = {}
+            entries.append((key, stat.st_size, stat.st_mtime, meta))
+
+        return sorted(entries, key = lambda entry: entry[2])
+
+    def size(self):
+
+        return sum(entry[1] for entry in self.entries())
+
+    def prune(self, max_bytes):
+        '''deletes the least recently used entries until the cache is below max_bytes.
+
+        Return
+        ----------
+        n_removed : int
+        '''
+        entries = self.entries()
+        total = sum(entry[1] for entry in entries)
+        n_removed = 0
+        for key, size, _, _ in entries:
+            if total <= max_bytes:
+                break
+            for ext in ['.npy', '.json']:
+                try:
+                    os.remove(self._file(key, ext))
+                except FileNotFoundError:
+                    # already evicted by another process
+                    pass
+            total -= size
+            n_removed += 1
+        self.size_estimate = total
+
+        return n_removed
+
+    def clear(self):
+
+        n_removed = self.prune(0)
+        self.hits = 0
+        self.misses = 0
+
+        return n_removed
+
+    def stats(self):
+        """ hit and miss counts of this process, number of entries and size on disk
+        """
+        entries = self.entries()
+
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(entries),
+                'bytes': sum(entry[1] for entry in entries)}
+
+
+# Cache shared by the sweeps and the pycbc scripts
+shared_amp_fact_cache = amp_fact_cache()
+
+def cached_F(lens, amp_fact, f, M_lz, y, cache = shared_amp_fact_cache):
+    '''amp_fact(f, M_lz, y) through the on-disk cache.
+
+    Return
+    ----------
+    F_val : array, complex
+    '''
+    return cache.get(lens, {'M_lz': M_lz, 'y': y}, f, lambda: amp_fact(f, M_lz, y))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = 'inspect or prune the amplification factor cache')
+    parser.add_argument('command', choices = ['list', 'info', 'prune', 'clear'])
+    parser.add_argument('--path', default = CACHE_DIR)
+    parser.add_argument('--max_mb', type = float, default = MAX_BYTES / 1024**2)
+    args = parser.parse_args()
+
+    cache = amp_fact_cache(path = args.path)
+    if args.command == 'list':
+        for key, size, last_use, meta in cache.entries():
+            params = ', '.join(f'{name} = {value:.4g}' for name, value in meta.get('params', {}).items())
+            print(f"{key[:12]}  {meta.get('lens', '?'):8s} {params:40s} {meta.get('n_freq', '?'):>8} pts "
+                  f"{size / 1024**2:8.2f} MB  last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_use))}")
+    elif args.command == 'info':
+        stats = cache.stats()
+        print(f"{cache.path}: {stats['entries']} entries, {stats['bytes'] / 1024**2:.2f} MB")
+    elif args.command == 'prune':
+        n_removed = cache.prune(args.max_mb * 1024**2)
+        print(f'removed {n_removed} entries, {cache.size() / 1024**2:.2f} MB left')
+    else:
+        print(f'removed {cache.clear()} entries')
@@ -0,0 +1,650 @@
+"""
+Amplification factors as plain functions of the frequency array and the lens parameters, so they can be
+shared by the overlap classes, the sweeps and the pycbc scripts. They follow the F_* methods of the
+overlap classes.
+"""
+
+import warnings
+import numpy as np
+import scipy.special as sc
+import mpmath as mp
+from math import factorial
+from functools import lru_cache
+from gw_lens_dir import quasi_geometric
+
+# absolute accuracy |F - F_mpmath| targeted by the double precision evaluations
+TOL = 1e-6
+
+# implementation of the F functions, part of the keys of the on-disk cache (amp_fact_cache.py): bump it whenever
+# the values they return change
+VERSION = 'double-1'
+
+def mag(y, lens = 'pm'):
+    """ Returns (flux ratio, mu_plus, mu_minus) of the two images
+    """
+    if lens == 'pm':
+        mu_plus = np.abs(0.5 + (y ** 2 + 2) / (2 * y * (y ** 2 + 4) ** 0.5))
+        mu_minus = np.abs(0.5 - (y ** 2 + 2) / (2 * y * (y ** 2 + 4) ** 0.5))
+
+    elif lens == 'sis':
+        mu_plus = np.abs(1 + 1 / y)
+        mu_minus = np.abs(-1 + 1 / y)
+
+    return mu_minus / mu_plus, mu_plus, mu_minus
+
+def time_del(M_lz, y, lens = 'pm'):
+    """ Time delay (in seconds) between the two images
+    """
+    if lens == 'pm':
+        first_term = (y * (y ** 2 + 4) ** 0.5) / 2
+        second_term = np.log(((y ** 2 + 4) ** 0.5 + y) / ((y ** 2 + 4) ** 0.5 - y))
+        tds = 4 * M_lz * (first_term + second_term)
+
+    elif lens == 'sis':
+        tds = 8 * M_lz * y
+
+    return tds
+
+def F_geo_pm(f, M_lz, y):
+    '''amplification factor of the point mass lens in the geometrical optics limit.
+
+    Parameters
+    ----------
+    f : array
+        frequency
+    M_lz : float
+        redshifted lens mass (in seconds)
+    y : float
+        source position
+
+    Return
+    ----------
+    F_val : array, complex
+    '''
+    flux_ratio = mag(y, lens = 'pm')[0]
+    td = time_del(M_lz, y, lens = 'pm')
+
+    return 1 - 1j * np.sqrt(flux_ratio) * np.exp(2 * np.pi * 1j * np.asarray(f) * td)
+
+def F_geo_sis(f, M_lz, y):
+    '''amplification factor of the SIS lens in the geometrical optics limit (one image for y > 1).
+    '''
+    f = np.asarray(f, dtype = float)
+    if y <= 1:
+        flux_ratio = mag(y, lens = 'sis')[0]
+        td = time_del(M_lz, y, lens = 'sis')
+        F_geo_val = 1 - 1j * np.sqrt(flux_ratio) * np.exp(2 * np.pi * 1j * f * td)
+    else:
+        F_geo_val = np.full(f.shape, mag(y, lens = 'sis')[1], dtype = np.complex128)
+
+    return F_geo_val
+
+def F_pm_mpmath(w, y):
+    '''point mass amplification factor at one dimensionless frequency w = 8 pi M_lz f (mpmath).
+    '''
+    x_m = 0.5 * (y + np.sqrt(y**2 + 4))
+    phi_m = np.power((x_m - y) , 2) / 2 - np.log(x_m)
+
+    first_term = np.exp(np.pi * w / 4 + 1j * (w / 2) * (np.log(w / 2) - 2 * phi_m))
+    second_term = sc.gamma(1 - 1j * (w / 2))
+    third_term = mp.hyp1f1(1j * w / 2, 1, 1j * (w / 2) * (y**2), maxterms = 10**6)
+
+    return complex(first_term * second_term * third_term)
+
+def F_sis_mpmath(w, y, dps = 15):
+    '''SIS amplification factor at one dimensionless frequency w = 8 pi M_lz f (mpmath series).
+
+    The terms of the series cancel more and more as w grows, so the default 15 digits are only good up to
+    w ~ 50 (depending on y); dps sets the working precision.
+    '''
+    with mp.workdps(dps):
+        pre_factor = mp.exp(1j * (w / 2) * (y**2 + 2 * (y + 0.5)))
+        func = lambda n: (mp.gamma(1 + n / 2) / mp.fac(n)) * (2 * w * mp.exp(1j * 3 * (mp.pi / 2))) ** (n / 2) * mp.hyp1f1(1 + n / 2, 1, -1j * (w / 2) * y ** 2)
+        series_sum = mp.nsum(func, [0, mp.inf])
+
+        return complex(pre_factor * series_sum)
+
+class _sis_series_table():
+    """ n dependent factors of the series of F_sis_mpmath at one working precision, extended on demand:
+    Gamma(1 + n/2) / n! (-2i)^(n/2) and the coefficients of the recurrence in a of M(a, 1, z) = 1F1(a; 1; z),
+
+        a M(a + 1) = (2a - 1 + z) M(a) - (a - 1) M(a - 1),
+
+    which links n and n + 2 (a = 1 + n/2). The only y dependence of the series is z / w = -i y^2 / 2.
+    """
+
+    def __init__(self, y, dps):
+
+        self.dps = dps
+        with mp.workdps(dps):
+            self.z_per_w = -1j * mp.mpf(y)**2 / 2
+        self.coeff = []
+        self.rec = []
+
+    def extend(self, n_terms):
+
+        with mp.workdps(self.dps):
+            for n in range(len(self.coeff), n_terms):
+                a = 1 + mp.mpf(n) / 2
+                self.coeff.append(mp.gamma(a) / mp.fac(n) * (2 * mp.exp(1j * 3 * (mp.pi / 2))) ** (mp.mpf(n) / 2))
+                self.rec.append(((2 * a - 1) / a, 1 / a, (a - 1) / a))
+
+@lru_cache(maxsize = 32)
+def _sis_table(y, dps):
+
+    return _sis_series_table(y, dps)
+
+def sis_mpmath_dps(w, y):
+    '''working precision needed by the series of F_sis_mpmath for a double precision result: its terms reach
+    ~ exp(w (1 + y)^2 / 2) before they cancel.
+    '''
+    return 20 + int(np.ceil(np.max(w) * (1 + y)**2 / 2 / np.log(10)))
+
+def F_sis_mpmath_grid(w, y, dps = None):
+    '''F_sis_mpmath on an array of dimensionless frequencies in one pass.
+
+    The n dependent factors are tabulated once per (y, dps) and kept in a bounded LRU (_sis_table), and the
+    hypergeometric functions follow from two evaluations per w and the recurrence in n, instead of an
+    mp.hyp1f1 per term. The series is summed until its terms are below the working precision.
+
+    Parameters
+    ----------
+    w : array
+        dimensionless frequency 8 pi M_lz f
+    y : float
+        source position
+    dps : int
+        working precision (defaults to sis_mpmath_dps(w, y), enough for the cancellation of the series)
+
+    Return
+    ----------
+    F_val : array, complex
+    '''
+    w = np.asarray(w, dtype = float)
+    dps = sis_mpmath_dps(w, y) if dps is None else dps
+    table = _sis_table(float(y), dps)
+
+    F_val = np.ones(w.shape, dtype = np.complex128)
+    with mp.workdps(dps):
+        eps = mp.mpf(10)**(-dps)
+        for i, w_val in np.ndenumerate(w):
+            if w_val <= 0:
+                continue
+            w_mp = mp.mpf(w_val)
+            z = table.z_per_w * w_mp
+            sqrt_w = mp.sqrt(w_mp)
+
+            # M(1 + n/2) for n - 2 and n, even and odd n
+            M = {-2: mp.mpf(0), -1: mp.hyp1f1(0.5, 1, z), 0: mp.exp(z), 1: mp.hyp1f1(1.5, 1, z)}
+            series_sum = mp.mpc(0)
+            largest = mp.mpf(0)
+            w_power = mp.mpf(1)
+            n = 0
+            while True:
+                if n >= len(table.coeff):
+                    table.extend(2 * n + 64)
+                term = table.coeff[n] * w_power * M[n]
+                series_sum += term
+                largest = max(largest, abs(term))
+                # past the largest terms
+                if n > 4 * w_val * (1 + y)**2 + 8 and abs(term) < eps * largest:
+                    break
+
+                alpha, beta, gamma_ = table.rec[n]
+                M[n + 2] = (alpha + beta * z) * M[n] - gamma_ * M[n - 2]
+                del M[n - 2]
+                w_power *= sqrt_w
+                n += 1
+
+            F_val[i] = complex(mp.exp(1j * (w_mp / 2) * (y**2 + 2 * (y + 0.5))) * series_sum)
+
+    return F_val
+
+def _kummer_series(a, z, n_max = 1000):
+    '''power series of 1F1(a; 1; z) in double precision.
+
+    Return
+    ----------
+    M : array, complex
+    rel_err : array
+        estimated relative rounding error of M, eps * (largest term) / |M| (cancellation between the terms)
+    '''
+    a, z = np.broadcast_arrays(np.asarray(a, dtype = np.complex128), np.asarray(z, dtype = np.complex128))
+    term = np.ones(a.shape, dtype = np.complex128)
+    M = np.ones(a.shape, dtype = np.complex128)
+    largest = np.ones(a.shape)
+
+    for n in range(n_max):
+        term = term * (a + n) * z / (n + 1) ** 2
+        M += term
+        largest = np.maximum(largest, np.abs(term))
+        if n > 2 and np.all(np.abs(term) <= 1e-17 * np.abs(M)):
+            break
+
+    rel_err = np.finfo(float).eps * np.sqrt(n + 1) * largest / np.abs(M)
+
+    return M, rel_err
+
+def _pm_prefactor(w, y):
+    '''exp(pi w / 4 + i w / 2 (ln(w / 2) - 2 phi_m)) Gamma(1 - i w / 2), evaluated in log space.
+    '''
+    x_m = 0.5 * (y + np.sqrt(y**2 + 4))
+    phi_m = np.power((x_m - y) , 2) / 2 - np.log(x_m)
+
+    return np.exp(np.pi * w / 4 + 1j * (w / 2) * (np.log(w / 2) - 2 * phi_m) + sc.loggamma(1 - 1j * (w / 2)))
+
+def _dpsi_pm(r, n):
+    '''radial derivatives of the point mass potential psi = ln r.
+    '''
+    return [(-1)**(k - 1) * factorial(k - 1) / r**k for k in range(1, n + 1)]
+
+@lru_cache(maxsize = 64)
+def _pm_images(y, order):
+    '''images of the point mass lens with their 1 / w expansions (see quasi_geometric.py)
+    '''
+    images = []
+    for x_image in [(y + np.sqrt(y**2 + 4)) / 2, (y - np.sqrt(y**2 + 4)) / 2]:
+        phi_image = (x_image - y)**2 / 2 - np.log(np.abs(x_image))
+        images.append((x_image, phi_image) + quasi_geometric.image_expansion(x_image, y, _dpsi_pm, order = order))
+
+    return tuple(images)
+
+def F_pm_asymptotic(w, y, order = 6):
+    '''point mass amplification factor for large w: quasi geometrical optics, i.e. the two images with their
+    1 / w diffraction corrections. The expansion is asymptotic, so at each w it is truncated at the order
+    (up to order) with the smallest last term.
+
+    Return
+    ----------
+    F_val : array, complex
+    err : array
+        error estimate, ten times the last term kept (near the optimal truncation the error can exceed the
+        last term by a few)
+    '''
+    w = np.asarray(w, dtype = float)
+    images = _pm_images(float(y), order)
+    phi_m = images[0][1]
+
+    F_val = np.zeros(w.shape, dtype = np.complex128)
+    err = np.full(w.shape, np.inf)
+    for k in range(1, order + 1):
+        F_k, last = quasi_geometric.F_images(w, y, images, phi_m, order = k)
+        better = last < err
+        F_val[better] = F_k[better]
+        err[better] = last[better]
+
+    return F_val, 10 * err
+
+def F_pm_w(w, y, tol = TOL, return_method = False):
+    '''point mass amplification factor on an array of dimensionless frequencies, in double precision.
+
+    Every w is evaluated with the power series of 1F1 where the cancellation between its terms is below tol
+    (roughly w y < 25), else with the quasi geometrical optics expansion where its truncation error is
+    below tol (large w). Only the points left in between (small y and intermediate w) fall back to mpmath.
+
+    Parameters
+    ----------
+    w : array
+        dimensionless frequency 8 pi M_lz f
+    y : float
+        source position
+    tol : float
+        target absolute accuracy
+    return_method : bool
+        also return the method used for each w ('series', 'asymptotic' or 'mpmath')
+
+    Return
+    ----------
+    F_val : array, complex
+    '''
+    shape = np.shape(w)
+    w = np.atleast_1d(np.asarray(w, dtype = float)).ravel()
+    F_val = np.ones(w.shape, dtype = np.complex128)
+    method = np.full(w.shape, 'series', dtype = object)
+    todo = w > 0
+
+    # power series, only tried where the terms can not overflow
+    try_series = todo & (w * y < 60)
+    if np.any(try_series):
+        w_ser = w[try_series]
+        M, rel_err = _kummer_series(1j * w_ser / 2, 1j * w_ser * y**2 / 2)
+        F_ser = _pm_prefactor(w_ser, y) * M
+        good = rel_err * np.abs(F_ser) < tol
+        idx = np.flatnonzero(try_series)[good]
+        F_val[idx] = F_ser[good]
+        todo[idx] = False
+
+    if np.any(todo):
+        F_asym, err = F_pm_asymptotic(w[todo], y)
+        good = err < tol
+        idx = np.flatnonzero(todo)[good]
+        F_val[idx] = F_asym[good]
+        method[idx] = 'asymptotic'
+        todo[idx] = False
+
+    for i in np.flatnonzero(todo):
+        F_val[i] = F_pm_mpmath(w[i], y)
+        method[i] = 'mpmath'
+
+    if return_method:
+        return F_val.reshape(shape), method.reshape(shape)
+
+    return F_val.reshape(shape)
+
+def F_pm(f, M_lz, y, tol = TOL):
+    '''point mass amplification factor (wave optics) on a frequency array, in double precision
+    (see F_pm_w). F_pm_mpmath is the reference implementation.
+
+    Parameters
+    ----------
+    f : array
+        frequency
+    M_lz : float
+        redshifted lens mass (in seconds)
+    y : float
+        source position
+    tol : float
+        target absolute accuracy
+
+    Return
+    ----------
+    F_val : array, complex
+    '''
+    w = 8 * np.pi * M_lz * np.asarray(f, dtype = float)
+
+    return F_pm_w(w, y, tol = tol)
+
+def _sis_prefactor(w, y):
+
+    return np.exp(1j * (w / 2) * (y**2 + 2 * (y + 0.5)))
+
+def _sis_series(w, y, n_max = 2000):
+    '''SIS amplification factor from the series of F_sis_mpmath, in double precision.
+
+    Summing over n first, sum_n Gamma(1 + n/2) u^n / n! 1F1(1 + n/2; 1; z) = sum_k S_k z^k / (k!)^2 with
+    u = sqrt(-2 i w), z = -i w y^2 / 2 and S_k = 2 int_0^inf s^(2k+1) exp(-s^2 + u s) ds, which follow from
+    the Faddeeva function and a two term recurrence.
+
+    Return
+    ----------
+    F_val : array, complex
+    err : array
+        estimated rounding error, eps * (largest term) (cancellation between the terms)
+    '''
+    u = np.sqrt(2 * w) * np.exp(-1j * np.pi / 4)
+    z = -1j * w * y**2 / 2
+
+    # J_m = int_0^inf s^m exp(-s^2 + u s) ds, J_(m+1) = m / 2 J_(m-1) + u / 2 J_m
+    J_prev = np.sqrt(np.pi) / 2 * sc.wofz(-1j * u / 2)
+    J_m = 0.5 + u / 2 * J_prev
+    m = 1
+
+    z_k = np.ones(w.shape, dtype = np.complex128)
+    series_sum = 2 * J_m
+    largest = np.abs(series_sum)
+    active = np.ones(w.shape, dtype = bool)
+    with np.errstate(over = 'ignore', invalid = 'ignore', under = 'ignore'):
+        for k in range(1, n_max):
+            for _ in range(2):
+                J_prev, J_m = J_m, m / 2 * J_prev + u / 2 * J_m
+                m += 1
+            z_k = z_k * z / k**2
+            term = np.where(active, 2 * J_m * z_k, 0)
+            series_sum += term
+            largest = np.maximum(largest, np.abs(term))
+            # J_m grows like Gamma(m / 2), stop summing converged w before it overflows
+            if k > 2:
+                active &= np.abs(term) > 1e-17 * np.abs(series_sum)
+                if not np.any(active):
+                    break
+
+    err = np.where(np.isfinite(series_sum), np.finfo(float).eps * np.sqrt(k + 1) * largest, np.inf)
+
+    return _sis_prefactor(w, y) * series_sum, err
+
+def _sis_ring(w, y, n_theta):
+    '''(2 / pi) int_0^pi J(c(theta)) dtheta with the trapezoidal rule on n_theta points of the full circle,
+    where J(c) = int_0^inf s exp(-s^2 + c s) ds and c(theta) = sqrt(-2 i w) (1 + y cos(theta)).
+
+    This is the series of _sis_series resummed exactly (the sum over k gives a Bessel function I_0, whose
+    integral representation is the theta integral). The integrand is periodic and analytic, so the rule
+    converges exponentially once n_theta resolves its phase, w (1 + y cos(theta))^2 / 2.
+
+    Return
+    ----------
+    ring, ring_half : array, complex
+        with n_theta and n_theta / 2 points (error estimate)
+    '''
+    theta = 2 * np.pi * np.arange(n_theta) / n_theta
+    c = np.sqrt(2 * w)[:, None] * np.exp(-1j * np.pi / 4) * (1 + y * np.cos(theta))
+    J = 0.5 + c * np.sqrt(np.pi) / 4 * sc.wofz(-1j * c / 2)
+
+    return 2 * np.mean(J, axis = 1), 2 * np.mean(J[:, ::2], axis = 1)
+
+def _sis_quadrature(w, y, tol, max_elements = 2**22):
+    '''SIS amplification factor from the theta integral (see _sis_ring), valid for any w and y.
+
+    Return
+    ----------
+    F_val : array, complex
+    err : array
+        difference with half the points
+    '''
+    F_val = np.zeros(w.shape, dtype = np.complex128)
+    err = np.full(w.shape, np.inf)
+
+    # the phase of the integrand changes by ~ w y (1 + y) around the circle
+    n_theta = 2**np.ceil(np.log2(4 * w * y * (1 + y) + 64)).astype(int)
+    todo = np.ones(w.shape, dtype = bool)
+    while np.any(todo):
+        for n_val in np.unique(n_theta[todo]):
+            idx = np.flatnonzero(todo & (n_theta == n_val))
+            for chunk in np.array_split(idx, max(1, len(idx) * n_val // max_elements)):
+                ring, ring_half = _sis_ring(w[chunk], y, n_val)
+                F_val[chunk] = _sis_prefactor(w[chunk], y) * ring
+                err[chunk] = np.abs(ring - ring_half)
+
+        # the difference with half the points is pessimistic, refine only where it is above tol
+        todo &= err >= tol
+        n_theta[todo] *= 2
+        todo &= n_theta <= 2**20
+
+    return F_val, err
+
+def _dpsi_sis(r, n):
+    '''radial derivatives of the SIS potential psi = r.
+    '''
+    return [1.] + [0.] * (n - 1)
+
+@lru_cache(maxsize = 64)
+def _sis_images(y, order):
+    '''images of the SIS lens (two for y < 1) with their 1 / w expansions (see quasi_geometric.py)
+    '''
+    images = []
+    for x_image in [y + 1] + ([y - 1] if y < 1 else []):
+        phi_image = (x_image - y)**2 / 2 - np.abs(x_image)
+        images.append((x_image, phi_image) + quasi_geometric.image_expansion(x_image, y, _dpsi_sis, order = order))
+
+    return tuple(images)
+
+def _sis_cusp_coeffs(y, order):
+    '''coefficients of the contribution of the centre of the SIS (where psi = |x| is not smooth).
+
+    Near x = 0 the Fermat potential is y^2 / 2 - x.y - |x| + |x|^2 / 2. Expanding exp(i w |x|^2 / 2) and
+    integrating each (homogeneous) term in polar coordinates, the centre contributes
+    exp(i w (y^2 / 2 - phi_m)) sum_j d_j / w^(j + 1) with
+
+        d_j = (2j + 1)! / (j! 2^j) / (2 pi i) i^(-j-2) int_0^2pi dtheta (1 + y cos(theta) - i0)^(-2j-2)
+
+    and int_0^2pi dtheta (1 + y cos(theta))^(-m) = 2 pi (1 - y^2)^(-m/2) P_(m-1)(1 / sqrt(1 - y^2)), continued to
+    y > 1 with sqrt(1 - y^2) -> -i sqrt(y^2 - 1).
+    '''
+    root = np.sqrt(1 - y**2) if y < 1 else -1j * np.sqrt(y**2 - 1)
+
+    d = np.zeros(order + 1, dtype = np.complex128)
+    for j in range(order + 1):
+        m = 2 * j + 2
+        ring_integral = 2 * np.pi * root**(-m) * sc.eval_legendre(m - 1, 1 / root)
+        d[j] = factorial(2 * j + 1) / (factorial(j) * 2**j) / (2j * np.pi) * 1j**(-j - 2) * ring_integral
+
+    return d
+
+def F_sis_asymptotic(w, y, order = 6):
+    '''SIS amplification factor for large w: quasi geometrical optics for the images plus the diffraction by
+    the centre of the lens, each series truncated at its smallest term. Not valid close to y = 1, where the
+    second image merges with the centre.
+
+    Return
+    ----------
+    F_val : array, complex
+    err : array
+        error estimate, ten times the last terms kept
+    '''
+    w = np.asarray(w, dtype = float)
+    if np.abs(y - 1) < 1e-3:
+        return np.full(w.shape, np.nan, dtype = np.complex128), np.full(w.shape, np.inf)
+
+    images = _sis_images(float(y), order)
+    phi_m = images[0][1]
+
+    F_val = np.zeros(w.shape, dtype = np.complex128)
+    err = np.full(w.shape, np.inf)
+    for k in range(1, order + 1):
+        F_k, last = quasi_geometric.F_images(w, y, images, phi_m, order = k)
+        better = last < err
+        F_val[better] = F_k[better]
+        err[better] = last[better]
+
+    d = _sis_cusp_coeffs(float(y), order)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        cusp_terms = d[:, None] / w[None, :]**(np.arange(order + 1)[:, None] + 1)
+    # truncate before the smallest term
+    j_min = np.argmin(np.abs(cusp_terms), axis = 0)
+    keep = np.arange(order + 1)[:, None] < j_min[None, :]
+    cusp = np.sum(np.where(keep, cusp_terms, 0), axis = 0)
+    F_val = F_val + np.exp(1j * w * (y**2 / 2 - phi_m)) * cusp
+    err = err + np.abs(cusp_terms[j_min, np.arange(len(w))])
+
+    return F_val, 10 * err
+
+def F_sis_w(w, y, tol = TOL, return_method = False, verify = 0):
+    '''SIS amplification factor on an array of dimensionless frequencies, in double precision.
+
+    Every w is evaluated with the series (small w, where the cancellation between its terms is below tol),
+    the asymptotic expansion (large w, where its truncation error is below tol) or else the theta integral
+    that the series resums to, refined until it converges (any w, the cost grows with w y (1 + y)).
+
+    Parameters
+    ----------
+    w : array
+        dimensionless frequency 8 pi M_lz f
+    y : float
+        source position
+    tol : float
+        target absolute accuracy
+    return_method : bool
+        also return the method used for each w ('series', 'asymptotic' or 'quadrature')
+    verify : int
+        number of w (evenly spread over the array) checked against F_sis_mpmath, with enough digits for the
+        cancellation of its series. A warning is raised if they differ by more than tol.
+
+    Return
+    ----------
+    F_val : array, complex
+    '''
+    shape = np.shape(w)
+    w = np.atleast_1d(np.asarray(w, dtype = float)).ravel()
+    F_val = np.ones(w.shape, dtype = np.complex128)
+    method = np.full(w.shape, 'series', dtype = object)
+    todo = w > 0
+
+    # series, only tried where the cancellation between its terms can be below tol
+    try_series = todo & (w * (y**2 / 2 + y) < 40)
+    if np.any(try_series):
+        F_ser, err = _sis_series(w[try_series], y)
+        good = err < tol
+        idx = np.flatnonzero(try_series)[good]
+        F_val[idx] = F_ser[good]
+        todo[idx] = False
+
+    if np.any(todo):
+        F_asym, err = F_sis_asymptotic(w[todo], y)
+        good = err < tol
+        idx = np.flatnonzero(todo)[good]
+        F_val[idx] = F_asym[good]
+        method[idx] = 'asymptotic'
+        todo[idx] = False
+
+    if np.any(todo):
+        idx = np.flatnonzero(todo)
+        F_val[idx], _ = _sis_quadrature(w[idx], y, tol)
+        method[idx] = 'quadrature'
+
+    if verify:
+        check = np.unique(np.linspace(0, len(w) - 1, min(verify, len(w))).astype(int))
+        check = check[w[check] > 0]
+        F_mp = F_sis_mpmath_grid(w[check], y)
+        diff = np.abs(F_val[check] - F_mp)
+        if np.any(diff > tol):
+            i = check[np.argmax(diff)]
+            warnings.warn(f"F_sis differs from F_sis_mpmath by {np.max(diff):.2e} > tol = {tol:.1e} "
+                          f"(worst at w = {w[i]:.4g}, y = {y}, method {method[i]})")
+
+    if return_method:
+        return F_val.reshape(shape), method.reshape(shape)
+
+    return F_val.reshape(shape)
+
+def F_sis(f, M_lz, y, tol = TOL, verify = 0):
+    '''SIS amplification factor (wave optics) on a frequency array, in double precision (see F_sis_w).
+    F_sis_mpmath is the reference implementation.
+
+    Parameters
+    ----------
+    f : array
+        frequency
+    M_lz : float
+        redshifted lens mass (in seconds)
+    y : float
+        source position
+    tol : float
+        target absolute accuracy
+    verify : int
+        number of frequencies checked against F_sis_mpmath
+
+    Return
+    ----------
+    F_val : array, complex
+    '''
+    w = 8 * np.pi * M_lz * np.asarray(f, dtype = float)
+
+    return F_sis_w(w, y, tol = tol, verify = verify)
+
+def F_sie(f, mu, td):
+    '''four image SIE amplification factor in the geometrical optics limit (same as F_source_sie).
+
+    Parameters
+    ----------
+    f : array
+        frequency
+    mu : array
+        magnifications (mu_1, mu_2, mu_3, mu_4) of one row of the flux tables
+    td : array
+        time delays (td_1, td_2, td_3, td_4) in seconds
+
+    Return
+    ----------
+    F_val : array, complex
+    '''
+    f = np.asarray(f, dtype = float)
+    mu = np.asarray(mu, dtype = float)
+    td = np.asarray(td, dtype = float)
+
+    # one image case
+    if len(set(mu)) == 2:
+        return np.ones(f.shape, dtype = np.complex128)
+
+    morse = np.array([1, 1, -1j, -1j])
+    F_val = np.sum(morse[:, None] * np.sqrt(np.abs(mu))[:, None] * np.exp(2 * np.pi * 1j * np.outer(td, f)), axis = 0)
+
+    return F_val
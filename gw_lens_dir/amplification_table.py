@@ -0,0 +1,456 @@
+"""
+Tabulated amplification factors F(w, y) of the point mass and SIS lenses.
+
+F only depends on the dimensionless frequency w = 8 pi M_lz f and the source position y, so instead of summing
+the series at every frequency of every run, F is tabulated once on a (log w, y) grid, saved to disk and
+interpolated with bicubic splines at query time. The exact values (table nodes, error checks and points outside
+the table) come from the double precision amplification.F_pm_w / F_sis_w.
+
+F itself oscillates in w and in y through the interference of the two images, exp(i w T(y)), and so do its
+amplitude and phase: near the minima of |F| the phase is not even smooth. What is tabulated instead is the
+diffraction residual D = F - F_go, where F_go = sqrt(mu_plus) - i sqrt(mu_minus) exp(i w T(y)) is the geometrical
+optics limit (single image for the SIS with y > 1). The residual is smooth at small w and O(1 / w) at large w,
+so its real and imaginary parts interpolate well; F_go is added back analytically at query time.
+
+The residual still oscillates in y with a period ~ 1 / w at large w, so the w range is split into bands (one
+per decade) with their own nodes, and only the bands at large w get a fine y grid.
+
+Error: while a band is built, F is evaluated at the midpoints of every interval of both axes and at every cell
+centre (the points furthest away from the nodes), the intervals where the error is above tol are split, and
+the band is rebuilt until it is below tol everywhere on the midpoints. The largest error on the midpoints of
+the final nodes is stored with the table as max_abs_err; it is an estimate of the error between the nodes,
+not a strict bound. Around y = 1 the second image of the SIS disappears and sqrt(mu_minus) has a square root
+kink that splines do not converge on, so 0.98 < y < 1.02 (Y_GAP) is left out of the SIS table and evaluated
+exactly.
+
+The tables of both lenses are committed in tables/, both with max_abs_err below tol = 1e-4. They are (re)built with
+
+    python -m gw_lens_dir.amplification_table sis --tol 1e-4
+
+and are never built from library code: a missing table raises instead of starting a long build in every
+worker of a sweep. build_table warns when a band stops at max_rounds / max_nodes with its error still above tol.
+The default max_rounds = 8 is not enough for the SIS: its 10 < w < 100, y < 0.98 band has midpoints just above
+1e-4 that one split barely lowers, and the committed table continued the refinement of the default build for 4
+more rounds, with that band split down to 9e-5.
+"""
+
+import os
+import argparse
+import tempfile
+import warnings
+import numpy as np
+from multiprocessing import Pool
+from scipy.interpolate import RectBivariateSpline
+from gw_lens_dir import amplification
+
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables')
+
+# accuracy of the exact path, the double precision F_pm_w / F_sis_w are within ~1e-12 of the mpmath
+# reference implementations at this tolerance
+EXACT_TOL = 1e-10
+
+def _exact_pm(w_arr, y):
+
+    return amplification.F_pm_w(w_arr, y, tol = EXACT_TOL)
+
+def _exact_sis(w_arr, y):
+
+    return amplification.F_sis_w(w_arr, y, tol = EXACT_TOL)
+
+# exact F(w, y) on an array of w at one y
+_exact = {'pm': _exact_pm, 'sis': _exact_sis}
+
+# y left out of the tables: sqrt(mu_minus) of the SIS, and so the residual, has a square root kink at y = 1
+Y_GAP = {'sis': (0.98, 1.02)}
+
+def table_path(lens):
+
+    return os.path.join(TABLE_DIR, f'F_{lens}.npz')
+
+def F_go(lens, w, y):
+    '''geometrical optics limit of F(w, y), continuous in y (the residual F - F_go is what is tabulated).
+    '''
+    w, y = np.broadcast_arrays(np.asarray(w, dtype = float), np.asarray(y, dtype = float))
+    _, mu_plus, mu_minus = amplification.mag(y, lens = lens)
+    if lens == 'sis':
+        # the second image disappears at y = 1
+        mu_minus = np.where(y <= 1, mu_minus, 0.)
+    # 2 pi f td with f = w / (8 pi M_lz) and td proportional to M_lz
+    phase = w * amplification.time_del(1., y, lens = lens) / 4
+
+    return np.sqrt(mu_plus) - 1j * np.sqrt(mu_minus) * np.exp(1j * phase)
+
+def F_go_grad(lens, w, y):
+    '''F_go and its derivatives with respect to log w and y.
+    '''
+    w, y = np.broadcast_arrays(np.asarray(w, dtype = float), np.asarray(y, dtype = float))
+    _, mu_plus, mu_minus = amplification.mag(y, lens = lens)
+    if lens == 'pm':
+        s = np.sqrt(y**2 + 4)
+        # mu_pm = 1/2 +- g, g = (y^2 + 2) / (2 y s) > 1/2
+        g = (y**2 + 2) / (2 * y * s)
+        dmu_plus = g * (2 * y / (y**2 + 2) - 1 / y - y / s**2)
+        dmu_minus = dmu_plus
+        dT = 4 * (s / 2 + y**2 / (2 * s) + 2 / s)
+    else:
+        dmu_plus = -1 / y**2
+        dmu_minus = np.where(y <= 1, -1 / y**2, 0.)
+        mu_minus = np.where(y <= 1, mu_minus, 0.)
+        dT = 8.
+    phase = w * amplification.time_del(1., y, lens = lens) / 4
+    image = np.sqrt(mu_minus) * np.exp(1j * phase)
+
+    F_val = np.sqrt(mu_plus) - 1j * image
+    dF_dlogw = image * phase
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        dimage = np.where(mu_minus > 0, dmu_minus / (2 * np.sqrt(mu_minus)), 0.) * np.exp(1j * phase) + 1j * image * w * dT / 4
+    dF_dy = dmu_plus / (2 * np.sqrt(mu_plus)) - 1j * dimage
+
+    return F_val, dF_dlogw, dF_dy
+
+def _exact_star(args):
+
+    lens, w_arr, y = args
+    return _exact[lens](w_arr, y)
+
+def exact_F(lens, w, y, n_proc = 1):
+    '''exact amplification factor on arrays of (w, y) points.
+
+    Parameters
+    ----------
+    lens : str
+        'pm' or 'sis'
+    w, y : array
+        dimensionless frequencies and source positions (broadcast against each other)
+    n_proc : int
+        number of processes
+
+    Return
+    ----------
+    F_val : array, complex
+    '''
+    w, y = np.broadcast_arrays(np.asarray(w, dtype = float), np.asarray(y, dtype = float))
+    w_flat, y_flat = w.ravel(), y.ravel()
+
+    # one task per source position, so the series tables of each y are built once
+    y_unique, inverse = np.unique(y_flat, return_inverse = True)
+    groups = [np.flatnonzero(inverse == i) for i in range(len(y_unique))]
+    tasks = [(lens, w_flat[idx], y_val) for idx, y_val in zip(groups, y_unique)]
+
+    if n_proc > 1:
+        with Pool(n_proc) as pool:
+            F_groups = pool.map(_exact_star, tasks)
+    else:
+        F_groups = [_exact_star(task) for task in tasks]
+
+    F_val = np.empty(w_flat.shape, dtype = np.complex128)
+    for idx, F_group in zip(groups, F_groups):
+        F_val[idx] = F_group
+
+    return F_val.reshape(w.shape)
+
+def exact_grid(lens, log_w_arr, y_arr, n_proc = 1):
+    '''exact F on the (log w, y) grid given by the two axes, shape (len(log_w_arr), len(y_arr)).
+    '''
+    log_w_mesh, y_mesh = np.meshgrid(log_w_arr, y_arr, indexing = 'ij')
+
+    return exact_F(lens, np.exp(log_w_mesh), y_mesh, n_proc = n_proc)
+
+def refine_band(lens, log_w_arr, y_arr, tol = 1e-4, max_rounds = 8, max_nodes = 2000, n_proc = 1):
+    '''nodes of one band of the table, refined until the interpolation error on the midpoints is below tol.
+
+    The error is measured at the midpoints between two w nodes (on the y nodes), between two y nodes (on the w
+    nodes) and at the cell centres. Every interval with a midpoint above tol is split in two (the exact values
+    at the midpoints become the new nodes), until no midpoint is above tol, after max_rounds refinements or
+    when an axis would get more than max_nodes nodes.
+
+    Return
+    ----------
+    log_w_arr, y_arr : array
+        nodes of the band
+    residual : array, complex
+        F - F_go on the nodes
+    max_abs_err : float
+        largest |F_table - F_exact| on the midpoints of the final nodes
+    '''
+    F_nodes = exact_grid(lens, log_w_arr, y_arr, n_proc = n_proc)
+    for n_round in range(max_rounds + 1):
+        log_w_mesh, y_mesh = np.meshgrid(log_w_arr, y_arr, indexing = 'ij')
+        residual = F_nodes - F_go(lens, np.exp(log_w_mesh), y_mesh)
+        band = amp_fact_table.from_bands(lens, [(log_w_arr, y_arr, residual)])
+
+        log_w_mid = 0.5 * (log_w_arr[1:] + log_w_arr[:-1])
+        y_mid = 0.5 * (y_arr[1:] + y_arr[:-1])
+        F_w_mid = exact_grid(lens, log_w_mid, y_arr, n_proc = n_proc)
+        F_y_mid = exact_grid(lens, log_w_arr, y_mid, n_proc = n_proc)
+        F_centre = exact_grid(lens, log_w_mid, y_mid, n_proc = n_proc)
+        err_w = np.abs(band.F_grid(log_w_mid, y_arr) - F_w_mid)
+        err_y = np.abs(band.F_grid(log_w_arr, y_mid) - F_y_mid)
+        err_centre = np.abs(band.F_grid(log_w_mid, y_mid) - F_centre)
+        max_abs_err = float(max(np.max(err_w), np.max(err_y), np.max(err_centre)))
+
+        # every axis is split where its own midpoints are off, the cell centres only when neither axis is
+        split_w = np.max(err_w, axis = 1) > tol
+        split_y = np.max(err_y, axis = 0) > tol
+        if not np.any(split_w) and not np.any(split_y):
+            split_w = np.max(err_centre, axis = 1) > tol
+            split_y = np.max(err_centre, axis = 0) > tol
+        if (max_abs_err <= tol or n_round == max_rounds or len(log_w_arr) + np.sum(split_w) > max_nodes
+                or len(y_arr) + np.sum(split_y) > max_nodes):
+            break
+
+        # interleave the midpoints with the nodes and keep the ones of the split intervals
+        F_full = np.empty((2 * len(log_w_arr) - 1, 2 * len(y_arr) - 1), dtype = np.complex128)
+        F_full[::2, ::2], F_full[1::2, ::2], F_full[::2, 1::2], F_full[1::2, 1::2] = F_nodes, F_w_mid, F_y_mid, F_centre
+        keep_w = np.ones(2 * len(log_w_arr) - 1, dtype = bool)
+        keep_w[1::2] = split_w
+        keep_y = np.ones(2 * len(y_arr) - 1, dtype = bool)
+        keep_y[1::2] = split_y
+
+        log_w_arr = np.insert(log_w_arr, np.arange(1, len(log_w_arr)), log_w_mid)[keep_w]
+        y_arr = np.insert(y_arr, np.arange(1, len(y_arr)), y_mid)[keep_y]
+        F_nodes = F_full[keep_w][:, keep_y]
+
+    return log_w_arr, y_arr, residual, max_abs_err
+
+def build_table(lens, w_range = (1e-2, 1e2), y_range = (0.05, 3), y_gap = None, n_bands = None, n_w = 20, n_y = 40,
+                tol = 1e-4, max_rounds = 8, max_nodes = 2000, n_proc = 1, path = None):
+    '''tabulates the diffraction residual F - F_go on (log w, y) grids refined until the interpolation error
+    is below tol (refine_band), and saves it to disk.
+
+    The residual oscillates in y with a period ~ 1 / w, so the w range is split into bands (one per decade by
+    default) with their own nodes, and only the bands at large w get a fine y grid. The y range is also split
+    around y_gap, which is left to the exact F.
+
+    Parameters
+    ----------
+    lens : str
+        'pm' or 'sis'
+    w_range, y_range : tuple
+        extent of the table
+    y_gap : tuple
+        y interval evaluated exactly instead (defaults to Y_GAP[lens], () for none)
+    n_bands : int
+        number of bands of equal width in log w
+    n_w, n_y : int
+        initial resolution of every band (log spaced in w, linearly spaced in y)
+    tol : float
+        target absolute error of F
+    max_rounds, max_nodes : int
+        largest number of refinements and of nodes along each axis of a band
+    n_proc : int
+        number of processes used for the exact evaluations
+    path : str
+        where to save the table (defaults to tables/F_<lens>.npz)
+
+    Return
+    ----------
+    table : amp_fact_table
+        table.max_abs_err is the largest error on the midpoints of the final nodes of all the bands
+    '''
+    path = table_path(lens) if path is None else path
+    if n_bands is None:
+        n_bands = max(1, int(np.ceil(np.log10(w_range[1] / w_range[0]) - 1e-9)))
+    log_w_edges = np.linspace(np.log(w_range[0]), np.log(w_range[1]), n_bands + 1)
+    y_gap = Y_GAP.get(lens, ()) if y_gap is None else y_gap
+    y_pieces = [y_range]
+    if len(y_gap) and y_range[0] < y_gap[0] and y_gap[1] < y_range[1]:
+        y_pieces = [(y_range[0], y_gap[0]), (y_gap[1], y_range[1])]
+
+    bands, errs = [], []
+    for log_w_lo, log_w_hi in zip(log_w_edges[:-1], log_w_edges[1:]):
+        for y_lo, y_hi in y_pieces:
+            log_w_arr, y_arr, residual, max_abs_err = refine_band(lens, np.linspace(log_w_lo, log_w_hi, n_w),
+                                                                  np.linspace(y_lo, y_hi, n_y), tol = tol,
+                                                                  max_rounds = max_rounds, max_nodes = max_nodes,
+                                                                  n_proc = n_proc)
+            bands.append((log_w_arr, y_arr, residual))
+            errs.append(max_abs_err)
+
+    table = amp_fact_table.from_bands(lens, bands)
+    table.max_abs_err = float(max(errs))
+    if table.max_abs_err > tol:
+        warnings.warn(f"the {lens} table reached max_rounds / max_nodes with an error of {table.max_abs_err:.2e} "
+                      f"> tol = {tol:.1e}")
+
+    arrays = {}
+    for i, (log_w_arr, y_arr, residual) in enumerate(bands):
+        arrays.update({f'log_w_{i}': log_w_arr, f'y_{i}': y_arr, f'residual_{i}': residual})
+    # write then rename, so a process loading the table never sees a partial file
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok = True)
+    fd, tmp = tempfile.mkstemp(dir = directory, suffix = '.tmp')
+    with os.fdopen(fd, 'wb') as fh:
+        np.savez(fh, lens = lens, n_bands = len(bands), max_abs_err = table.max_abs_err, tol = tol, **arrays)
+    # mkstemp creates the file private to its owner, the table is read by every user of the package
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+    table.path = path
+
+    return table
+
+
+class amp_fact_table():
+    """ Amplification factor interpolated from a table built by build_table()
+    """
+
+    def __init__(self, lens, path = None):
+
+        self.path = table_path(lens) if path is None else path
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"no table at {self.path}, build it with "
+                                    f"python -m gw_lens_dir.amplification_table {lens}")
+
+        data = np.load(self.path)
+        bands = [(data[f'log_w_{i}'], data[f'y_{i}'], data[f'residual_{i}']) for i in range(int(data['n_bands']))]
+        self._setup(str(data['lens']), bands)
+        self.max_abs_err = float(data['max_abs_err'])
+
+    @classmethod
+    def from_bands(cls, lens, bands):
+
+        table = cls.__new__(cls)
+        table.path = None
+        table.max_abs_err = np.nan
+        table._setup(lens, bands)
+
+        return table
+
+    def _setup(self, lens, bands):
+
+        self.lens = lens
+        self.bands = bands
+        self.splines = [(RectBivariateSpline(log_w_arr, y_arr, residual.real),
+                         RectBivariateSpline(log_w_arr, y_arr, residual.imag)) for log_w_arr, y_arr, residual in bands]
+
+    def locate(self, w, y):
+        '''band of every (w, y) point, -1 outside the table.
+        '''
+        log_w = np.log(w)
+        band = np.full(np.shape(w), -1)
+        for i, (log_w_arr, y_arr, _) in enumerate(self.bands):
+            band[(band < 0) & (log_w >= log_w_arr[0]) & (log_w <= log_w_arr[-1]) & (y >= y_arr[0]) & (y <= y_arr[-1])] = i
+
+        return band
+
+    def residual(self, log_w, y, band, dx = 0, dy = 0):
+        '''interpolated F - F_go (or its derivatives) at points of one band.
+        '''
+        real_spline, imag_spline = self.splines[band]
+
+        return real_spline.ev(log_w, y, dx = dx, dy = dy) + 1j * imag_spline.ev(log_w, y, dx = dx, dy = dy)
+
+    def F_grid(self, log_w_arr, y_arr):
+        '''amplification factor on the (log w, y) grid given by the two axes, of a single band table.
+        '''
+        real_spline, imag_spline = self.splines[0]
+        log_w_mesh, y_mesh = np.meshgrid(log_w_arr, y_arr, indexing = 'ij')
+
+        return real_spline(log_w_arr, y_arr) + 1j * imag_spline(log_w_arr, y_arr) + F_go(self.lens, np.exp(log_w_mesh), y_mesh)
+
+    def F_w(self, w, y):
+        '''amplification factor at dimensionless frequencies w and source positions y (broadcast).
+        '''
+        w, y = np.broadcast_arrays(np.asarray(w, dtype = float), np.asarray(y, dtype = float))
+        F_val = np.empty(w.shape, dtype = np.complex128)
+        band = self.locate(w, y)
+
+        for i in range(len(self.bands)):
+            sel = band == i
+            if np.any(sel):
+                F_val[sel] = self.residual(np.log(w[sel]), y[sel], i) + F_go(self.lens, w[sel], y[sel])
+
+        outside = band < 0
+        if np.any(outside):
+            F_val[outside] = exact_F(self.lens, w[outside], y[outside])
+
+        return F_val
+
+    def F_w_grad(self, w, y, rel_step = 1e-5):
+        '''amplification factor and its derivatives with respect to log w and y, from the derivatives of the
+        splines. Outside the table they are central differences of the exact F (relative step rel_step, the
+        exact F is accurate to ~EXACT_TOL).
+        '''
+        w, y = np.broadcast_arrays(np.asarray(w, dtype = float), np.asarray(y, dtype = float))
+        F_val = np.empty(w.shape, dtype = np.complex128)
+        dF_dlogw = np.empty(w.shape, dtype = np.complex128)
+        dF_dy = np.empty(w.shape, dtype = np.complex128)
+        band = self.locate(w, y)
+
+        for i in range(len(self.bands)):
+            sel = band == i
+            if np.any(sel):
+                log_w_in, y_in = np.log(w[sel]), y[sel]
+                F_go_val, dF_go_dlogw, dF_go_dy = F_go_grad(self.lens, w[sel], y_in)
+                F_val[sel] = self.residual(log_w_in, y_in, i) + F_go_val
+                dF_dlogw[sel] = self.residual(log_w_in, y_in, i, dx = 1) + dF_go_dlogw
+                dF_dy[sel] = self.residual(log_w_in, y_in, i, dy = 1) + dF_go_dy
+
+        outside = band < 0
+        if np.any(outside):
+            w_out, y_out = w[outside], y[outside]
+            F_val[outside] = exact_F(self.lens, w_out, y_out)
+            dF_dlogw[outside] = (exact_F(self.lens, w_out * (1 + rel_step), y_out)
+                                 - exact_F(self.lens, w_out * (1 - rel_step), y_out)) / (np.log1p(rel_step) - np.log1p(-rel_step))
+            dy = rel_step * y_out
+            dF_dy[outside] = (exact_F(self.lens, w_out, y_out + dy) - exact_F(self.lens, w_out, y_out - dy)) / (2 * dy)
+
+        return F_val, dF_dlogw, dF_dy
+
+    def __call__(self, f, M_lz, y):
+        '''amplification factor on a frequency array (same signature as amplification.F_pm / F_sis).
+        '''
+        w = 8 * np.pi * M_lz * np.asarray(f, dtype = float)
+
+        return self.F_w(w, y)
+
+
+_tables = {}
+
+def F_table(f, M_lz, y, lens = 'sis'):
+    '''amplification factor from the table on disk (loaded once per lens).
+
+    Parameters
+    ----------
+    f : array
+        frequency
+    M_lz : float
+        redshifted lens mass (in seconds)
+    y : float
+        source position
+    lens : str
+        'pm' or 'sis'
+
+    Return
+    ----------
+    F_val : array, complex
+    '''
+    if lens not in _tables:
+        _tables[lens] = amp_fact_table(lens)
+
+    return _tables[lens](f, M_lz, y)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = 'build the F(w, y) table of a lens')
+    parser.add_argument('lens', choices = ['pm', 'sis'])
+    parser.add_argument('--w_min', type = float, default = 1e-2)
+    parser.add_argument('--w_max', type = float, default = 1e2)
+    parser.add_argument('--y_min', type = float, default = 0.05)
+    parser.add_argument('--y_max', type = float, default = 3)
+    parser.add_argument('--y_gap', type = float, nargs = 2, default = None)
+    parser.add_argument('--n_bands', type = int, default = None)
+    parser.add_argument('--n_w', type = int, default = 20)
+    parser.add_argument('--n_y', type = int, default = 40)
+    parser.add_argument('--tol', type = float, default = 1e-4)
+    parser.add_argument('--max_rounds', type = int, default = 8)
+    parser.add_argument('--max_nodes', type = int, default = 2000)
+    parser.add_argument('--n_proc', type = int, default = os.cpu_count())
+    args = parser.parse_args()
+
+    table = build_table(args.lens, w_range = (args.w_min, args.w_max), y_range = (args.y_min, args.y_max),
+                        y_gap = args.y_gap, n_bands = args.n_bands, n_w = args.n_w, n_y = args.n_y, tol = args.tol,
+                        max_rounds = args.max_rounds, max_nodes = args.max_nodes, n_proc = args.n_proc)
+    nodes = ', '.join(f'{len(log_w_arr)} x {len(y_arr)}' for log_w_arr, y_arr, _ in table.bands)
+    print(f'saved {table.path}: bands of {nodes} nodes, max |F_table - F_exact| on the midpoints = {table.max_abs_err:.2e}')
@@ -0,0 +1,128 @@
+"""
+Filon quadrature of oscillatory integrals with a known linear phase,
+
+    G(tau) = int_a^b g(f) exp(2 pi i f tau) df,
+
+for a smooth (non oscillating) g, as they appear in the cross terms between the images of a geometrical optics
+lens: g is 4 |h|^2 / Sn or 4 h_source conj(h_temp) / Sn and tau a difference of time delays, which for the SIE
+tables reaches days (10^7 oscillations across the band).
+
+g is expanded once in Legendre polynomials on adaptive panels, g(f) = sum_n c_n P_n(t) with t in [-1, 1] on
+each panel, and the oscillatory factor is integrated exactly with
+
+    int_-1^1 P_n(t) exp(i kappa t) dt = 2 i^n j_n(kappa),
+
+j_n the spherical Bessel functions. The panels only have to resolve g, so the cost of G(tau) does not depend on
+tau, and the same expansion serves every delay.
+
+Integrating by parts, |G(tau)| <= V / (2 pi |tau|) with V = |g(a)| + |g(b)| + int |g'| df. Beyond the delay at
+which this bound drops below tol * int |g| df the cross term is not resolvable and G is set to zero: the images
+add incoherently.
+"""
+
+import numpy as np
+from functools import lru_cache
+from scipy.special import spherical_jn, eval_legendre
+
+@lru_cache(maxsize = 16)
+def legendre_transform(order):
+    '''Gauss-Legendre nodes on [-1, 1] and the matrix taking the values of g at the nodes to its Legendre
+    coefficients (exact for polynomials of degree < order).
+    '''
+    x, w = np.polynomial.legendre.leggauss(order)
+    n = np.arange(order)
+    T = (2 * n[:, None] + 1) / 2 * w[None, :] * eval_legendre(n[:, None], x[None, :])
+
+    return x, T
+
+class legendre_panels():
+    """ Piecewise Legendre expansion of a smooth function on adaptive panels
+    """
+
+    def __init__(self, func, a, b, order = 16, rtol = 1e-12, n_panels = 8, max_panels = 4096):
+        '''
+        Parameters
+        ----------
+        func : callable
+            func(f) evaluates g on a frequency array
+        a, b : float
+            interval
+        order : int
+            number of Legendre coefficients per panel
+        rtol : float
+            a panel is accepted once its last two coefficients are below rtol * max |g|
+        n_panels : int
+            number of panels to start with
+        max_panels : int
+            refinement stops once this many panels are active
+        '''
+        x, T = legendre_transform(order)
+        edges = np.linspace(a, b, n_panels + 1)
+        left, right = edges[:-1], edges[1:]
+
+        lefts, rights, coeffs = [], [], []
+        scale = 0.
+        while len(left) > 0:
+            f = ((left + right)[:, None] + (right - left)[:, None] * x[None, :]) / 2
+            values = np.asarray(func(f.ravel())).reshape(f.shape)
+            c = values @ T.T
+            scale = max(scale, np.max(np.abs(values)))
+
+            tail = np.max(np.abs(c[:, -2:]), axis = 1)
+            done = tail <= rtol * scale
+            if 2 * np.count_nonzero(~done) > max_panels:
+                done[:] = True
+            lefts.append(left[done])
+            rights.append(right[done])
+            coeffs.append(c[done])
+
+            middle = (left + right) / 2
+            keep = ~done
+            left, right = np.concatenate([left[keep], middle[keep]]), np.concatenate([middle[keep], right[keep]])
+
+        order_panels = np.argsort(np.concatenate(lefts))
+        self.left = np.concatenate(lefts)[order_panels]
+        self.right = np.concatenate(rights)[order_panels]
+        self.coeffs = np.concatenate(coeffs)[order_panels]
+
+        # total variation of g from the expansions on a fine sampling of every panel (ends included)
+        n = np.arange(order)
+        t = np.linspace(-1, 1, 2 * order)
+        values = (self.coeffs @ eval_legendre(n[:, None], t[None, :])).ravel()
+        self.variation = np.abs(values[0]) + np.abs(values[-1]) + np.sum(np.abs(np.diff(values)))
+        self.abs_integral = np.sum(np.abs(self.coeffs[:, 0]) * (self.right - self.left))
+
+    def integral(self, tau):
+        '''G(tau) = int g(f) exp(2 pi i f tau) df, for an array of tau.
+        '''
+        tau = np.asarray(tau, dtype = float)
+        omega = 2 * np.pi * tau.ravel()
+        half = (self.right - self.left) / 2
+        mid = (self.right + self.left) / 2
+        n = np.arange(self.coeffs.shape[1])
+
+        G = np.zeros(omega.shape, dtype = np.complex128)
+        for i in range(0, len(omega), 64):
+            kappa = np.outer(omega[i:i + 64], half)[..., None]
+            # j_n(-x) = (-1)^n j_n(x), spherical_jn only takes x >= 0
+            moments = 2 * (1j * np.sign(kappa))**n * spherical_jn(n, np.abs(kappa))
+            G[i:i + 64] = np.sum(half * np.exp(1j * np.outer(omega[i:i + 64], mid)) * np.sum(self.coeffs * moments, axis = -1),
+                                 axis = -1)
+
+        return G.reshape(tau.shape)
+
+    def incoherent_delay(self, tol):
+        '''delay beyond which |G(tau)| < tol * int |g| df.
+        '''
+        return self.variation / (2 * np.pi * tol * self.abs_integral)
+
+    def oscillatory_integral(self, tau, tol = 1e-10):
+        '''G(tau), set to zero where the bound on the cross term is below tol * int |g| df.
+        '''
+        tau = np.asarray(tau, dtype = float)
+        resolved = np.abs(tau) < self.incoherent_delay(tol)
+        G = np.zeros(tau.shape, dtype = np.complex128)
+        if np.any(resolved):
+            G[resolved] = self.integral(tau[resolved])
+
+        return G
@@ -0,0 +1,203 @@
+"""
+Fitting factors: overlaps of a lensed source maximized over the intrinsic parameters of an unlensed template.
+
+The drivers maximize over (t_c, phi_c) only, with the template masses fixed to those of the source, which
+measures the mismatch but not how much of it an unlensed search would absorb into biased masses. Here
+
+    FF = max over (mcz_temp, eta_temp) of max over (t_c, phi_c) of overlap,
+
+with the inner maximization done by fft_maximize (FFT over t_c, Newton refinement, phi_c analytic) on a fixed
+frequency grid, so the outer objective is a smooth function of the template masses only. A template whose cut
+is beyond the grid (lighter than the ones the grid was made for) extends it, the source being zero above its
+own cut, so the integrals are never clipped. The outer search is a Nelder-Mead in units of the starting point.
+Along a sweep the points are ordered as in warm_sweep.py and every one starts from the best fit of its
+neighbour; where the fitting factor drops by more than jump_tol the search is repeated from the template
+parameters and the better result is kept.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize, OptimizeResult
+from gw_lens_dir.inner_product import strain, Sn, limit, grid_weights, fft_maximize
+from gw_lens_dir.lens_sweep import amp_fact_matrix
+from gw_lens_dir.warm_sweep import path_order
+
+INTRINSIC = ('mcz_temp', 'eta_temp')
+
+class fitting_factor():
+    """ Overlap of a fixed source with an unlensed template, maximized over t_c, phi_c and the template
+    intrinsic parameters
+    """
+
+    def __init__(self, f, signal_source, params_source, params_temp, names = INTRINSIC, psd = Sn, low_limit = 20,
+                 tc_bounds = (-0.2, 0.2)):
+        '''
+        Parameters
+        ----------
+        f : array
+            uniform frequency grid, at least up to the cut of the source (extended when a template needs it)
+        signal_source : array, complex
+            (lensed) source on the grid
+        params_source, params_temp : dict
+            parameter dictionaries of the drivers, params_temp gives the template parameters not in names
+        names : tuple
+            template parameters fitted, any of 'mcz_temp', 'eta_temp' and the template angles
+        psd : callable
+            noise curve
+        low_limit : float
+            lower limit of the integrals
+        tc_bounds : tuple
+            t_c window of the inner maximization
+        '''
+        self.f = np.asarray(f, dtype = float)
+        self.signal_source = np.asarray(signal_source, dtype = np.complex128)
+        self.params_source = params_source
+        self.params_temp = dict(params_temp)
+        self.names = tuple(names)
+        self.psd_func = psd
+        self.psd = psd(self.f)
+        self.low_limit = low_limit
+        self.tc_bounds = tc_bounds
+        self.nfev = 0
+
+        f_cut_source = limit(params_source['mcz_source'], params_source['eta_source'], params_source['mcz_source'],
+                             params_source['eta_source'], low_limit = low_limit)[2]
+        if f_cut_source > self.f[-1]:
+            raise ValueError('the grid ends at ' + str(self.f[-1]) + ' Hz, below the cut of the source ' + str(f_cut_source))
+
+    def extend(self, f_high):
+        '''extends the grid (with the same spacing) up to at least f_high, and by a quarter of its length at
+        least so that a search drifting to lighter templates does not extend it at every step.
+        '''
+        df = self.f[1] - self.f[0]
+        n_ext = int(max(np.ceil((f_high - self.f[-1]) / df), len(self.f) // 4))
+        f_ext = self.f[-1] + df * np.arange(1, n_ext + 1)
+        self.f = np.concatenate([self.f, f_ext])
+        self.psd = np.concatenate([self.psd, self.psd_func(f_ext)])
+        self.signal_source = np.concatenate([self.signal_source, np.zeros(n_ext, dtype = np.complex128)])
+
+    def match(self, x):
+        '''overlap maximized over (t_c, phi_c) for the template parameters x (in the order of names).
+
+        Return
+        ----------
+        overlap, t_c, phi_c : float
+        '''
+        temp = dict(self.params_temp)
+        temp.update(zip(self.names, x))
+        self.nfev += 1
+        if temp['mcz_temp'] <= 0 or not 0 < temp['eta_temp'] <= 0.25:
+            return 0., np.nan, np.nan
+
+        limits = limit(self.params_source['mcz_source'], self.params_source['eta_source'], temp['mcz_temp'],
+                       temp['eta_temp'], low_limit = self.low_limit)
+        if limits[3] > self.f[-1]:
+            self.extend(limits[3])
+        weight_num, weight_source, weight_temp = grid_weights(self.f, self.psd, limits)
+        hI_temp = strain(self.f, temp['theta_s_temp'], temp['phi_s_temp'], temp['theta_l_temp'], temp['phi_l_temp'],
+                         temp['mcz_temp'], temp['dist_temp'], temp['eta_temp'], 0., 0.)
+
+        norm_source = np.sum(weight_source * np.abs(self.signal_source)**2)
+        norm_temp = np.sum(weight_temp * np.abs(hI_temp)**2)
+        t_c, phi_c, num_max = fft_maximize(weight_num * self.signal_source * np.conjugate(hI_temp), self.f,
+                                           tc_bounds = self.tc_bounds)
+
+        return num_max / np.sqrt(norm_source * norm_temp), t_c, phi_c
+
+    def overlap(self, x):
+        """ -overlap maximized over (t_c, phi_c), the objective of the outer search
+        """
+        return -1 * self.match(x)[0]
+
+    def fit(self, x0, steps = None, xatol = 1e-7, fatol = 1e-10):
+        '''best fitting template from x0, Nelder-Mead in units of x0.
+
+        Parameters
+        ----------
+        x0 : array
+            starting template parameters (in the order of names)
+        steps : array
+            relative size of the initial simplex along every parameter, 1e-2 by default
+        xatol, fatol : float
+            relative tolerance on the parameters and absolute one on the overlap
+
+        Return
+        ----------
+        res : OptimizeResult
+            ff (fitting factor), x (best fit parameters), tc, phi_c, nfev
+        '''
+        x0 = np.asarray(x0, dtype = float)
+        scale = np.where(x0 != 0, x0, 1.)
+        steps = np.full(len(x0), 1e-2) if steps is None else np.asarray(steps, dtype = float)
+        simplex = np.vstack([np.ones(len(x0)), np.ones(len(x0)) + np.diag(steps)])
+
+        nfev = self.nfev
+        res = minimize(lambda u: self.overlap(u * scale), np.ones(len(x0)), method = 'Nelder-Mead',
+                       options = {'initial_simplex': simplex, 'xatol': xatol, 'fatol': fatol})
+        x = res.x * scale
+        ff, t_c, phi_c = self.match(x)
+
+        return OptimizeResult(ff = ff, x = x, tc = t_c, phi_c = phi_c, nfev = self.nfev - nfev, success = res.success,
+                              message = res.message)
+
+def ff_sweep(params_source, params_temp, lens, M_lz = None, y = None, mu = None, td = None, names = INTRINSIC,
+             df = 1/16, tc_bounds = (-0.2, 0.2), low_limit = 20, psd = Sn, jump_tol = 0.02, f_margin = 1.25):
+    '''fitting factors and best fit template parameters over a lens parameter sweep, warm started along it.
+
+    Parameters
+    ----------
+    lens, M_lz, y, mu, td :
+        as in lens_sweep.sweep
+    names : tuple
+        template parameters fitted
+    df : float
+        frequency resolution (1 / df has to be longer than the t_c window)
+    jump_tol : float
+        a drop of the fitting factor larger than this from the previous point triggers a search from the
+        template parameters
+    f_margin : float
+        the grid extends to f_margin times the highest cut of the source and the initial template, room for
+        the cut of lighter templates (fitting_factor extends it for templates lighter than that)
+
+    Return
+    ----------
+    df_res : DataFrame
+        in the order of the sweep: lens parameters, overlap (template parameters fixed, (t_c, phi_c) maximized),
+        ff, the best fit parameters, tc, phi_c and the number of overlap evaluations
+    '''
+    limits = limit(params_source['mcz_source'], params_source['eta_source'], params_temp['mcz_temp'],
+                   params_temp['eta_temp'], low_limit = low_limit)
+    f = np.arange(limits[0], f_margin * max(limits[2], limits[3]) + df, df)
+
+    hI_source = strain(f, params_source['theta_s_source'], params_source['phi_s_source'], params_source['theta_l_source'],
+                       params_source['phi_l_source'], params_source['mcz_source'], params_source['dist_source'],
+                       params_source['eta_source'], params_source['t0'], params_source['phi_0'])
+    F_matrix = amp_fact_matrix(f, lens, M_lz = M_lz, y = y, mu = mu, td = td)
+
+    if lens == 'sie':
+        coords = np.asarray(td, dtype = float)
+        df_res = pd.DataFrame({'mu': list(np.asarray(mu)), 'td': list(np.asarray(td))})
+    else:
+        M_lz, y = np.broadcast_arrays(np.atleast_1d(M_lz), np.atleast_1d(y))
+        coords = np.column_stack([M_lz, y])
+        df_res = pd.DataFrame({'M_lz': M_lz, 'y': y})
+
+    x_temp = np.array([params_temp[name] for name in names], dtype = float)
+    results = {}
+    x_prev, ff_prev = None, None
+    for i in path_order(coords):
+        engine = fitting_factor(f, hI_source * F_matrix[i], params_source, params_temp, names = names, psd = psd,
+                                low_limit = low_limit, tc_bounds = tc_bounds)
+        overlap = engine.match(x_temp)[0]
+        res = engine.fit(x_temp if x_prev is None else x_prev)
+        if x_prev is not None and ff_prev - res.ff > jump_tol:
+            res_temp = engine.fit(x_temp)
+            if res_temp.ff > res.ff:
+                res = res_temp
+        x_prev, ff_prev = res.x, res.ff
+        results[i] = [overlap, res.ff] + list(res.x) + [res.tc, res.phi_c, engine.nfev]
+
+    columns = ['overlap', 'ff'] + list(names) + ['tc', 'phi_c', 'nfev']
+    df_res[columns] = pd.DataFrame([results[i] for i in range(len(F_matrix))], columns = columns)
+
+    return df_res
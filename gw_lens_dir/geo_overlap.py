@@ -0,0 +1,398 @@
+"""
+Geometrical optics overlaps from the correlation of the unlensed waveforms.
+
+In the geometrical optics limit the lensed source is a sum of shifted unlensed copies,
+
+    h_lensed(f) = h(f) sum_j a_j exp(2 pi i f td_j),
+
+with a_j = sqrt|mu_j| times the Morse phase of image j (F_geo_pm, F_geo_sis, F_sie and the td / flux_ratio
+sources of overlap_lensing_changed_param.py). Every inner product is then a combination of
+
+    C_st(tau) = 4 sum_f df h_source(f) conj(h_temp(f)) exp(2 pi i f tau) / Sn(f)
+    C_ss(tau) = 4 sum_f df |h_source(f)|^2 exp(2 pi i f tau) / Sn(f)
+
+at differences of the delays: the source norm is sum_jk a_j conj(a_k) C_ss(td_j - td_k) and the numerator at
+t_c is sum_j a_j C_st(td_j - t_c). Both correlations are computed once per (source, template, PSD) with an
+FFT, after which the overlap of any set of images costs O(n_images^2) plus a search over t_c.
+
+Lensed templates of the same form, h_temp(f) sum_k b_k exp(2 pi i f tau_k), are fitted the same way: for given
+delays tau_k the overlap is a ratio of a linear and a quadratic form in b, so the best complex amplitudes
+solve the linear system G b = N, with N_k the numerator at tau_k and G_kl = C_tt(tau_l - tau_k) the
+correlation of the template with itself. Only the delays are searched numerically (fit_template).
+
+C is stored as its slowly varying part exp(-2 pi i f_low tau) C(tau), oversampled and interpolated with a
+cubic spline, and the carrier exp(2 pi i f_low tau) is put back analytically. This covers |tau| < 1 / 2df;
+filon_correlation evaluates C at delays of any length (the SIE tables reach days) by Filon quadrature and
+drops the cross terms that cannot be resolved, which is the incoherent sum over the images.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import CubicSpline
+from scipy.optimize import minimize, minimize_scalar
+from gw_lens_dir.inner_product import strain, Sn, limit, grid_weights
+from gw_lens_dir.filon import legendre_panels
+from gw_lens_dir import amplification
+
+def images_pm(M_lz, y):
+    '''(a_j, td_j) of the point mass lens, same normalisation as F_geo_pm.
+    '''
+    flux_ratio = amplification.mag(y, lens = 'pm')[0]
+
+    return np.array([1, -1j * np.sqrt(flux_ratio)]), np.array([0., amplification.time_del(M_lz, y, lens = 'pm')])
+
+def images_flux(flux_ratio, td):
+    '''(a_j, td_j) of the td / flux_ratio sources (F_geo_source_pm of overlap_lensing_changed_param.py).
+    '''
+    return np.array([1, -1j * np.sqrt(flux_ratio)]), np.array([0., td])
+
+def images_sis(M_lz, y):
+    '''(a_j, td_j) of the SIS lens, same normalisation as F_geo_sis (one image for y > 1).
+    '''
+    if y > 1:
+        return np.array([amplification.mag(y, lens = 'sis')[1] + 0j]), np.array([0.])
+
+    flux_ratio = amplification.mag(y, lens = 'sis')[0]
+
+    return np.array([1, -1j * np.sqrt(flux_ratio)]), np.array([0., amplification.time_del(M_lz, y, lens = 'sis')])
+
+def images_sie(mu, td):
+    '''(a_j, td_j) of a row of the SIE flux tables, same as F_sie.
+    '''
+    mu = np.asarray(mu, dtype = float)
+    td = np.asarray(td, dtype = float)
+
+    # one image case
+    if len(set(mu)) == 2:
+        return np.array([1 + 0j]), np.array([0.])
+
+    morse = np.array([1, 1, -1j, -1j])
+
+    return morse * np.sqrt(np.abs(mu)), td
+
+
+class correlation():
+    """ PSD weighted correlations of the unlensed source and template as functions of a time shift
+    """
+
+    def __init__(self, f, hI_source, hI_temp, psd = None, limits = None, oversample = 32):
+        '''
+        Parameters
+        ----------
+        f : array
+            uniformly spaced frequency grid
+        hI_source : array, complex
+            unlensed source strain
+        hI_temp : array, complex
+            template strain at t_c = phi_c = 0
+        psd : array
+            noise curve on the grid (defaults to Sn(f))
+        limits : tuple
+            (low_limit, upper_limit, f_cut_source, f_cut_temp)
+        oversample : int
+            sampling of the correlations in units of the Nyquist interval (sets the interpolation error)
+        '''
+        f = np.asarray(f, dtype = float)
+        df = f[1] - f[0]
+        if not np.allclose(np.diff(f), df, rtol = 1e-6, atol = 0):
+            raise ValueError("correlation needs a uniformly spaced frequency grid")
+
+        psd = Sn(f) if psd is None else psd
+        if limits is None:
+            limits = (f[0], f[-1], f[-1], f[-1])
+        weight_num, weight_source, weight_temp = grid_weights(f, psd, limits)
+
+        self.f_low = f[0]
+        self.norm_temp = np.sum(weight_temp * np.abs(hI_temp)**2)
+
+        # sum_k c_k exp(2 pi i k df tau) on tau = j / (n_fft df), wrapped to [-1 / 2df, 1 / 2df)
+        n_fft = int(2**np.ceil(np.log2(oversample * len(f))))
+        tau = np.fft.fftshift(np.fft.fftfreq(n_fft, d = df))
+        self.tau_range = (tau[0], tau[-1])
+        self.dtau = tau[1] - tau[0]
+
+        def spline(cross):
+            baseband = np.fft.fftshift(np.fft.ifft(cross, n = n_fft)) * n_fft
+            return CubicSpline(tau, baseband)
+
+        self.cross_spline = spline(weight_num * hI_source * np.conjugate(hI_temp))
+        self.auto_spline = spline(weight_source * np.abs(hI_source)**2)
+        self.temp_spline = spline(weight_temp * np.abs(hI_temp)**2)
+
+    def _evaluate(self, spline, tau):
+
+        tau = np.asarray(tau, dtype = float)
+        if np.any(tau < self.tau_range[0]) or np.any(tau > self.tau_range[1]):
+            raise ValueError("time shift outside the correlation, increase the frequency resolution")
+
+        return spline(tau) * np.exp(2 * np.pi * 1j * self.f_low * tau)
+
+    def cross(self, tau):
+        """ C_st(tau)
+        """
+        return self._evaluate(self.cross_spline, tau)
+
+    def auto(self, tau):
+        """ C_ss(tau)
+        """
+        return self._evaluate(self.auto_spline, tau)
+
+    def auto_temp(self, tau):
+        """ C_tt(tau)
+        """
+        return self._evaluate(self.temp_spline, tau)
+
+    def norm_source(self, amps, tds):
+        '''<h_lensed, h_lensed> of the source lensed by images (amps, tds).
+        '''
+        amps = np.asarray(amps, dtype = np.complex128)
+        tds = np.asarray(tds, dtype = float)
+        C = self.auto(tds[:, None] - tds[None, :])
+
+        return np.real(np.sum(amps[:, None] * np.conjugate(amps)[None, :] * C))
+
+    def numerator(self, amps, tds, t_c):
+        '''complex numerator sum_j a_j C_st(td_j - t_c), its modulus is the numerator maximized over phi_c.
+        '''
+        amps = np.asarray(amps, dtype = np.complex128)
+        tds = np.asarray(tds, dtype = float)
+        t_c = np.asarray(t_c, dtype = float)
+
+        return np.sum(amps[:, None] * self.cross(tds[:, None] - t_c.ravel()[None, :]), axis = 0).reshape(t_c.shape)
+
+    def overlap(self, amps, tds, tc_bounds = (-0.2, 0.2), n_tc = None):
+        '''overlap maximized over (t_c, phi_c) of a source lensed by images (amps, tds).
+
+        t_c is scanned on the sampling of the correlations and the best point is refined with a bounded
+        scalar maximization.
+
+        Return
+        ----------
+        overlap, t_c, phi_c : float
+        '''
+        if n_tc is None:
+            n_tc = int((tc_bounds[1] - tc_bounds[0]) / self.dtau) + 1
+        tc_arr = np.linspace(tc_bounds[0], tc_bounds[1], n_tc)
+        i = np.argmax(np.abs(self.numerator(amps, tds, tc_arr)))
+
+        res = minimize_scalar(lambda t_c: -np.abs(self.numerator(amps, tds, t_c)),
+                              bounds = (tc_arr[max(i - 1, 0)], tc_arr[min(i + 1, n_tc - 1)]), method = 'bounded',
+                              options = {'xatol': 1e-9})
+        A = self.numerator(amps, tds, res.x)
+        norm_source = self.norm_source(amps, tds)
+
+        overlap = 0. if norm_source == 0 else np.abs(A) / np.sqrt(norm_source * self.norm_temp)
+
+        return overlap, res.x, -np.angle(A)
+
+    def template_overlap(self, amps, tds, taus):
+        '''overlap of the source with the best lensed template with delays taus (maximized over the complex
+        amplitudes of the template images, which absorb phi_c).
+
+        Return
+        ----------
+        overlap : array
+            shape of taus without its last axis
+        b : array, complex
+            best template amplitudes, normalised to b_0 = 1 in modulus
+        '''
+        taus = np.asarray(taus, dtype = float)
+        norm_source = self.norm_source(amps, tds)
+        if norm_source == 0:
+            return np.zeros(taus.shape[:-1]), np.zeros(taus.shape, dtype = np.complex128)
+
+        N = self.numerator(amps, tds, taus)
+        G = self.auto_temp(taus[..., None, :] - taus[..., :, None])
+        # b maximizes |b^H N|^2 / b^H G b for b = G^-1 N (Cauchy-Schwarz in the metric G)
+        b = np.linalg.solve(G + 1e-12 * np.trace(G, axis1 = -2, axis2 = -1)[..., None, None] * np.eye(taus.shape[-1]), N[..., None])[..., 0]
+        value = np.real(np.sum(np.conjugate(N) * b, axis = -1))
+        # the template norm b^H G b is included in G
+        overlap = np.sqrt(np.maximum(value, 0) / norm_source)
+
+        return overlap, b / np.abs(b[..., :1])
+
+    def fit_template(self, amps, tds, n_images = 2, tc_bounds = (-0.2, 0.2), taus_0 = None):
+        '''best lensed template with n_images images for a source lensed by (amps, tds).
+
+        The delays start from those of the n_images brightest images of the source, shifted as a whole by the
+        t_c that maximizes the overlap (scanned on the correlation grid), and are then all refined with a
+        Nelder-Mead search. The amplitudes of the template images are solved for at every step.
+
+        Parameters
+        ----------
+        amps, tds : array
+            images of the source
+        n_images : int
+            number of images of the template
+        tc_bounds : tuple
+            window of the global time shift of the template
+        taus_0 : array
+            starting delays (relative to the first one), defaults to the delays of the brightest source images
+
+        Return
+        ----------
+        overlap : float
+        taus : array
+            delays of the template images (taus[0] plays the role of t_c)
+        b : array, complex
+            amplitudes of the template images (b[0] has modulus 1)
+        '''
+        amps = np.asarray(amps, dtype = np.complex128)
+        tds = np.asarray(tds, dtype = float)
+        if taus_0 is None:
+            n_images = min(n_images, max(1, np.count_nonzero(amps)))
+            brightest = np.sort(np.argsort(-np.abs(amps))[:n_images])
+            taus_0 = tds[brightest] - tds[brightest[0]]
+        taus_0 = np.asarray(taus_0, dtype = float)
+
+        # global shift on the sampling of the correlations
+        dtau = self.dtau
+        tc_arr = np.linspace(tc_bounds[0], tc_bounds[1], int((tc_bounds[1] - tc_bounds[0]) / dtau) + 1)
+        overlap_arr, _ = self.template_overlap(amps, tds, tc_arr[:, None] + taus_0[None, :])
+        t_c = tc_arr[np.argmax(overlap_arr)]
+
+        res = minimize(lambda taus: -self.template_overlap(amps, tds, taus)[0], t_c + taus_0, method = 'Nelder-Mead',
+                       options = {'xatol': 1e-7, 'fatol': 1e-10, 'initial_simplex': t_c + taus_0 + dtau * np.vstack([np.zeros(len(taus_0)), np.eye(len(taus_0))])})
+        overlap, b = self.template_overlap(amps, tds, res.x)
+
+        return float(overlap), res.x, b
+
+class filon_correlation(correlation):
+    """ Same correlations computed with Filon quadrature, for delays of any length (see filon.py)
+
+    The FFT correlations only cover |tau| < 1 / 2df, which for the SIE delays of days would need a grid of
+    10^7 points per Hz. Here every C(tau) is an oscillatory integral of a smooth integrand expanded once on
+    Legendre panels, and beyond the delay where it cannot be resolved to tol the cross term is dropped, so the
+    norm and the numerator become incoherent sums over the images.
+    """
+
+    def __init__(self, signal_source, signal_temp, limits, psd = Sn, order = 16, rtol = 1e-12, tol = 1e-10,
+                 oversample = 32):
+        '''
+        Parameters
+        ----------
+        signal_source : callable
+            unlensed source strain as a function of a frequency array
+        signal_temp : callable
+            template strain at t_c = phi_c = 0
+        limits : tuple
+            (low_limit, upper_limit, f_cut_source, f_cut_temp)
+        psd : callable
+            noise curve
+        order, rtol : int, float
+            Legendre expansion of the integrands (legendre_panels)
+        tol : float
+            cross terms below tol times the incoherent sum are dropped
+        oversample : int
+            sampling of the t_c scans in units of the Nyquist interval of the band
+        '''
+        low_limit, upper_limit, f_cut_source, f_cut_temp = limits
+        panel_args = {'order': order, 'rtol': rtol}
+
+        self.cross_panels = legendre_panels(lambda f: 4 * signal_source(f) * np.conjugate(signal_temp(f)) / psd(f),
+                                            low_limit, upper_limit, **panel_args)
+        self.auto_panels = legendre_panels(lambda f: 4 * np.abs(signal_source(f))**2 / psd(f),
+                                           low_limit, f_cut_source, **panel_args)
+        self.temp_panels = legendre_panels(lambda f: 4 * np.abs(signal_temp(f))**2 / psd(f),
+                                           low_limit, f_cut_temp, **panel_args)
+        self.tol = tol
+
+        self.f_low = low_limit
+        self.norm_temp = np.real(self.temp_panels.integral(0.))
+        self.tau_range = (-np.inf, np.inf)
+        self.dtau = 1 / (oversample * (max(f_cut_source, f_cut_temp) - low_limit))
+
+    def cross(self, tau):
+        """ C_st(tau)
+        """
+        return self.cross_panels.oscillatory_integral(tau, tol = self.tol)
+
+    def auto(self, tau):
+        """ C_ss(tau)
+        """
+        return self.auto_panels.oscillatory_integral(tau, tol = self.tol)
+
+    def auto_temp(self, tau):
+        """ C_tt(tau)
+        """
+        return self.temp_panels.oscillatory_integral(tau, tol = self.tol)
+
+
+def from_params(params_source, params_temp, df = 1/16, method = 'fft'):
+    '''correlation of the unlensed source and template from the parameter dictionaries used by the drivers
+    (initial_params_source, initial_params_template).
+
+    method is 'fft' for the interpolated FFT correlations (|tau| < 1 / 2df) or 'filon' for filon_correlation,
+    which handles delays of any length.
+    '''
+    limits = limit(params_source['mcz_source'], params_source['eta_source'], params_temp['mcz_temp'], params_temp['eta_temp'])
+
+    def hI_source(f):
+        return strain(
+            f,
+            params_source['theta_s_source'],
+            params_source['phi_s_source'],
+            params_source['theta_l_source'],
+            params_source['phi_l_source'],
+            params_source['mcz_source'],
+            params_source['dist_source'],
+            params_source['eta_source'],
+            params_source['t0'],
+            params_source['phi_0']
+        )
+
+    def hI_temp(f):
+        return strain(
+            f,
+            params_temp['theta_s_temp'],
+            params_temp['phi_s_temp'],
+            params_temp['theta_l_temp'],
+            params_temp['phi_l_temp'],
+            params_temp['mcz_temp'],
+            params_temp['dist_temp'],
+            params_temp['eta_temp'],
+            0.,
+            0.
+        )
+
+    if method == 'filon':
+        return filon_correlation(hI_source, hI_temp, limits)
+
+    f = np.arange(limits[0], max(limits[2], limits[3]) + df, df)
+
+    return correlation(f, hI_source(f), hI_temp(f), limits = limits)
+
+def geo_sweep(params_source, params_temp, images, df = 1/16, tc_bounds = (-0.2, 0.2), method = 'fft'):
+    '''geometrical optics overlaps of a list of lens configurations.
+
+    Parameters
+    ----------
+    images : list
+        (amps, tds) of every configuration, e.g. [images_flux(0.4, td) for td in td_range]
+    method : str
+        'fft' or 'filon', see from_params()
+
+    Return
+    ----------
+    df_res : DataFrame
+        one row per configuration, with the maximized overlap and the optimal (t_c, phi_c)
+    '''
+    corr = from_params(params_source, params_temp, df = df, method = method)
+    res = np.array([corr.overlap(amps, tds, tc_bounds = tc_bounds) for amps, tds in images])
+
+    return pd.DataFrame({'overlap': res[:, 0], 'tc': res[:, 1], 'phi_c': res[:, 2]})
+
+def fit_sweep(params_source, params_temp, images, n_images = 2, df = 1/16, tc_bounds = (-0.2, 0.2), method = 'fft'):
+    '''best n_images lensed template (fit_template) of every lens configuration, in one pass.
+
+    Return
+    ----------
+    df_res : DataFrame
+        one row per configuration, with the overlap, the template delays (tc = taus[0]) and the complex
+        amplitudes of the template images
+    '''
+    corr = from_params(params_source, params_temp, df = df, method = method)
+    res = [corr.fit_template(amps, tds, n_images = n_images, tc_bounds = tc_bounds) for amps, tds in images]
+
+    return pd.DataFrame({'overlap': [r[0] for r in res], 'tc': [r[1][0] for r in res], 'taus': [r[1] for r in res],
+                         'amps': [r[2] for r in res]})
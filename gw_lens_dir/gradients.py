@@ -0,0 +1,265 @@
+"""
+Overlap on a frequency grid with analytic gradients.
+
+strain(), the amplification factors and the quad() overlaps are only evaluated, so every optimization is
+gradient free. Here the TaylorF2 strain, the geometrical optics (pm, sis, SIE) and tabulated amplification
+factors return their derivatives together with their values, and the grid inner product carries them through to
+
+    d overlap = Re<ds, h> / D + Re<s, dh> / D - overlap / 2 (d<s, s> / <s, s> + d<h, h> / <h, h>),
+
+D = sqrt(<s, s> <h, h>), for the template parameters (t_c, phi_c, mcz_temp, eta_temp) and the lens parameters
+(M_lz, y, or the magnifications and delays of the SIE images). The derivatives are written out by hand (no
+autodiff backend is needed) and are exact up to rounding for the analytic factors; the tables use the
+derivatives of their splines.
+
+The integration limits are those of the initial parameters and are held fixed, so that the overlap and its
+gradient are those of one smooth function (the ISCO cut of the template moves with its masses otherwise).
+"""
+
+import numpy as np
+from scipy.optimize import minimize
+from gw_lens_dir.inner_product import strain, Sn, limit, grid_weights
+from gw_lens_dir import amplification
+from gw_lens_dir.amplification_table import F_table, _tables
+
+TEMPLATE_PARAMS = ('tc', 'phi_c', 'mcz_temp', 'eta_temp', 'dist_temp')
+
+def strain_grad(f, theta_s, phi_s, theta_l, phi_l, mcz, dist, eta, tc, phi_c):
+    '''strain() and its derivatives.
+
+    Return
+    ----------
+    h : array, complex
+    grad : dict
+        dh / d parameter for 'tc', 'phi_c', 'mcz', 'eta' and 'dist'
+    '''
+    f = np.asarray(f, dtype = float)
+    h = strain(f, theta_s, phi_s, theta_l, phi_l, mcz, dist, eta, tc, phi_c)
+
+    # psi = 2 pi f tc - phi_c - pi / 4 + 3/4 (8 pi mcz f)^(-5/3) (1 + a(eta) x^(2/3) - 16 pi x), x = pi M f
+    M_val = mcz / np.power(eta, 3/5)
+    x = np.pi * M_val * f
+    a = 20 / 9 * (743 / 336 + 11 / 4 * eta)
+    main_coeffs = 0.75 * np.power(8 * np.pi * mcz * f, -5 / 3)
+    main_terms = 1 + a * np.power(x, 2 / 3) - 16 * np.pi * x
+    # x is proportional to mcz and to eta^(-3/5)
+    x_terms = 2 / 3 * a * np.power(x, 2 / 3) - 16 * np.pi * x
+    dpsi_dmcz = main_coeffs * (-5 / 3 * main_terms + x_terms) / mcz
+    dpsi_deta = main_coeffs * (20 / 9 * 11 / 4 * np.power(x, 2 / 3) - 3 / 5 * x_terms / eta)
+
+    grad = {
+        'tc': 2j * np.pi * f * h,
+        'phi_c': -1j * h,
+        'mcz': (5 / 6 / mcz + 1j * dpsi_dmcz) * h,
+        'eta': 1j * dpsi_deta * h,
+        'dist': -h / dist,
+    }
+
+    return h, grad
+
+def amp_fact_grad(f, lens, lens_params):
+    '''amplification factor and its derivatives with respect to the lens parameters.
+
+    Parameters
+    ----------
+    f : array
+        frequency grid
+    lens : str
+        'pm_geo', 'sis_geo' (geometrical optics), 'pm_table', 'sis_table' (F(w, y) tables) or 'sie'
+    lens_params : dict
+        'M_lz' and 'y', or 'mu' and 'td' (four images) for the SIE
+
+    Return
+    ----------
+    F_val : array, complex
+    grad : dict
+        dF / d parameter: 'M_lz' and 'y', or 'mu_1' ... 'mu_4' and 'td_1' ... 'td_4'
+    '''
+    f = np.asarray(f, dtype = float)
+    if lens == 'sie':
+        mu = np.asarray(lens_params['mu'], dtype = float)
+        td = np.asarray(lens_params['td'], dtype = float)
+        F_val = amplification.F_sie(f, mu, td)
+        if len(set(mu)) == 2:
+            zero = np.zeros(f.shape, dtype = np.complex128)
+            return F_val, {f'{name}_{i + 1}': zero for name in ('mu', 'td') for i in range(4)}
+        morse = np.array([1, 1, -1j, -1j])
+        images = morse[:, None] * np.exp(2 * np.pi * 1j * np.outer(td, f))
+        grad = {}
+        for i in range(4):
+            grad[f'mu_{i + 1}'] = np.sign(mu[i]) / (2 * np.sqrt(np.abs(mu[i]))) * images[i]
+            grad[f'td_{i + 1}'] = 2j * np.pi * f * np.sqrt(np.abs(mu[i])) * images[i]
+        return F_val, grad
+
+    M_lz, y = lens_params['M_lz'], lens_params['y']
+    kind, source = lens.split('_')
+    if source == 'table':
+        if kind not in _tables:
+            F_table(f[:1], M_lz, y, lens = kind)
+        F_val, dF_dlogw, dF_dy = _tables[kind].F_w_grad(8 * np.pi * M_lz * f, y)
+        # w = 8 pi M_lz f, d log w / d M_lz = 1 / M_lz
+        return F_val, {'M_lz': dF_dlogw / M_lz, 'y': dF_dy}
+
+    if kind == 'sis' and y > 1:
+        F_val = amplification.F_geo_sis(f, M_lz, y)
+        return F_val, {'M_lz': np.zeros(f.shape, dtype = np.complex128), 'y': np.full(f.shape, -1 / y**2, dtype = np.complex128)}
+
+    # 1 - i sqrt(mu_minus / mu_plus) exp(2 pi i f td)
+    flux_ratio, mu_plus, mu_minus = amplification.mag(y, lens = kind)
+    td = amplification.time_del(M_lz, y, lens = kind)
+    if kind == 'pm':
+        s = np.sqrt(y**2 + 4)
+        g = (y**2 + 2) / (2 * y * s)
+        dg = g * (2 * y / (y**2 + 2) - 1 / y - y / s**2)
+        # mu_pm = 1/2 +- g
+        dflux_ratio = (dg * mu_plus - mu_minus * dg) / mu_plus**2
+        dtd_dy = 4 * M_lz * (s / 2 + y**2 / (2 * s) + 2 / s)
+    else:
+        # mu_pm = 1/y +- 1 for y < 1
+        dflux_ratio = (-1 / y**2 * mu_plus + mu_minus / y**2) / mu_plus**2
+        dtd_dy = 8 * M_lz
+    image = -1j * np.sqrt(flux_ratio) * np.exp(2 * np.pi * 1j * f * td)
+    F_val = 1 + image
+    grad = {
+        'M_lz': 2j * np.pi * f * td / M_lz * image,
+        'y': (dflux_ratio / (2 * flux_ratio) + 2j * np.pi * f * dtd_dy) * image,
+    }
+
+    return F_val, grad
+
+class differentiable_overlap():
+    """ Overlap of a (lensed) source and an unlensed template on a frequency grid, with its gradient.
+    """
+
+    def __init__(self, params_source, params_temp, lens = None, lens_params = None, names = ('tc', 'phi_c'), f = None,
+                 df = 1/16, psd = Sn, low_limit = 20):
+        '''
+        Parameters
+        ----------
+        params_source, params_temp : dict
+            parameter dictionaries of the drivers (initial_params_source, initial_params_template)
+        lens : str
+            amplification factor of the source (see amp_fact_grad), None for an unlensed source
+        lens_params : dict
+            initial lens parameters
+        names : tuple
+            parameters of the overlap, in the order of x: any of 'tc', 'phi_c', 'mcz_temp', 'eta_temp',
+            'dist_temp' and of the lens parameters. The others stay at their initial values.
+        f : array
+            frequency grid, uniform with spacing df up to the highest cut by default
+        psd : callable
+            noise curve
+        low_limit : float
+            lower limit of the integrals
+        '''
+        self.params_source = dict(params_source)
+        self.params_temp = dict(params_temp)
+        self.params_temp.setdefault('tc', 0.)
+        self.params_temp.setdefault('phi_c', 0.)
+        self.lens = lens
+        self.lens_params = {} if lens_params is None else dict(lens_params)
+        self.names = tuple(names)
+
+        self.limits = limit(params_source['mcz_source'], params_source['eta_source'], params_temp['mcz_temp'],
+                            params_temp['eta_temp'], low_limit = low_limit)
+        if f is None:
+            f = np.arange(self.limits[0], max(self.limits[2], self.limits[3]) + df, df)
+        self.f = np.asarray(f, dtype = float)
+        self.weight_num, self.weight_source, self.weight_temp = grid_weights(self.f, psd(self.f), self.limits)
+
+    def _split(self, x):
+        '''template and lens parameters at x.
+        '''
+        temp = dict(self.params_temp)
+        lens_params = dict(self.lens_params)
+        if self.lens == 'sie':
+            lens_params['mu'] = np.array(lens_params['mu'], dtype = float)
+            lens_params['td'] = np.array(lens_params['td'], dtype = float)
+        for name, value in zip(self.names, x):
+            if name in TEMPLATE_PARAMS:
+                temp[name] = value
+            elif name[:3] in ('mu_', 'td_'):
+                lens_params[name[:2]][int(name[3:]) - 1] = value
+            else:
+                lens_params[name] = value
+
+        return temp, lens_params
+
+    def signals(self, x):
+        '''source and template on the grid at x, and their derivatives with respect to the parameters in names.
+        '''
+        temp, lens_params = self._split(x)
+        p = self.params_source
+        h_source = strain(self.f, p['theta_s_source'], p['phi_s_source'], p['theta_l_source'], p['phi_l_source'],
+                          p['mcz_source'], p['dist_source'], p['eta_source'], p['t0'], p['phi_0'])
+        h_temp, grad_temp = strain_grad(self.f, temp['theta_s_temp'], temp['phi_s_temp'], temp['theta_l_temp'],
+                                        temp['phi_l_temp'], temp['mcz_temp'], temp['dist_temp'], temp['eta_temp'],
+                                        temp['tc'], temp['phi_c'])
+        if self.lens is None:
+            signal_source, grad_F = h_source, {}
+        else:
+            F_val, grad_F = amp_fact_grad(self.f, self.lens, lens_params)
+            signal_source = h_source * F_val
+
+        zero = np.zeros(self.f.shape, dtype = np.complex128)
+        d_source, d_temp = [], []
+        for name in self.names:
+            if name in TEMPLATE_PARAMS:
+                d_temp.append(grad_temp[name.replace('_temp', '')])
+                d_source.append(zero)
+            else:
+                d_temp.append(zero)
+                d_source.append(h_source * grad_F[name])
+
+        return signal_source, h_temp, np.array(d_source), np.array(d_temp)
+
+    def value_and_grad(self, x):
+        '''overlap at x and its gradient with respect to the parameters in names.
+        '''
+        s, h, ds, dh = self.signals(x)
+        num = np.real(np.sum(self.weight_num * s * np.conjugate(h)))
+        norm_source = np.sum(self.weight_source * np.abs(s)**2)
+        norm_temp = np.sum(self.weight_temp * np.abs(h)**2)
+        deno = np.sqrt(norm_source * norm_temp)
+        overlap = num / deno
+
+        d_num = np.real(np.sum(self.weight_num * (ds * np.conjugate(h) + s * np.conjugate(dh)), axis = -1))
+        d_norm_source = 2 * np.real(np.sum(self.weight_source * np.conjugate(s) * ds, axis = -1))
+        d_norm_temp = 2 * np.real(np.sum(self.weight_temp * np.conjugate(h) * dh, axis = -1))
+        grad = d_num / deno - overlap / 2 * (d_norm_source / norm_source + d_norm_temp / norm_temp)
+
+        return overlap, grad
+
+    def overlap(self, x):
+        """ Drop-in replacement for the overlap(x) methods of the overlap classes (returns -overlap)
+        """
+        return -1 * self.value_and_grad(x)[0]
+
+    def jac(self, x):
+        """ Gradient of overlap(x)
+        """
+        return -1 * self.value_and_grad(x)[1]
+
+    def fisher(self, x):
+        '''Fisher matrix <dh_i, dh_j> of the template parameters in names, normalized by <h, h> (so that
+        1 - overlap ~ dx^T Gamma dx / 2 for small offsets of a template from itself, after maximizing over
+        nothing else).
+        '''
+        s, h, ds, dh = self.signals(x)
+        norm_temp = np.sum(self.weight_temp * np.abs(h)**2)
+        gamma = np.real(np.einsum('if,jf->ij', self.weight_temp * dh, np.conjugate(dh))) / norm_temp
+        # the component along h only rescales the template, which the normalized overlap ignores
+        proj = np.real(np.sum(self.weight_temp * dh * np.conjugate(h), axis = -1)) / norm_temp
+
+        return gamma - np.outer(proj, proj)
+
+    def maximize(self, x0, bounds = None):
+        '''local maximum of the overlap from x0 with L-BFGS-B and the analytic gradient.
+
+        Return
+        ----------
+        res : OptimizeResult
+            fun = -overlap, as the drivers' optimizers
+        '''
+        return minimize(lambda x: tuple(-1 * v for v in self.value_and_grad(x)), x0, jac = True, method = 'L-BFGS-B',
+                        bounds = bounds)
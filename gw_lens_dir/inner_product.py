@@ -0,0 +1,517 @@
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+
+def Sn(f):
+    """ ALIGO noise curve from arXiv:0903.0338. Same as the Sn() method of the overlap classes but
+    evaluated on a whole frequency array at once.
+    """
+    f = np.asarray(f, dtype = float)
+    fs = 20
+    S0 = 1E-49
+    f0 = 215
+    x = np.maximum(f, fs) / f0
+    Sn_temp = np.power(x, -4.14) - 5 * np.power(x, -2) + 111 * ((1 - np.power(x, 2) + 0.5 * np.power(x, 4)) / (1 + 0.5 * np.power(x, 2)))
+    Sn_val = np.where(f < fs, np.inf, Sn_temp * S0)
+
+    return Sn_val
+
+def strain(f, theta_s, phi_s, theta_l, phi_l, mcz, dist, eta, tc, phi_c):
+    """
+    Module level copy of the strain() method of the overlap classes (1.5PN TaylorF2 in the I detector).
+    All the operations are numpy operations, so f can be an array.
+    """
+    M_val = mcz / np.power(eta, 3/5)
+
+    l_dot_n = np.cos(theta_s) * np.cos(theta_l) + np.sin(theta_s) * np.sin(theta_l) * np.cos(phi_s - phi_l)
+    amplitude = np.sqrt(5 / 96) * np.power(np.pi, -2 / 3) * np.power(mcz, 5 / 6) / (dist)
+
+    # eqn 3.13 in Cutler-Flanaghan 1994
+    front_terms = 2 * np.pi * f * tc - phi_c - np.pi / 4
+    main_coeffs = 0.75 * np.power(8 * np.pi * mcz * f, -5 / 3)
+    main_terms = (1 + 20 / 9 * (743 / 336 + 11 / 4 * eta) * np.power(np.pi * M_val * f, 2 / 3)
+                    - (16 * np.pi) * np.power(np.pi * M_val * f, 1))
+    psi_val = front_terms + main_coeffs * (main_terms)
+
+    numerator = np.cos(theta_l) - np.cos(theta_s) * l_dot_n
+    denominator = np.sin(theta_s) * np.sin(theta_l) * np.sin(phi_l - phi_s)
+    psi_s_val = np.arctan2(numerator, denominator)
+
+    fIp_val = (1 / 2 * (1 + np.power(np.cos(theta_s), 2)) * np.cos(2 * phi_s) * np.cos(2 * psi_s_val)
+                - np.cos(theta_s) * np.sin(2 * phi_s) * np.sin(2 * psi_s_val))
+    fIc_val = (1 / 2 * (1 + np.power(np.cos(theta_s), 2)) * np.cos(2 * phi_s) * np.sin(2 * psi_s_val)
+                + np.cos(theta_s) * np.sin(2 * phi_s) * np.cos(2 * psi_s_val))
+
+    lambdaI_val = np.sqrt(np.power(2 * l_dot_n * fIc_val, 2) + np.power((1 + np.power(l_dot_n, 2)) * fIp_val, 2))
+    phi_pI_val = np.arctan2(2 * l_dot_n * fIc_val, (1 + np.power(l_dot_n, 2)) * fIp_val)
+
+    signal_I = lambdaI_val * np.exp(-1j * phi_pI_val) * amplitude * np.power(f, -7 / 6) * np.exp(1j * psi_val)
+    return signal_I
+
+def trapz_weights(f, f_low = None, f_high = None):
+    """ Weights w such that sum(w * g(f)) is the integral of the piecewise linear interpolant of g
+    over [f_low, f_high]. The grid does not have to be uniform and the limits do not have to be grid points.
+    """
+    f = np.asarray(f, dtype = float)
+    f_low = f[0] if f_low is None else max(f_low, f[0])
+    f_high = f[-1] if f_high is None else min(f_high, f[-1])
+
+    weights = np.zeros_like(f)
+    if f_high <= f_low:
+        return weights
+
+    left = f[:-1]
+    right = f[1:]
+    h = right - left
+    a = np.clip(left, f_low, f_high)
+    b = np.clip(right, f_low, f_high)
+
+    # integral of the two hat functions over the clipped part [a, b] of every segment
+    w_left = ((right - a)**2 - (right - b)**2) / (2 * h)
+    w_right = ((b - left)**2 - (a - left)**2) / (2 * h)
+
+    np.add.at(weights, np.arange(len(f) - 1), w_left)
+    np.add.at(weights, np.arange(1, len(f)), w_right)
+
+    return weights
+
+def grid_weights(f, psd, limits):
+    '''weights 4 df / Sn of the numerator, the source norm and the template norm.
+
+    Parameters
+    ----------
+    f : array
+        frequency grid
+    psd : array
+        noise curve on the grid
+    limits : tuple
+        (low_limit, upper_limit, f_cut_source, f_cut_temp) as returned by limit()
+    '''
+    low_limit, upper_limit, f_cut_source, f_cut_temp = limits
+
+    with np.errstate(divide = 'ignore'):
+        inv_psd = np.where(np.isinf(psd), 0., 1 / psd)
+
+    weight_num = 4 * trapz_weights(f, low_limit, upper_limit) * inv_psd
+    weight_source = 4 * trapz_weights(f, low_limit, f_cut_source) * inv_psd
+    weight_temp = 4 * trapz_weights(f, low_limit, f_cut_temp) * inv_psd
+
+    return weight_num, weight_source, weight_temp
+
+def chirp_time(f, mcz):
+    """ Leading order time to merger of the inspiral from frequency f (mcz in seconds)
+    """
+    return 5 / 256 * np.power(mcz, -5 / 3) * np.power(np.pi * np.asarray(f, dtype = float), -8 / 3)
+
+def multiband_grid(f_low, f_high, mcz, td = 0., tc_window = 0.4, df_max = 1., safety = 4.):
+    '''non-uniform frequency grid whose local resolution follows the duration of the signal.
+
+    A signal that lasts T from frequency f needs df < 1 / T there. Here T is the chirp time to merger plus the
+    lens delay and the t_c window searched, so df is fine at low frequencies and coarse close to merger. The
+    band is split into sub-bands of uniform df = df_max / 2^k, a new sub-band starting wherever the allowed
+    resolution has doubled. The inner products use the trapezoid weights of the grid (trapz_weights), which do
+    not need a uniform grid.
+
+    Parameters
+    ----------
+    f_low, f_high : float
+        band
+    mcz : float
+        chirp mass in seconds (the smallest chirp mass of source and template, which lasts longest)
+    td : float
+        largest time delay between the images of the lens
+    tc_window : float
+        length of the t_c window searched
+    df_max : float
+        coarsest resolution
+    safety : float
+        df = 1 / (safety * T)
+
+    Return
+    ----------
+    f : array
+    '''
+    extra = td + tc_window
+    df_local = lambda f: 1 / (safety * (chirp_time(f, mcz) + extra))
+
+    bands = []
+    f = f_low
+    while f < f_high:
+        k = max(0, int(np.ceil(np.log2(df_max / df_local(f)))))
+        df = df_max / 2**k
+        if k == 0:
+            f_next = f_high
+        else:
+            # the next sub-band starts where 2 df is allowed: chirp_time(f_next) = 1 / (2 safety df) - extra
+            tau = 1 / (2 * safety * df) - extra
+            f_next = f_high if tau <= 0 else min(f_high, np.power(256 / 5 * np.power(mcz, 5 / 3) * tau, -3 / 8) / np.pi)
+        n = max(1, int(np.ceil((f_next - f) / df)))
+        bands.append(f + df * np.arange(n))
+        f = f + n * df
+    bands.append([f])
+
+    return np.concatenate(bands)
+
+def fft_maximize(cross, f, tc_bounds = (-0.2, 0.2), oversample = 4, newton_steps = 3):
+    '''maximizes |sum(cross * exp(-2 pi i f t_c))| over t_c with an inverse FFT, then refines t_c below the
+    FFT bin with a few Newton steps on the exact sum. The phase phi_c is maximized analytically.
+
+    On a non-uniform grid (multiband_grid) the sum is scanned over t_c directly, one matrix product per batch,
+    on the same t_c spacing the FFT would give.
+
+    Parameters
+    ----------
+    cross : array, complex
+        cross spectrum (weights included), shape (n_freq,) or (n_rows, n_freq) for a batch
+    f : array
+        frequency grid
+    tc_bounds : tuple
+        search window for t_c
+    oversample : int
+        zero padding factor of the FFT
+
+    Return
+    ----------
+    t_c, phi_c, num_max : float or array
+        optimal (t_c, phi_c) and the value of the numerator there
+    '''
+    cross = np.asarray(cross, dtype = np.complex128)
+    f = np.asarray(f, dtype = float)
+    squeeze = cross.ndim == 1
+    cross = np.atleast_2d(cross)
+
+    df = f[1] - f[0]
+    if np.allclose(np.diff(f), df, rtol = 1e-6, atol = 0):
+        n_fft = int(2**np.ceil(np.log2(oversample * len(f))))
+        dt = 1 / (n_fft * df)
+        if tc_bounds[1] - tc_bounds[0] >= 1 / df:
+            raise ValueError("t_c window is longer than 1/df, increase the frequency resolution")
+
+        # sum_k c_k exp(-2 pi i k df t_c) on t_c = j dt, j < 0 wraps around
+        series = np.fft.fft(cross, n = n_fft, axis = -1)
+        tc_arr = np.fft.fftfreq(n_fft, d = df)
+        in_window = (tc_arr >= tc_bounds[0]) & (tc_arr <= tc_bounds[1])
+        power = np.where(in_window, np.abs(series)**2, -np.inf)
+        t_c = tc_arr[np.argmax(power, axis = -1)]
+    else:
+        dt = 1 / (oversample * (f[-1] - f[0]))
+        tc_arr = np.arange(tc_bounds[0], tc_bounds[1] + dt / 2, dt)
+        power = np.concatenate([np.abs(cross @ np.exp(-2j * np.pi * np.outer(f, tc_arr[i:i + 256])))**2
+                                for i in range(0, len(tc_arr), 256)], axis = -1)
+        t_c = tc_arr[np.argmax(power, axis = -1)]
+
+    # Newton steps on d|A|^2/dt = 0 with the exact A(t) = sum c exp(-2 pi i f t)
+    two_pi_f = 2 * np.pi * f
+    for _ in range(newton_steps):
+        phase = cross * np.exp(-1j * np.outer(t_c, two_pi_f))
+        A = np.sum(phase, axis = -1)
+        A_1 = np.sum(-1j * two_pi_f * phase, axis = -1)
+        A_2 = np.sum(-two_pi_f**2 * phase, axis = -1)
+        grad = 2 * np.real(np.conjugate(A) * A_1)
+        hess = 2 * np.real(np.conjugate(A_1) * A_1 + np.conjugate(A) * A_2)
+        step = np.where(hess < 0, -grad / np.where(hess < 0, hess, 1), 0)
+        t_c = np.clip(t_c + np.clip(step, -dt, dt), tc_bounds[0], tc_bounds[1])
+
+    A = np.sum(cross * np.exp(-1j * np.outer(t_c, two_pi_f)), axis = -1)
+    phi_c = -np.angle(A)
+    num_max = np.abs(A)
+
+    if squeeze:
+        return t_c[0], phi_c[0], num_max[0]
+    return t_c, phi_c, num_max
+
+def limit(mcz_source, eta_source, mcz_temp, eta_temp, low_limit = 20):
+    """ Same as the limit() method of the overlap classes
+    """
+    f_cut_source = 1 / (np.power(6, 3/2) * np.pi * ((mcz_source) / (np.power(eta_source, 3/5))))
+    f_cut_temp = 1 / (np.power(6, 3/2) * np.pi * ((mcz_temp) / (np.power(eta_temp, 3/5))))
+    upper_limit = min(f_cut_source, f_cut_temp)
+
+    return low_limit, upper_limit, f_cut_source, f_cut_temp
+
+
+def cumulative_trapz(f, g):
+    """ Prefix sums C_k = int_f0^f_k of the piecewise linear interpolant of g (along the last axis)
+    """
+    steps = np.diff(f) * (g[..., 1:] + g[..., :-1]) / 2
+    C = np.zeros(g.shape, dtype = np.result_type(g, float))
+    C[..., 1:] = np.cumsum(steps, axis = -1)
+
+    return C
+
+def cumulative_at(f, g, C, f_eval):
+    '''int_f0^f_eval of the piecewise linear interpolant of g from its prefix sums C, exact between grid
+    points (f_eval is clipped to the grid).
+    '''
+    f_eval = np.clip(np.asarray(f_eval, dtype = float), f[0], f[-1])
+    k = np.clip(np.searchsorted(f, f_eval, side = 'right') - 1, 0, len(f) - 2)
+    h = f[k + 1] - f[k]
+    d = f_eval - f[k]
+
+    return C[..., k] + g[..., k] * d + (g[..., k + 1] - g[..., k]) * d**2 / (2 * h)
+
+
+class overlap_grid():
+    """ Inner products on a fixed frequency grid.
+
+    The lensed source, the template (at t_c = phi_c = 0) and 1/Sn are evaluated once on the grid. The
+    numerator and the two norms are then weighted sums, and (t_c, phi_c) only enter through the phase
+    exp(-i (2 pi f t_c - phi_c)) of the template, so no waveform is rebuilt inside the optimizer.
+
+    The prefix sums of the three integrands along the grid give the overlap of every (f_low, f_high) window
+    from one evaluation (window_overlap), and the share of the mismatch of every band (mismatch_profile).
+    """
+
+    def __init__(self, f, signal_source, signal_temp, psd = None, limits = None):
+        '''
+        Parameters
+        ----------
+        f : array
+            frequency grid
+        signal_source : array, complex
+            (lensed) source strain on the grid
+        signal_temp : array, complex
+            template strain on the grid evaluated at t_c = 0 and phi_c = 0
+        psd : array
+            noise curve on the grid (defaults to Sn(f))
+        limits : tuple
+            (low_limit, upper_limit, f_cut_source, f_cut_temp) as returned by limit(). Defaults to the whole grid.
+        '''
+        self.f = np.asarray(f, dtype = float)
+        self.signal_source = np.asarray(signal_source, dtype = np.complex128)
+        self.signal_temp = np.asarray(signal_temp, dtype = np.complex128)
+        self.psd = Sn(self.f) if psd is None else np.asarray(psd, dtype = float)
+
+        if limits is None:
+            limits = (self.f[0], self.f[-1], self.f[-1], self.f[-1])
+        self.limits = limits
+
+        self.weight_num, self.weight_source, self.weight_temp = grid_weights(self.f, self.psd, limits)
+        with np.errstate(divide = 'ignore'):
+            self.inv_psd = np.where(np.isinf(self.psd), 0., 1 / self.psd)
+
+        self.cross = self.weight_num * self.signal_source * np.conjugate(self.signal_temp)
+        self.norm_source = np.sum(self.weight_source * np.abs(self.signal_source)**2)
+        self.norm_temp = np.sum(self.weight_temp * np.abs(self.signal_temp)**2)
+
+    def inner(self, t_c, phi_c):
+        """ Complex numerator 4 int h_source conj(h_temp(t_c, phi_c)) / Sn df
+        """
+        return np.sum(self.cross * np.exp(-2j * np.pi * self.f * t_c)) * np.exp(1j * phi_c)
+
+    def overlap(self, x):
+        """ Drop-in replacement for the overlap(x) methods of the overlap classes (returns -overlap)
+        """
+        t_c = x[0]
+        phi_c = x[1]
+
+        num = np.real(self.inner(t_c, phi_c))
+        deno = np.sqrt(self.norm_source * self.norm_temp)
+        if num == 0:
+            overlap_temp = 0
+        else:
+            overlap_temp = num / deno
+
+        return -1 * overlap_temp
+
+    def overlap_batch(self, x):
+        '''-overlap of a population of candidates in one array computation.
+
+        Parameters
+        ----------
+        x : array
+            (t_c, phi_c) of the candidates, shape (2, n_candidates) (the convention of the vectorized
+            optimizers) or (2,)
+
+        Return
+        ----------
+        fun : array
+            -overlap, shape (n_candidates,) or scalar
+        '''
+        t_c, phi_c = np.asarray(x, dtype = float)
+        num = np.real(np.exp(1j * phi_c) * (np.exp(-2j * np.pi * np.multiply.outer(t_c, self.f)) @ self.cross))
+
+        return -1 * num / np.sqrt(self.norm_source * self.norm_temp)
+
+    def integrands(self, t_c, phi_c):
+        """ 4 s conj(h) / Sn, 4 |s|^2 / Sn and 4 |h|^2 / Sn on the grid, without the limits
+        """
+        temp = self.signal_temp * np.exp(1j * (2 * np.pi * self.f * t_c - phi_c))
+
+        return (4 * self.signal_source * np.conjugate(temp) * self.inv_psd, 4 * np.abs(self.signal_source)**2 * self.inv_psd,
+                4 * np.abs(temp)**2 * self.inv_psd)
+
+    def prefix_sums(self, t_c, phi_c):
+        '''prefix sums of the numerator and of the two norms along the grid, C(f_k) = int_f0^f_k.
+
+        Return
+        ----------
+        num, norm_source, norm_temp : array
+            num is complex
+        '''
+        return tuple(cumulative_trapz(self.f, g) for g in self.integrands(t_c, phi_c))
+
+    def window_overlap(self, f_low, f_high, x = None, maximize_phase = False):
+        '''overlap restricted to [f_low, f_high] for arrays of windows, from one set of prefix sums. As in the
+        full overlap the numerator stops at upper_limit and the norms at f_cut_source and f_cut_temp.
+
+        Parameters
+        ----------
+        f_low, f_high : array
+            windows (broadcast against each other)
+        x : array
+            (t_c, phi_c), defaults to the maximum over the whole band (maximize())
+        maximize_phase : bool
+            maximize phi_c in every window (|numerator| instead of its real part)
+
+        Return
+        ----------
+        overlap : array
+        '''
+        if x is None:
+            x = self.maximize().x
+        f_low, f_high = np.broadcast_arrays(np.asarray(f_low, dtype = float), np.asarray(f_high, dtype = float))
+        low_limit, upper_limit, f_cut_source, f_cut_temp = self.limits
+        f_low = np.maximum(f_low, low_limit)
+
+        values = []
+        for g, C, cut in zip(self.integrands(*x), self.prefix_sums(*x), [upper_limit, f_cut_source, f_cut_temp]):
+            high = np.maximum(np.minimum(f_high, cut), f_low)
+            values.append(cumulative_at(self.f, g, C, high) - cumulative_at(self.f, g, C, f_low))
+        num, norm_source, norm_temp = values
+
+        num = np.abs(num) if maximize_phase else np.real(num)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            overlap = np.where(num == 0, 0., num / np.sqrt(np.real(norm_source) * np.real(norm_temp)))
+
+        return overlap
+
+    def mismatch_profile(self, x = None, edges = None):
+        '''share of the mismatch 1 - overlap accumulated in every band.
+
+        With the normalised signals s = h_source / |h_source| and h = h_temp / |h_temp|,
+        1 - overlap = (<s, s> + <h, h>) / 2 - Re <s, h>, and the integrand of the right hand side is split
+        over the bands. The contributions add up to the mismatch of the whole band, negative ones mark the
+        bands that pull the overlap up.
+
+        Parameters
+        ----------
+        x : array
+            (t_c, phi_c), defaults to the maximum over the whole band
+        edges : array
+            band edges, defaults to the grid
+
+        Return
+        ----------
+        edges : array
+        contribution : array
+            len(edges) - 1 values
+        '''
+        if x is None:
+            x = self.maximize().x
+        edges = self.f if edges is None else np.asarray(edges, dtype = float)
+        low_limit, upper_limit, f_cut_source, f_cut_temp = self.limits
+
+        num, power_source, power_temp = self.integrands(*x)
+        density = []
+        for g, cut, scale in [(power_source, f_cut_source, 1 / (2 * self.norm_source)),
+                              (power_temp, f_cut_temp, 1 / (2 * self.norm_temp)),
+                              (-np.real(num), upper_limit, 1 / np.sqrt(self.norm_source * self.norm_temp))]:
+            C = cumulative_trapz(self.f, g)
+            high = np.clip(edges, low_limit, cut)
+            density.append(scale * np.diff(cumulative_at(self.f, g, C, high)))
+
+        return edges, np.real(np.sum(density, axis = 0))
+
+    def maximize(self, bounds = [[-0.2, 0.2], [-np.pi, np.pi]], oversample = 4):
+        '''maximizes the overlap over (t_c, phi_c) with fft_maximize() instead of dual_annealing. Only the t_c
+        bounds are used, phi_c is maximized analytically over the whole circle.
+
+        Return
+        ----------
+        res : OptimizeResult
+            same fields as the dual_annealing result used by the drivers (fun = -overlap, x = [t_c, phi_c])
+        '''
+        t_c, phi_c, num_max = fft_maximize(self.cross, self.f, tc_bounds = bounds[0], oversample = oversample)
+        overlap_max = num_max / np.sqrt(self.norm_source * self.norm_temp)
+
+        return OptimizeResult(x = np.array([t_c, phi_c]), fun = -1 * overlap_max, nfev = 1, nit = 1, success = True,
+                              message = ['FFT maximization over t_c'])
+
+
+def lensed_strains(overlap_obj, amp_fact, amp_fact_temp = None, vectorized = False):
+    '''source and template strains of one of the overlap classes, times their amplification factors.
+
+    Parameters
+    ----------
+    overlap_obj : object
+        instance of one of the overlap classes (overlap_sis, overlap_sie, overlap_dual_ann_lensing, ...)
+    amp_fact : callable
+        amplification factor of the source, e.g. overlap_obj.F_source_pm (None for an unlensed source)
+    amp_fact_temp : callable
+        amplification factor of the template (lensed templates only)
+    vectorized : bool
+        set to True if the amplification factors accept a frequency array. Otherwise they are called once per
+        frequency.
+
+    Return
+    ----------
+    signal_source : callable
+        signal_source(f), the lensed source on the frequencies f
+    signal_temp : callable
+        signal_temp(f, t_c = 0., phi_c = 0.), the template (t_c and phi_c may broadcast against f)
+    '''
+    def evaluate(func, f):
+        if vectorized:
+            return np.broadcast_to(func(f), np.shape(f))
+        return np.vectorize(func, otypes = [np.complex128])(f)
+
+    def signal_source(f):
+        hI_source = strain(f, overlap_obj.theta_s_source, overlap_obj.phi_s_source, overlap_obj.theta_l_source,
+                           overlap_obj.phi_l_source, overlap_obj.mcz_source, overlap_obj.dist_source,
+                           overlap_obj.eta_source, overlap_obj.t0, overlap_obj.phi_0)
+        if amp_fact is None:
+            return hI_source
+        return hI_source * evaluate(amp_fact, f)
+
+    def signal_temp(f, t_c = 0., phi_c = 0.):
+        hI_temp = strain(f, overlap_obj.theta_s_temp, overlap_obj.phi_s_temp, overlap_obj.theta_l_temp,
+                         overlap_obj.phi_l_temp, overlap_obj.mcz_temp, overlap_obj.dist_temp, overlap_obj.eta_temp,
+                         t_c, phi_c)
+        if amp_fact_temp is None:
+            return hI_temp
+        return hI_temp * evaluate(amp_fact_temp, f)
+
+    return signal_source, signal_temp
+
+def from_overlap(overlap_obj, amp_fact, amp_fact_temp = None, df = 1/16, vectorized = False, f = None):
+    '''builds an overlap_grid from one of the overlap classes.
+
+    Parameters
+    ----------
+    overlap_obj : object
+        instance of one of the overlap classes (overlap_sis, overlap_sie, overlap_dual_ann_lensing, ...)
+    amp_fact : callable
+        amplification factor of the source, e.g. overlap_obj.F_source_pm
+    amp_fact_temp : callable
+        amplification factor of the template (lensed templates only)
+    df : float
+        frequency resolution of the grid
+    vectorized : bool
+        set to True if amp_fact already accepts a frequency array. Otherwise it is called once per grid point.
+    f : array
+        frequency grid to use instead of the uniform one, e.g. from multiband_grid()
+
+    Return
+    ----------
+    engine : overlap_grid
+    '''
+    limits = overlap_obj.limit(overlap_obj.params_source, overlap_obj.params_temp)
+    low_limit, upper_limit, f_cut_source, f_cut_temp = limits
+    if f is None:
+        f = np.arange(low_limit, max(f_cut_source, f_cut_temp) + df, df)
+
+    signal_source, signal_temp = lensed_strains(overlap_obj, amp_fact, amp_fact_temp = amp_fact_temp,
+                                                vectorized = vectorized)
+
+    return overlap_grid(f, signal_source(f), signal_temp(f), limits = limits)
@@ -0,0 +1,320 @@
+"""
+Batched lens parameter sweeps.
+
+Between two points of a M_lz, y or SIE radius sweep only the amplification factor changes. The unlensed
+source, the template and 1/Sn are evaluated once, the amplification factors of all the points are stacked
+into a (n_lens x n_freq) matrix, and all the overlaps come out of one matrix-vector product (norms) and one
+batched FFT (numerator maximized over t_c and phi_c).
+
+For searches the FFT does not cover, overlap_stack stacks the overlap_grid engines of the points and
+lockstep_sweep advances the optimizers of all the points together (population.lockstep_optimize): the
+candidates of every point are evaluated as one (points x candidates x frequency) array instead of one
+process per point.
+"""
+
+import time
+import numpy as np
+import pandas as pd
+from gw_lens_dir.inner_product import strain, Sn, limit, grid_weights, fft_maximize, multiband_grid
+from gw_lens_dir import amplification
+from gw_lens_dir.amplification_table import F_table
+from gw_lens_dir.transition_table import F_hybrid_sis
+from gw_lens_dir.amp_fact_cache import cached_F
+from gw_lens_dir.population import lockstep_optimize
+from gw_lens_dir.maximize import BOUNDS, bound_hits, widen
+
+def amp_fact_matrix(f, lens, M_lz = None, y = None, mu = None, td = None, cache = None):
+    '''stacks the amplification factors of a sweep.
+
+    Parameters
+    ----------
+    f : array
+        frequency grid
+    lens : str
+        'pm', 'sis' (wave optics), 'pm_table', 'sis_table' (wave optics interpolated from the F(w, y) tables),
+        'pm_geo', 'sis_geo' (geometrical optics), 'sis_hybrid' (wave optics below the transition frequency and
+        geometrical optics above it, as in overlap_sis) or 'sie'
+    M_lz, y : array
+        lens masses and source positions of the sweep (broadcast against each other)
+    mu, td : array
+        (n_lens, 4) magnifications and time delays of the SIE flux table rows
+    cache : amp_fact_cache
+        on-disk cache of the F arrays (amp_fact_cache.py), shared with other processes and runs
+
+    Return
+    ----------
+    F_matrix : array, complex
+        shape (n_lens, n_freq)
+    '''
+    if lens == 'sie':
+        return np.array([amplification.F_sie(f, mu_row, td_row) for mu_row, td_row in zip(mu, td)])
+
+    amp_fact = {
+        'pm': amplification.F_pm,
+        'sis': amplification.F_sis,
+        'pm_table': lambda f, M_lz, y: F_table(f, M_lz, y, lens = 'pm'),
+        'sis_table': lambda f, M_lz, y: F_table(f, M_lz, y, lens = 'sis'),
+        'pm_geo': amplification.F_geo_pm,
+        'sis_geo': amplification.F_geo_sis,
+        'sis_hybrid': F_hybrid_sis,
+    }[lens]
+    M_lz, y = np.broadcast_arrays(np.atleast_1d(M_lz), np.atleast_1d(y))
+
+    if cache is not None:
+        return np.array([cached_F(lens, amp_fact, f, M_lz_val, y_val, cache = cache) for M_lz_val, y_val in zip(M_lz, y)])
+
+    return np.array([amp_fact(f, M_lz_val, y_val) for M_lz_val, y_val in zip(M_lz, y)])
+
+def sweep_overlaps(f, hI_source, hI_temp, F_matrix, psd = None, limits = None, tc_bounds = (-0.2, 0.2), chunk = 64):
+    '''maximized overlaps of every row of F_matrix.
+
+    Parameters
+    ----------
+    f : array
+        frequency grid, uniform or from multiband_grid()
+    hI_source : array, complex
+        unlensed source strain
+    hI_temp : array, complex
+        template strain at t_c = phi_c = 0
+    F_matrix : array, complex
+        (n_lens, n_freq) amplification factors of the source
+    psd : array
+        noise curve on the grid (defaults to Sn(f))
+    limits : tuple
+        (low_limit, upper_limit, f_cut_source, f_cut_temp)
+    tc_bounds : tuple
+        t_c search window
+    chunk : int
+        number of rows per batched FFT (bounds the memory)
+
+    Return
+    ----------
+    overlap, t_c, phi_c : array
+    '''
+    f = np.asarray(f, dtype = float)
+    F_matrix = np.atleast_2d(F_matrix)
+    psd = Sn(f) if psd is None else psd
+    if limits is None:
+        limits = (f[0], f[-1], f[-1], f[-1])
+
+    weight_num, weight_source, weight_temp = grid_weights(f, psd, limits)
+
+    # everything that does not depend on the lens
+    cross_unlensed = weight_num * hI_source * np.conjugate(hI_temp)
+    power_source = weight_source * np.abs(hI_source)**2
+    norm_temp = np.sum(weight_temp * np.abs(hI_temp)**2)
+
+    norm_source = np.abs(F_matrix)**2 @ power_source
+
+    t_c = np.zeros(len(F_matrix))
+    phi_c = np.zeros(len(F_matrix))
+    num_max = np.zeros(len(F_matrix))
+    for start in range(0, len(F_matrix), chunk):
+        rows = slice(start, start + chunk)
+        t_c[rows], phi_c[rows], num_max[rows] = fft_maximize(F_matrix[rows] * cross_unlensed, f, tc_bounds = tc_bounds)
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        overlap = np.where(num_max == 0, 0., num_max / np.sqrt(norm_source * norm_temp))
+
+    return overlap, t_c, phi_c
+
+def sweep(params_source, params_temp, lens, M_lz = None, y = None, mu = None, td = None, df = 1/16, tc_bounds = (-0.2, 0.2),
+          cache = None, multiband = False, low_limit = 20, psd = Sn):
+    '''sweep over lens parameters starting from the parameter dictionaries used by the drivers
+    (initial_params_source, initial_params_template).
+
+    Parameters
+    ----------
+    multiband : bool
+        use multiband_grid() (resolution from the chirp time and the largest lens delay) instead of the
+        uniform grid of spacing df
+    low_limit : float
+        lower limit of the integrals
+    psd : callable
+        noise curve
+
+    Return
+    ----------
+    df_res : DataFrame
+        one row per lens, with the lens parameters, the maximized overlap and the optimal (t_c, phi_c)
+    '''
+    limits = limit(params_source['mcz_source'], params_source['eta_source'], params_temp['mcz_temp'], params_temp['eta_temp'],
+                   low_limit = low_limit)
+    f_high = max(limits[2], limits[3])
+    if multiband:
+        if lens == 'sie':
+            td_max = np.max(np.ptp(np.asarray(td, dtype = float), axis = -1))
+        else:
+            M_lz_arr, y_arr = np.broadcast_arrays(np.atleast_1d(M_lz), np.atleast_1d(y))
+            td_max = np.max(amplification.time_del(M_lz_arr, y_arr, lens = lens.split('_')[0]))
+        f = multiband_grid(limits[0], f_high, min(params_source['mcz_source'], params_temp['mcz_temp']), td = td_max,
+                           tc_window = tc_bounds[1] - tc_bounds[0])
+    else:
+        f = np.arange(limits[0], f_high + df, df)
+
+    hI_source = strain(
+        f,
+        params_source['theta_s_source'],
+        params_source['phi_s_source'],
+        params_source['theta_l_source'],
+        params_source['phi_l_source'],
+        params_source['mcz_source'],
+        params_source['dist_source'],
+        params_source['eta_source'],
+        params_source['t0'],
+        params_source['phi_0']
+    )
+
+    hI_temp = strain(
+        f,
+        params_temp['theta_s_temp'],
+        params_temp['phi_s_temp'],
+        params_temp['theta_l_temp'],
+        params_temp['phi_l_temp'],
+        params_temp['mcz_temp'],
+        params_temp['dist_temp'],
+        params_temp['eta_temp'],
+        0.,
+        0.
+    )
+
+    F_matrix = amp_fact_matrix(f, lens, M_lz = M_lz, y = y, mu = mu, td = td, cache = cache)
+    overlap, t_c, phi_c = sweep_overlaps(f, hI_source, hI_temp, F_matrix, psd = psd(f), limits = limits, tc_bounds = tc_bounds)
+
+    if lens == 'sie':
+        df_res = pd.DataFrame({'mu': list(np.asarray(mu)), 'td': list(np.asarray(td))})
+    else:
+        M_lz, y = np.broadcast_arrays(np.atleast_1d(M_lz), np.atleast_1d(y))
+        df_res = pd.DataFrame({'M_lz': M_lz, 'y': y})
+    df_res['overlap'] = overlap
+    df_res['tc'] = t_c
+    df_res['phi_c'] = phi_c
+
+    return df_res
+
+
+class overlap_stack():
+    """ overlap_grid engines of the points of a sweep on a shared frequency grid, stacked into a
+    (n_points x n_freq) cross spectrum.
+    """
+
+    def __init__(self, engines, max_elements = 2**22):
+        '''
+        Parameters
+        ----------
+        engines : list
+            overlap_grid of every point, e.g. from inner_product.from_overlap()
+        max_elements : int
+            largest (points x candidates x frequency) block evaluated at once on a non-uniform grid (bounds the
+            memory)
+        '''
+        self.f = engines[0].f
+        if any(not np.array_equal(engine.f, self.f) for engine in engines):
+            raise ValueError("the engines of a stack have to share the frequency grid")
+        self.cross = np.array([engine.cross for engine in engines])
+        self.deno = np.sqrt(np.array([engine.norm_source * engine.norm_temp for engine in engines]))
+        self.max_elements = max_elements
+
+        # on a uniform grid f_k = f_0 + (m B + b) df, and exp(-2 pi i t f_k) is the product of a phase over the
+        # blocks m and one within a block b: 2 sqrt(n_freq) complex exponentials per candidate instead of n_freq
+        step = np.diff(self.f)
+        self.uniform = len(self.f) > 1 and np.allclose(step, step[0], rtol = 1e-9, atol = 0)
+        if self.uniform:
+            n_in = int(np.ceil(np.sqrt(len(self.f))))
+            n_block = -(-len(self.f) // n_in)
+            self.f_block = self.f[0] + n_in * step[0] * np.arange(n_block)
+            self.f_in = step[0] * np.arange(n_in)
+            cross = np.zeros((len(self.cross), n_block * n_in), dtype = np.complex128)
+            cross[:, :len(self.f)] = self.cross
+            self.cross_blocks = np.swapaxes(cross.reshape(len(self.cross), n_block, n_in), 1, 2)
+
+    def overlap_batch(self, x, points = None):
+        '''-overlap of the candidates of the points.
+
+        Parameters
+        ----------
+        x : array
+            (t_c, phi_c) of the candidates, shape (len(points), 2, n_candidates)
+        points : array
+            indices of the points (all of them by default)
+
+        Return
+        ----------
+        fun : array
+            shape (len(points), n_candidates)
+        '''
+        x = np.asarray(x, dtype = float)
+        points = np.arange(len(self.cross)) if points is None else np.asarray(points)
+        t_c, phi_c = x[:, 0], x[:, 1]
+
+        if self.uniform:
+            phase_in = np.exp(-2j * np.pi * t_c[..., None] * self.f_in)
+            phase_block = np.exp(-2j * np.pi * t_c[..., None] * self.f_block)
+            inner = np.sum(phase_block * np.matmul(phase_in, self.cross_blocks[points]), axis = -1)
+        else:
+            inner = np.zeros(t_c.shape, dtype = np.complex128)
+            rows = max(1, self.max_elements // (t_c.shape[1] * len(self.f)))
+            for start in range(0, len(points), rows):
+                block = slice(start, start + rows)
+                phase = np.exp(-2j * np.pi * t_c[block, :, None] * self.f)
+                inner[block] = np.einsum('psf,pf->ps', phase, self.cross[points[block]])
+        num = np.real(np.exp(1j * phi_c) * inner)
+
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            return np.where(num == 0, 0., -1 * num / self.deno[points, None])
+
+def lockstep_sweep(engines, bounds = BOUNDS, seed = 42, maxiter = 100, x0 = None, expand = 2., max_expand = 3,
+                   max_bounds = None):
+    '''maximized overlaps of the points of a sweep, with the (t_c, phi_c) optimizers of all the points advanced
+    in lockstep. The points whose optimum sits on a t_c bound are searched again, together, in widened bounds
+    (see maximize.py).
+
+    Parameters
+    ----------
+    engines : list
+        overlap_grid of every point, on a shared frequency grid
+    bounds : list
+        (t_c, phi_c) bounds
+    seed, maxiter, x0 :
+        as in population.lockstep_optimize
+    expand, max_expand, max_bounds :
+        as in maximize.maximize_overlap
+
+    Return
+    ----------
+    df_res : DataFrame
+        one row per point: overlap, tc, phi_c, the number of generations and of objective evaluations, the
+        convergence flag, whether the optimum is still on a bound and how many times its bounds were widened.
+        df_res.attrs['time'] is the wall time of the sweep.
+    '''
+    start = time.time()
+    stack = overlap_stack(engines)
+    n_points = len(engines)
+    options = {'seed': seed, 'maxiter': maxiter, 'patience': 10, 'stall_tol': 1e-10}
+    res = lockstep_optimize(stack.overlap_batch, bounds, n_points, x0 = x0, **options)
+    x, fun, nit, nfev, converged = res.x, res.fun, res.nit, res.nfev, res.success
+
+    point_bounds = np.repeat(np.array(bounds, dtype = float)[None], n_points, axis = 0)
+    n_expand = np.zeros(n_points, dtype = int)
+    for retry in range(max_expand):
+        hits = bound_hits(x, point_bounds)
+        widened = widen(point_bounds, hits, expand = expand, max_bounds = max_bounds)
+        redo = np.flatnonzero(np.any(widened != point_bounds, axis = (1, 2)))
+        if len(redo) == 0:
+            break
+        # the points searched again share the smallest bounds that contain all their widened ones
+        shared = np.stack([np.min(widened[redo, :, 0], axis = 0), np.max(widened[redo, :, 1], axis = 0)], axis = -1)
+        res = lockstep_optimize(lambda X, points: stack.overlap_batch(X, redo[points]), shared, len(redo),
+                                x0 = x[redo], **options)
+        x[redo], fun[redo], converged[redo] = res.x, res.fun, res.success
+        nit[redo] += res.nit
+        nfev[redo] += res.nfev
+        point_bounds[redo] = shared
+        n_expand[redo] += 1
+
+    df_res = pd.DataFrame({'overlap': -fun, 'tc': x[:, 0], 'phi_c': x[:, 1], 'nit': nit, 'nfev': nfev,
+                           'converged': converged, 'on_bound': np.any(bound_hits(x, point_bounds) != 0, axis = 1),
+                           'n_expand': n_expand})
+    df_res.attrs['time'] = time.time() - start
+
+    return df_res
@@ -0,0 +1,124 @@
+"""
+Overlap maximization with diagnostics and automatic widening of the bounds.
+
+The drivers keep overlap_max.fun and overlap_max.x of the optimizer, and the t_c window is hard coded to
+[-0.2, 0.2] s. When the optimum sits on a t_c bound (a lens delay or a template offset larger than the window)
+the overlap is only the best one inside the window, with nothing to tell it apart from a converged result.
+
+maximize_overlap runs the optimizer, times it and checks the optimum against the bounds. The non-periodic
+parameters (t_c) whose optimum is on a bound get their window widened by a factor expand on that side, and
+the search is repeated from the previous optimum, up to max_expand times or until max_bounds. phi_c is
+periodic: an optimum at +-pi is not a bound hit. The population optimizers also stop early once the best
+overlap has stalled for patience generations.
+"""
+
+import time
+import numpy as np
+from gw_lens_dir.population import population_optimize
+
+BOUNDS = [[-0.2, 0.2], [-np.pi, np.pi]]
+
+def bound_hits(x, bounds, periodic = (False, True), rtol = 1e-3):
+    '''which bound every parameter of x sits on.
+
+    Parameters
+    ----------
+    x : array
+        optimum, shape (n_params,) or (n_points, n_params)
+    bounds : array
+        [lower, upper] of every parameter, shape (n_params, 2) or (n_points, n_params, 2)
+    periodic : tuple
+        parameters without a bound
+    rtol : float
+        distance to a bound, relative to the width of the window, under which x is on it
+
+    Return
+    ----------
+    hits : array
+        -1 (lower bound), 1 (upper bound) or 0, same shape as x
+    '''
+    x = np.asarray(x, dtype = float)
+    bounds = np.asarray(bounds, dtype = float)
+    margin = rtol * (bounds[..., 1] - bounds[..., 0])
+    hits = np.where(x <= bounds[..., 0] + margin, -1, 0) + np.where(x >= bounds[..., 1] - margin, 1, 0)
+
+    return np.where(np.asarray(periodic, dtype = bool), 0, hits)
+
+def widen(bounds, hits, expand = 2., max_bounds = None):
+    '''bounds with the side of every hit moved out so that the window is expand times wider.
+    '''
+    bounds = np.array(bounds, dtype = float)
+    width = bounds[..., 1] - bounds[..., 0]
+    bounds[..., 0] -= np.where(hits < 0, (expand - 1) * width, 0)
+    bounds[..., 1] += np.where(hits > 0, (expand - 1) * width, 0)
+    if max_bounds is not None:
+        max_bounds = np.asarray(max_bounds, dtype = float)
+        bounds[..., 0] = np.maximum(bounds[..., 0], max_bounds[..., 0])
+        bounds[..., 1] = np.minimum(bounds[..., 1], max_bounds[..., 1])
+
+    return bounds
+
+def maximize_overlap(objective, bounds = BOUNDS, optimizer = population_optimize, periodic = (False, True), expand = 2.,
+                     max_expand = 3, max_bounds = None, rtol = 1e-3, **options):
+    '''maximizes the overlap, widening the bounds the optimum sits on.
+
+    Parameters
+    ----------
+    objective : callable
+        -overlap, e.g. overlap(x) of the overlap classes
+    bounds : list
+        initial [lower, upper] of every parameter
+    optimizer : callable
+        optimizer(objective, bounds = bounds, x0 = x0, **options) returns an OptimizeResult, e.g.
+        population_optimize or scipy's dual_annealing
+    periodic : tuple
+        parameters that are never widened (phi_c)
+    expand : float
+        factor by which the window of a parameter on a bound is widened
+    max_expand : int
+        largest number of retries
+    max_bounds : list
+        widest bounds, e.g. the t_c window an overlap_grid or relative_binning engine resolves
+    rtol : float
+        distance to a bound, relative to the window, under which the optimum is on it
+    options :
+        passed to the optimizer (seed, maxiter, ...). For population_optimize the early stop defaults to
+        patience = 10, stall_tol = 1e-10
+
+    Return
+    ----------
+    res : OptimizeResult
+        x, fun, nfev, nit and success of the last search, and
+        overlap : -fun
+        time : wall time of all the searches
+        on_bound : the optimum is still on a bound after the retries
+        bounds : bounds of the last search
+        n_expand : number of times the bounds were widened
+    '''
+    if optimizer is population_optimize:
+        options.setdefault('patience', 10)
+        options.setdefault('stall_tol', 1e-10)
+    bounds = np.array(bounds, dtype = float)
+    x0 = options.pop('x0', None)
+
+    start = time.time()
+    nfev, n_expand = 0, 0
+    while True:
+        res = optimizer(objective, bounds = bounds, x0 = x0, **options)
+        nfev += res.nfev
+        hits = bound_hits(res.x, bounds, periodic = periodic, rtol = rtol)
+        widened = widen(bounds, hits, expand = expand, max_bounds = max_bounds)
+        if not np.any(hits) or n_expand == max_expand or np.array_equal(widened, bounds):
+            break
+        bounds, x0 = widened, res.x
+        n_expand += 1
+
+    res.overlap = -res.fun
+    res.nfev = nfev
+    res.time = time.time() - start
+    res.success = bool(res.get('success', True))
+    res.on_bound = bool(np.any(hits))
+    res.bounds = bounds
+    res.n_expand = n_expand
+
+    return res
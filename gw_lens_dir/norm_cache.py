@@ -0,0 +1,101 @@
+import numpy as np
+from scipy.integrate import quad
+
+
+class norm_cache():
+    """ Cache for the norms (denominators) of the overlap.
+
+    The norms do not depend on (t_c, phi_c), so they only have to be integrated once per source or template
+    and can be reused by every optimizer step and every grid point of a sweep that shares them.
+    """
+
+    def __init__(self):
+
+        self.norms = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, func):
+        '''returns the cached value for key, calling func() to compute it on a miss.
+        '''
+        if key in self.norms:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.norms[key] = func()
+
+        return self.norms[key]
+
+    def stats(self):
+        """ hit and miss counts, to check the cache is actually used
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.norms)}
+
+    def clear(self):
+
+        self.norms.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Cache shared by all the overlap classes in a run
+shared_norm_cache = norm_cache()
+
+def _freeze(params):
+    """ hashable form of a parameter dictionary
+    """
+    return tuple(sorted((key, float(np.real(value))) for key, value in params.items()))
+
+def frozen_params(overlap_obj):
+    '''(params_source, params_temp) of overlap_obj, frozen the first time the object is keyed.
+
+    The integrands read the attributes copied from the parameter dictionaries at __init__, while the drivers
+    reuse and mutate the same dictionaries for the next grid point, so an object used after that would
+    otherwise be keyed with the parameters of another point.
+    '''
+    if '_frozen_params' not in vars(overlap_obj):
+        overlap_obj._frozen_params = (_freeze(overlap_obj.params_source), _freeze(overlap_obj.params_temp))
+
+    return overlap_obj._frozen_params
+
+def norm_key(overlap_obj, which, low, high, integrand_name = ''):
+    '''identity of a norm.
+
+    Parameters
+    ----------
+    overlap_obj : object
+        instance of one of the overlap classes
+    which : str
+        'source' for the (lensed) source norm, 'template' for the unlensed template norm and
+        'lensed_template' for templates that carry their own amplification factor
+    low, high : float
+        integration limits
+    integrand_name : str
+        name of the integrand (tells wave and geometrical optics sources apart)
+    '''
+    model = type(overlap_obj).__module__ + '.' + type(overlap_obj).__qualname__
+    params_source, params_temp = frozen_params(overlap_obj)
+
+    if which == 'source':
+        identity = (model, integrand_name, params_source)
+    elif which == 'template':
+        # unlensed templates are the same strain() in every class
+        identity = (params_temp,)
+    elif which == 'lensed_template':
+        identity = (model, integrand_name, params_source, params_temp)
+    else:
+        raise ValueError(f"unknown norm type {which}")
+
+    return (which,) + identity + (float(low), float(high))
+
+def cached_norm(overlap_obj, integrand, low, high, args, which = 'source', cache = shared_norm_cache):
+    '''quad() of a norm integrand, computed once per source/template and limits.
+
+    Return
+    ----------
+    norm_val : float
+        same value as quad(integrand, low, high, args = args)[0]
+    '''
+    key = norm_key(overlap_obj, which, low, high, integrand.__name__)
+
+    return cache.get(key, lambda: quad(integrand, low, high, args = args)[0])
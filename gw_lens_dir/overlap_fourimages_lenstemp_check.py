@@ -14,6 +14,7 @@ import heapq
 import matplotlib.pyplot as plt
 
 from sqlalchemy import over
+from gw_lens_dir.norm_cache import cached_norm
 
 dirName = '/Users/saifali/Desktop/gwlensing/SIE_glafic/data/'
 
@@ -380,18 +381,22 @@ class overlap_sie_check():
             args = (t_c, phi_c)
             )
 
-        deno_temp_1, deno_temp_err_1 = quad(
+        deno_temp_1 = cached_norm(
+            self,
             self.integrand_2,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[2], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[2],
+            args = (t_c, phi_c),
+            which = 'source'
         )
         
-        deno_temp_2, deno_temp_err_2 = quad(
+        deno_temp_2 = cached_norm(
+            self,
             self.integrand_3,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[3], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[3],
+            args = (t_c, phi_c),
+            which = 'lensed_template'
         )
         
         num = 4 * np.real(num_temp)
@@ -7,6 +7,8 @@ import multiprocessing
 import time
 import pickle
 import csv
+from gw_lens_dir.norm_cache import cached_norm
+from gw_lens_dir.geo_overlap import geo_sweep, images_flux
 #from gwsim.analysis.overlap_optimize import strain
 
 class overlap_dual_ann_lensing():
@@ -262,18 +264,22 @@ class overlap_dual_ann_lensing():
             self.limit(self.params_source, self.params_temp)[1], 
             args = (t_c, phi_c))
 
-        deno_temp_1, deno_temp_err_1 = quad(
+        deno_temp_1 = cached_norm(
+            self,
             self.integrand_2,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[2], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[2],
+            args = (t_c, phi_c),
+            which = 'source'
         )
 
-        deno_temp_2, deno_temp_err_2 = quad(
+        deno_temp_2 = cached_norm(
+            self,
             self.integrand_3,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[3], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[3],
+            args = (t_c, phi_c),
+            which = 'template'
         )
         num = 4 * np.real(num_temp)
         deno = np.sqrt((4 * np.real(deno_temp_1)) * (4 * np.real(deno_temp_2)))
@@ -320,40 +326,23 @@ initial_params_template = {
     #'phi_c' : 0.0,
 }
 
-def overlap_multiprocessed_lensing(td_range_source, return_dict):
-
-    bnds = [[-0.2, 0.2], [-np.pi, np.pi]]
-    params_source = initial_params_source
-    params_source['td'] = td_range_source
-    overlap_optimized = overlap_dual_ann_lensing(params_source = params_source, params_temp = initial_params_template)
-    overlap_max = dual_annealing(overlap_optimized.overlap, bounds = bnds, seed = 42)
-
-    return_dict[td_range_source] = [overlap_max.fun, overlap_max.x[0], overlap_max.x[1]]
-    
 if __name__ == "__main__":
 
     datPath = "/Users/saifali/Desktop/gwlensing/data/"
     #start = time.time()
     start = time.strftime("%H%M%S")
-    manager = multiprocessing.Manager()
-    return_dict = manager.dict()
-    processes = []
     
     td_range = np.linspace(0.001, 0.2, 20)
     #I_range = np.linspace(0.1, 1, 20)
 
-    for td_range_source in td_range:
-        process = multiprocessing.Process(target = overlap_multiprocessed_lensing, args=(td_range_source, return_dict))
-        processes.append(process)
-
-        process.start()
-    
-    for proc in processes:
-        proc.join()
+    # Two images with fixed flux ratio: every time delay is a shifted copy of the same unlensed
+    # correlation, so the whole td_range costs one correlation (see geo_overlap.py).
+    images = [images_flux(initial_params_source['flux_ratio'], td) for td in td_range]
+    df_res = geo_sweep(initial_params_source, initial_params_template, images)
 
     w = csv.writer(open(datPath + "overlap_lensing_td_I=0.4_mcz=18.79.csv", "w"))
-    for key, value in return_dict.items():
-        w.writerow([key, value])
+    for i in range(len(df_res)):
+        w.writerow([td_range[i], [-1 * df_res['overlap'][i], df_res['tc'][i], df_res['phi_c'][i]]])
     
     print(f'start time: {start}')
 
@@ -7,6 +7,11 @@ import multiprocessing
 import time
 import pickle
 import csv
+from gw_lens_dir.norm_cache import cached_norm
+from gw_lens_dir.maximize import maximize_overlap
+from gw_lens_dir import amplification
+from gw_lens_dir.inner_product import from_overlap as grid_from_overlap
+from gw_lens_dir.lens_sweep import lockstep_sweep
 #from gwsim.analysis.overlap_optimize import strain
 
 class overlap_dual_ann_lensing_geo_wave():
@@ -204,17 +209,8 @@ class overlap_dual_ann_lensing_geo_wave():
         F_val : float, complex
             Amplification factor for point mass
         '''
-
-        self.w = 8 * np.pi * self.M_lz_source * f
-        x_m = 0.5 * (self.y_source + np.sqrt(self.y_source**2 + 4))
-        phi_m = np.power((x_m - self.y_source) , 2) / 2 - np.log(x_m)
-
-        first_term = np.exp(np.pi * self.w / 4 + 1j * (self.w / 2) * (np.log(self.w / 2) - 2 * phi_m)) 
-        second_term = sc.gamma(1 - 1j * (self.w / 2)) 
-        third_term = mp.hyp1f1(1j * self.w / 2, 1, 1j * (self.w / 2) * (self.y_source**2), maxterms = 10**6)
-
-        F_val_source = first_term * second_term * third_term
-        F_val_source_pm = np.complex128(F_val_source, dtype = np.complex128)
+        # double precision series / quasi geometrical optics instead of mp.hyp1f1 (amplification.F_pm_w)
+        F_val_source_pm = amplification.F_pm(f, self.M_lz_source, self.y_source)[()]
 
         return F_val_source_pm
     
@@ -321,18 +317,22 @@ class overlap_dual_ann_lensing_geo_wave():
             self.limit(self.params_source, self.params_temp)[1], 
             args = (t_c, phi_c))
 
-        deno_temp_1, deno_temp_err_1 = quad(
+        deno_temp_1 = cached_norm(
+            self,
             self.integrand_2,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[2], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[2],
+            args = (t_c, phi_c),
+            which = 'source'
         )
 
-        deno_temp_2, deno_temp_err_2 = quad(
+        deno_temp_2 = cached_norm(
+            self,
             self.integrand_3,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[3], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[3],
+            args = (t_c, phi_c),
+            which = 'template'
         )
         num = 4 * np.real(num_temp)
         deno = np.sqrt((4 * np.real(deno_temp_1)) * (4 * np.real(deno_temp_2)))
@@ -391,35 +391,38 @@ def overlap_multiprocessed_lensing(M_lz_source_range, return_dict):
     params_source = initial_params_source
     params_source['M_lz_source'] = M_lz_source_range
     overlap_optimized = overlap_dual_ann_lensing_geo_wave(params_source = params_source, params_temp = initial_params_template)
-    overlap_max = dual_annealing(overlap_optimized.overlap, bounds = bnds, seed = 42)
+    # t_c window widened when the optimum sits on it, the diagnostics are kept with the result
+    overlap_max = maximize_overlap(overlap_optimized.overlap, bounds = bnds, seed = 42)
 
-    return_dict[M_lz_source_range] = [overlap_max.fun, overlap_max.x[0], overlap_max.x[1]]
+    return_dict[M_lz_source_range] = [overlap_max.fun, overlap_max.x[0], overlap_max.x[1], overlap_max.nfev, overlap_max.success,
+                                    overlap_max.on_bound]
     
 if __name__ == "__main__":
 
     datPath = "/Users/saifali/Desktop/gwlensing/data/"
     #start = time.time()
     start = time.strftime("%H%M%S")
-    manager = multiprocessing.Manager()
-    return_dict = manager.dict()
-    processes = []
     
     #M_lz_source_range = np.linspace(0.5e1 * solar_mass, 1e2 * solar_mass, 10)
     M_lz_source_range = my_lin(0.5e1 * solar_mass, 1e4 * solar_mass, 20)
     #I_range = np.linspace(0.1, 1, 20)
 
+    # The optimizers of all the lens masses advance in lockstep, every generation is one batched overlap over
+    # (masses x candidates x frequency) (see lens_sweep.py). overlap_multiprocessed_lensing() still runs the
+    # one-process-per-point version.
+    engines = []
     for M_lz_source in M_lz_source_range:
-        process = multiprocessing.Process(target = overlap_multiprocessed_lensing, args=(M_lz_source, return_dict))
-        processes.append(process)
-
-        process.start()
-    
-    for proc in processes:
-        proc.join()
+        params_source = dict(initial_params_source)
+        params_source['M_lz_source'] = M_lz_source
+        overlap_optimized = overlap_dual_ann_lensing_geo_wave(params_source = params_source, params_temp = initial_params_template)
+        amp_fact = overlap_optimized.F_geo_source_pm if M_lz_source > 35 * solar_mass else overlap_optimized.F_source_pm
+        engines.append(grid_from_overlap(overlap_optimized, amp_fact, vectorized = True))
+    df_res = lockstep_sweep(engines)
 
     w = csv.writer(open(datPath + "overlap_lensing_ml_y=0.8_mcz=18.79.csv", "w"))
-    for key, value in return_dict.items():
-        w.writerow([key, value])
+    for i in range(len(df_res)):
+        w.writerow([M_lz_source_range[i], [-1 * df_res['overlap'][i], df_res['tc'][i], df_res['phi_c'][i], df_res['nfev'][i],
+                                           df_res['converged'][i], df_res['on_bound'][i]]])
     
     print(f'start time: {start}')
 
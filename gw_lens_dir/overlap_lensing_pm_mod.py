@@ -12,6 +12,9 @@ import scipy as sp
 from scipy.optimize import dual_annealing
 from scipy.signal import find_peaks, find_peaks_cwt
 from mpmath import *
+from gw_lens_dir.norm_cache import cached_norm
+from gw_lens_dir import amplification
+from gw_lens_dir.warm_sweep import warm_sweep
 mp.pretty = True 
 
 #from gwsim.analysis.overlap_optimize import strain
@@ -211,17 +214,8 @@ class overlap_sis():
         F_val : float, complex
             Amplification factor for point mass
         '''
-
-        self.w = 8 * np.pi * self.M_lz_source * f
-        x_m = 0.5 * (self.y_source + np.sqrt(self.y_source**2 + 4))
-        phi_m = np.power((x_m - self.y_source) , 2) / 2 - np.log(x_m)
-
-        first_term = np.exp(np.pi * self.w / 4 + 1j * (self.w / 2) * (np.log(self.w / 2) - 2 * phi_m)) 
-        second_term = sc.gamma(1 - 1j * (self.w / 2)) 
-        third_term = mp.hyp1f1(1j * self.w / 2, 1, 1j * (self.w / 2) * (self.y_source**2), maxterms = 10**6)
-
-        F_val_source = first_term * second_term * third_term
-        F_val_source_pm = np.complex128(F_val_source, dtype = np.complex128)
+        # double precision series / quasi geometrical optics instead of mp.hyp1f1 (amplification.F_pm_w)
+        F_val_source_pm = amplification.F_pm(f, self.M_lz_source, self.y_source)[()]
 
         return F_val_source_pm
     
@@ -366,18 +360,22 @@ class overlap_sis():
                 args = (t_c, phi_c)
             )
 
-            deno_temp_1, deno_temp_err_1 = sp.integrate.quad(
+            deno_temp_1 = cached_norm(
+                self,
                 self.integrand_deno_1_go,
-                self.limit(self.params_source, self.params_temp)[0], 
-                self.limit(self.params_source, self.params_temp)[2], 
-                args = (t_c, phi_c)
+                self.limit(self.params_source, self.params_temp)[0],
+                self.limit(self.params_source, self.params_temp)[2],
+                args = (t_c, phi_c),
+                which = 'source'
             )
 
-            deno_temp_2, deno_temp_err_2 = sp.integrate.quad(
+            deno_temp_2 = cached_norm(
+                self,
                 self.integrand_deno_2,
-                self.limit(self.params_source, self.params_temp)[0], 
-                self.limit(self.params_source, self.params_temp)[3], 
-                args = (t_c, phi_c)
+                self.limit(self.params_source, self.params_temp)[0],
+                self.limit(self.params_source, self.params_temp)[3],
+                args = (t_c, phi_c),
+                which = 'template'
             )
             num = 4 * np.real(num_temp)
             deno = np.sqrt((4 * np.real(deno_temp_1)) * (4 * np.real(deno_temp_2)))
@@ -393,18 +391,22 @@ class overlap_sis():
                 args = (t_c, phi_c)
             )
 
-            deno_temp_1, deno_temp_err_1 = sp.integrate.quad(
+            deno_temp_1 = cached_norm(
+                self,
                 self.integrand_deno_1_wo,
-                self.limit(self.params_source, self.params_temp)[0], 
-                self.limit(self.params_source, self.params_temp)[2], 
-                args = (t_c, phi_c)
+                self.limit(self.params_source, self.params_temp)[0],
+                self.limit(self.params_source, self.params_temp)[2],
+                args = (t_c, phi_c),
+                which = 'source'
             )
 
-            deno_temp_2, deno_temp_err_2 = sp.integrate.quad(
+            deno_temp_2 = cached_norm(
+                self,
                 self.integrand_deno_2,
-                self.limit(self.params_source, self.params_temp)[0], 
-                self.limit(self.params_source, self.params_temp)[3], 
-                args = (t_c, phi_c)
+                self.limit(self.params_source, self.params_temp)[0],
+                self.limit(self.params_source, self.params_temp)[3],
+                args = (t_c, phi_c),
+                which = 'template'
             )
             num = 4 * np.real(num_temp)
             deno = np.sqrt((4 * np.real(deno_temp_1)) * (4 * np.real(deno_temp_2)))
@@ -460,22 +462,18 @@ if __name__ == "__main__":
     #M_lz_source_range = np.logspace(2.5, 4, 20) * solar_mass
     #M_lz_source_range = my_lin(1e2 * solar_mass, 5e4 * solar_mass, 3)
     y_source_range = np.linspace(0.1, 1, 20)
-    df_res = pd.DataFrame(columns=('M_lz', 'overlap', 'tc', 'phi_c'))
-
-    for i in range(len(y_source_range)):
-
-        print(f"working lens mass is {y_source_range[i]}")
-
-        params_source = initial_params_source
-        params_template = initial_params_template
-        params_source['y_source'] = y_source_range[i] 
-        bnds = [[-0.2, 0.2], [-np.pi, np.pi]]
-        overlap_optimized = overlap_sis(params_source = params_source, params_temp = initial_params_template)
-        overlap_max = dual_annealing(overlap_optimized.overlap, bounds = bnds, seed = 42, maxiter = 100)  
-        df_res.loc[i] = [y_source_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1]]
-        end = time.time()
-        print(y_source_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1])
-        print(f'elapsed time: {(end - start)/60}')
+
+    def make_objective(y_source):
+        params_source = dict(initial_params_source)
+        params_source['y_source'] = y_source
+        return overlap_sis(params_source = params_source, params_temp = initial_params_template).overlap
+
+    # Each y starts a local search from the optimum of its neighbour, the global search only runs where the
+    # overlap jumps (see warm_sweep.py). The optimal (tc, phi_c) are saved with the overlaps and can seed a
+    # later sweep through warm_sweep(..., seeds = df_res).
+    df_res = warm_sweep(make_objective, y_source_range, names = ['y'])
+    end = time.time()
+    print(f'elapsed time: {(end - start)/60}')
     print(df_res)
     df_res.to_csv(datPath + "overlap_pm_y_ml=1e3.csv", index = False)
     
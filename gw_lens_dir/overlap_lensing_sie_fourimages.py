@@ -9,8 +9,12 @@ import multiprocessing
 import time
 import pickle
 import csv
+import argparse
 
 from sqlalchemy import over
+from gw_lens_dir.norm_cache import cached_norm
+from gw_lens_dir.maximize import maximize_overlap
+from gw_lens_dir.geo_overlap import geo_sweep, images_sie
 
 dirName = '/Users/saifali/Desktop/gwlensing/SIE_glafic/data/'
 
@@ -288,18 +292,22 @@ class overlap_sie():
             args = (t_c, phi_c)
             )
 
-        deno_temp_1, deno_temp_err_1 = quad(
+        deno_temp_1 = cached_norm(
+            self,
             self.integrand_2,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[2], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[2],
+            args = (t_c, phi_c),
+            which = 'source'
         )
         
-        deno_temp_2, deno_temp_err_2 = quad(
+        deno_temp_2 = cached_norm(
+            self,
             self.integrand_3,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[3], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[3],
+            args = (t_c, phi_c),
+            which = 'template'
         )
         
         num = 4 * np.real(num_temp)
@@ -356,9 +364,15 @@ def my_lin(lb, ub, steps, spacing = 3):
 
 # WITHOUT MULTIPROCESSING
 if __name__ == "__main__":
-    
-    
-    df_res = pd.DataFrame(columns=('source_x', 'overlap', 'tc', 'phi_c'))
+
+    # 'filon': the image cross terms are Filon integrals that stay exact for delays of days, and become the
+    # incoherent sum over the images once they cannot be resolved (see filon.py), all the positions in one pass.
+    # 'optimize': the overlap of overlap_sie maximized at every source position
+    parser = argparse.ArgumentParser(description = 'optimal overlaps of the SIE four image source positions')
+    parser.add_argument('--engine', choices = ['filon', 'optimize'], default = 'filon')
+    args = parser.parse_args()
+
+    df_res = pd.DataFrame(columns=('source_x', 'overlap', 'tc', 'phi_c', 'nfev', 'converged', 'on_bound', 'time'))
 
     datPath = "/Users/saifali/Desktop/gwlensing/data/"
 
@@ -368,22 +382,33 @@ if __name__ == "__main__":
     radius_range = np.array(df_data['source_x'])
     
     start = time.time()
-    for i in range(len(radius_range)):
-
-        print(f"working radius is {radius_range[i]}")
-
-        params_source = initial_params_source
-        params_template = initial_params_template
-        params_source['radius'] = radius_range[i] 
-        bnds = [[-0.2, 0.2], [-np.pi, np.pi]]
-        overlap_optimized = overlap_sie(params_source = params_source, params_temp = initial_params_template)
-        overlap_max = dual_annealing(overlap_optimized.overlap, bounds = bnds, maxiter = 100)
-        df_res.loc[i] = [radius_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1]]
-        print(radius_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1])
-        end = time.time()
-        print(f'elapsed time: {(end - start)/60}')
+
+    if args.engine == 'filon':
+        mu_table = df_data[['mu_1', 'mu_2', 'mu_3', 'mu_4']].to_numpy()
+        td_table = df_data[['td_1', 'td_2', 'td_3', 'td_4']].to_numpy()
+        images = [images_sie(mu_row, td_row) for mu_row, td_row in zip(mu_table, td_table)]
+        df_res = geo_sweep(initial_params_source, initial_params_template, images, method = 'filon')
+        df_res.insert(0, 'source_x', radius_range)
+    else:
+        for i in range(len(radius_range)):
+
+            print(f"working radius is {radius_range[i]}")
+
+            params_source = initial_params_source
+            params_template = initial_params_template
+            params_source['radius'] = radius_range[i] 
+            bnds = [[-0.2, 0.2], [-np.pi, np.pi]]
+            overlap_optimized = overlap_sie(params_source = params_source, params_temp = initial_params_template)
+            overlap_max = maximize_overlap(overlap_optimized.overlap, bounds = bnds, maxiter = 100)
+            df_res.loc[i] = [radius_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1], overlap_max.nfev,
+                             overlap_max.success, overlap_max.on_bound, overlap_max.time]
+            print(radius_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1])
+            end = time.time()
+            print(f'elapsed time: {(end - start)/60}')
     print(df_res)
-    df_res.to_csv(datPath + "overlap_lensing_sie_fourimages_sigma=6_theta=90.csv", index = False)
+    # the Filon overlaps are not those of the optimized overlap_sie and go to a file of their own
+    suffix = '_filon' if args.engine == 'filon' else ''
+    df_res.to_csv(datPath + f"overlap_lensing_sie_fourimages_sigma=6_theta=90{suffix}.csv", index = False)
     
 
 
@@ -10,8 +10,14 @@ import time
 import pickle
 import csv
 import heapq
+import argparse
+from functools import partial
 
 from sqlalchemy import over
+from gw_lens_dir.norm_cache import cached_norm
+from gw_lens_dir.geo_overlap import fit_sweep, images_sie
+from gw_lens_dir.warm_sweep import warm_sweep, global_search
+from gw_lens_dir.population import problem_key
 
 dirName = '/Users/saifali/Desktop/gwlensing/SIE_glafic/data/'
 
@@ -343,18 +349,22 @@ class overlap_sie():
             args = (t_c, phi_c)
             )
 
-        deno_temp_1, deno_temp_err_1 = quad(
+        deno_temp_1 = cached_norm(
+            self,
             self.integrand_2,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[2], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[2],
+            args = (t_c, phi_c),
+            which = 'source'
         )
         
-        deno_temp_2, deno_temp_err_2 = quad(
+        deno_temp_2 = cached_norm(
+            self,
             self.integrand_3,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[3], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[3],
+            args = (t_c, phi_c),
+            which = 'lensed_template'
         )
         
         num = 4 * np.real(num_temp)
@@ -411,8 +421,13 @@ def my_lin(lb, ub, steps, spacing = 3):
 
 # WITHOUT MULTIPROCESSING
 if __name__ == "__main__":
-    
-    
+
+    # 'fit': lensed templates fitted in one pass (fit_sweep), 'optimize': the overlap of overlap_sie maximized
+    # over (t_c, phi_c) at the source position of the original run, with the checkpointed global search
+    parser = argparse.ArgumentParser(description = 'overlaps of lensed templates with the SIE four image source')
+    parser.add_argument('--engine', choices = ['fit', 'optimize'], default = 'fit')
+    args = parser.parse_args()
+
     df_res = pd.DataFrame(columns=('source_x', 'overlap', 'tc', 'phi_c'))
 
     datPath = "/Users/saifali/Desktop/gwlensing/data/"
@@ -423,22 +438,36 @@ if __name__ == "__main__":
     radius_range = np.array(df_data['source_x'])
     
     start = time.time()
-    for i in range(6, 7):
-
-        print(f"working radius is {radius_range[i]}")
-
-        params_source = initial_params_source
-        params_template = initial_params_template
-        params_source['radius'] = radius_range[i] 
-        bnds = [[-0.2, 0.2], [-np.pi, np.pi]]
-        overlap_optimized = overlap_sie(params_source = params_source, params_temp = initial_params_template)
-        overlap_max = dual_annealing(overlap_optimized.overlap, bounds = bnds, maxiter = 800)
-        df_res.loc[i] = [radius_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1]]
-        print(radius_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1])
+
+    # Lensed templates fitted in one pass: the template is a sum of n_images shifted unlensed copies whose
+    # complex amplitudes are solved for, and only the delays are searched (see geo_overlap.py)
+    if args.engine == 'fit':
+        mu_table = df_data[['mu_1', 'mu_2', 'mu_3', 'mu_4']].to_numpy()
+        td_table = df_data[['td_1', 'td_2', 'td_3', 'td_4']].to_numpy()
+        images = [images_sie(mu_row, td_row) for mu_row, td_row in zip(mu_table, td_table)]
+        df_fit = fit_sweep(initial_params_source, initial_params_template, images, n_images = 2)
+        df_fit.insert(0, 'source_x', radius_range)
+        print(df_fit)
+        df_fit.to_csv(datPath + "overlap_lensing_sie_fourimages_sigma=6_theta=60_lenstemp_fit.csv", index = False)
+    else:
+        def make_objective(radius):
+            params_source = dict(initial_params_source)
+            params_source['radius'] = radius
+            return overlap_sie(params_source = params_source, params_temp = initial_params_template).overlap
+
+        # the single source position of the original run (radius_range[6]), with its global budget of
+        # maxiter = 800 and no fixed seed. More positions are warm started from each other, see warm_sweep.py
+        # The long global search is checkpointed every 5 minutes to a file named after the problem, and a
+        # preempted run started again resumes from it
+        key = problem_key('overlap_sie_lenstemp', dict(initial_params_source, radius = radius_range[6]),
+                          initial_params_template)
+        global_opt = partial(global_search, seed = None, maxiter = 800, checkpoint_key = key, checkpoint_interval = 300,
+                             checkpoint = dirName + f'overlap_sie_lenstemp_checkpoint_{key[:16]}.npz')
+        df_res = warm_sweep(make_objective, radius_range[6:7], names = ['source_x'], global_opt = global_opt)
         end = time.time()
         print(f'elapsed time: {(end - start)/60}')
-    print(df_res)
-    df_res.to_csv(datPath + "overlap_lensing_sie_fourimages_sigma=6_theta=60_lenstemp.csv", index = False)
+        print(df_res)
+        df_res.to_csv(datPath + "overlap_lensing_sie_fourimages_sigma=6_theta=60_lenstemp.csv", index = False)
     
 
 
@@ -9,6 +9,8 @@ import multiprocessing
 import time
 import pickle
 import csv
+from gw_lens_dir.norm_cache import cached_norm
+from gw_lens_dir.maximize import maximize_overlap
 
 dirName = '/Users/saifali/Desktop/gwlensing/SIE_glafic/data/'
 
@@ -279,18 +281,22 @@ class overlap_sie():
             args = (t_c, phi_c)
             )
 
-        deno_temp_1, deno_temp_err_1 = quad(
+        deno_temp_1 = cached_norm(
+            self,
             self.integrand_2,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[2], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[2],
+            args = (t_c, phi_c),
+            which = 'source'
         )
         
-        deno_temp_2, deno_temp_err_2 = quad(
+        deno_temp_2 = cached_norm(
+            self,
             self.integrand_3,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[3], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[3],
+            args = (t_c, phi_c),
+            which = 'template'
         )
         
         num = 4 * np.real(num_temp)
@@ -345,7 +351,7 @@ def my_lin(lb, ub, steps, spacing = 3):
 # WITHOUT MULTIPROCESSING
 if __name__ == "__main__":
     
-    df_res = pd.DataFrame(columns=('source_x', 'overlap', 'tc', 'phi_c'))
+    df_res = pd.DataFrame(columns=('source_x', 'overlap', 'tc', 'phi_c', 'nfev', 'converged', 'on_bound', 'time'))
 
     datPath = "/Users/saifali/Desktop/gwlensing/data/"
 
@@ -364,8 +370,9 @@ if __name__ == "__main__":
         params_source['radius'] = radius_range[i] 
         bnds = [[-0.2, 0.2], [-np.pi, np.pi]]
         overlap_optimized = overlap_sie(params_source = params_source, params_temp = initial_params_template)
-        overlap_max = dual_annealing(overlap_optimized.overlap, bounds = bnds, maxiter = 100)
-        df_res.loc[i] = [radius_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1]]
+        overlap_max = maximize_overlap(overlap_optimized.overlap, bounds = bnds, maxiter = 100)
+        df_res.loc[i] = [radius_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1], overlap_max.nfev,
+                         overlap_max.success, overlap_max.on_bound, overlap_max.time]
         end = time.time()
         print(f'elapsed time: {(end - start)/60}')
     print(df_res)
@@ -5,11 +5,13 @@ import mpmath as mp
 import pandas as pd
 from scipy.integrate import quad
 from scipy.optimize import basinhopping
-from scipy.optimize import dual_annealing
 import multiprocessing
 import time
 import pickle
 import csv
+from gw_lens_dir.norm_cache import cached_norm
+from gw_lens_dir.maximize import maximize_overlap
+from gw_lens_dir.population import problem_key
 
 dirName = '/Users/saifali/Desktop/gwlensing/SIE_glafic/data/'
 
@@ -295,18 +297,22 @@ class overlap_sie_basin():
             args = (t_c, phi_c)
             )
 
-        deno_temp_1, deno_temp_err_1 = quad(
+        deno_temp_1 = cached_norm(
+            self,
             self.integrand_2,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[2], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[2],
+            args = (t_c, phi_c),
+            which = 'source'
         )
         
-        deno_temp_2, deno_temp_err_2 = quad(
+        deno_temp_2 = cached_norm(
+            self,
             self.integrand_3,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[3], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[3],
+            args = (t_c, phi_c),
+            which = 'template'
         )
         
         num = 4 * np.real(num_temp)
@@ -364,8 +370,13 @@ start = time.time()
 bnds = [[-0.2, 0.2], [-np.pi, np.pi]]
 overlap_optimized = overlap_sie_basin(params_source = initial_params_source, params_temp = initial_params_template)
 #overlap_max = basinhopping(overlap_optimized.overlap, x0 = [0., 0.], seed = 42, disp = True, niter = 10)
-overlap_max = dual_annealing(overlap_optimized.overlap, bounds = bnds, maxiter = 10)
-print(overlap_max.fun, overlap_max.x[0], overlap_max.x[1])
+# the evolution is checkpointed every 5 minutes: a preempted run started again resumes from the file. The file
+# is named after the source and template parameters, so runs of other parameters neither share nor resume it
+key = problem_key('overlap_sie_basin', initial_params_source, initial_params_template)
+overlap_max = maximize_overlap(overlap_optimized.overlap, bounds = bnds, maxiter = 10,
+                               checkpoint = dirName + f'overlap_sie_trial_checkpoint_{key[:16]}.npz',
+                               checkpoint_key = key, checkpoint_interval = 300)
+print(overlap_max.fun, overlap_max.x[0], overlap_max.x[1], overlap_max.nfev, overlap_max.success, overlap_max.on_bound)
 
 end = time.time()
 print(f'start time: {end - start}')
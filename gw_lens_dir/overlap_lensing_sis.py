@@ -2,7 +2,9 @@ import multiprocessing
 import time
 import pickle
 import csv
+import argparse
 import numpy as np
+import pandas as pd
 import scipy.special as sc
 import mpmath as mp
 import scipy as sp
@@ -10,6 +12,13 @@ import scipy as sp
 from scipy.optimize import dual_annealing
 from scipy.signal import find_peaks, find_peaks_cwt
 from mpmath import *
+from gw_lens_dir.norm_cache import cached_norm
+from gw_lens_dir.lens_sweep import sweep
+from gw_lens_dir.fitting_factor import ff_sweep
+from gw_lens_dir.transition_table import f_transition, F_hybrid_sis
+from gw_lens_dir import amplification
+from gw_lens_dir.maximize import maximize_overlap
+from gw_lens_dir.relative_binning import from_overlap as rb_from_overlap
 mp.pretty = True 
 
 #from gwsim.analysis.overlap_optimize import strain
@@ -209,12 +218,8 @@ class overlap_sis():
         F_val : float, complex
             Amplification factor for point mass
         '''
-        w = 8 * pi * self.M_lz_source * f
-        pre_factor = exp(1j * (w / 2) * (self.y_source**2 + 2 * (self.y_source + 0.5)))
-        func = lambda n: (gamma(1 + n / 2) / fac(n)) * (2 * w * exp(1j * 3 * (pi / 2))) ** (n / 2) * hyp1f1(1 + n / 2, 1, -1j * (w / 2) * self.y_source ** 2)
-        series_sum = nsum(func, [0, inf])
-
-        F_val_source_sis = np.complex128(pre_factor * series_sum, dtype = np.complex128)
+        # double precision series / quasi geometrical optics instead of mp.nsum (amplification.F_sis_w)
+        F_val_source_sis = amplification.F_sis(f, self.M_lz_source, self.y_source)[()]
 
         return F_val_source_sis
     
@@ -258,19 +263,11 @@ class overlap_sis():
         return Sn_val
 
     def get_f_transition(self):
-        """ Calculate the frequency (f_transition) after which geometrical optics is valid
+        """ Calculate the frequency (f_transition) after which geometrical optics is valid.
+        The first peak of |F| sits at w_peak(y), which is looked up in a precomputed table (transition_table.py)
+        instead of scanning F_source_sis on 500 frequencies.
         """
-        freq_range = my_lin(0.001, 250, 500)
-
-        # Calculate the amplification factor for a range of frequency
-        Fsis_series = np.zeros_like(freq_range)
-        for i in range(len(freq_range)):
-            Fsis_series[i] = np.abs(self.F_source_sis(freq_range[i]))
-
-        # Get the peaks (specifically the first one)    
-        peaks, _ = find_peaks(Fsis_series) 
-        
-        return freq_range[peaks][0]
+        return f_transition(self.M_lz_source, self.y_source)
 
     def signal_source_wo(self, f, t_c, phi_c): # Remove t_c and phi_c for SNR calculation
         
@@ -393,18 +390,22 @@ class overlap_sis():
                 args = (t_c, phi_c)
             )
 
-            deno_temp_1, deno_temp_err_1 = sp.integrate.quad(
+            deno_temp_1 = cached_norm(
+                self,
                 self.integrand_deno_1_go,
-                self.limit(self.params_source, self.params_temp)[0], 
-                self.limit(self.params_source, self.params_temp)[2], 
-                args = (t_c, phi_c)
+                self.limit(self.params_source, self.params_temp)[0],
+                self.limit(self.params_source, self.params_temp)[2],
+                args = (t_c, phi_c),
+                which = 'source'
             )
 
-            deno_temp_2, deno_temp_err_2 = sp.integrate.quad(
+            deno_temp_2 = cached_norm(
+                self,
                 self.integrand_deno_2,
-                self.limit(self.params_source, self.params_temp)[0], 
-                self.limit(self.params_source, self.params_temp)[3], 
-                args = (t_c, phi_c)
+                self.limit(self.params_source, self.params_temp)[0],
+                self.limit(self.params_source, self.params_temp)[3],
+                args = (t_c, phi_c),
+                which = 'template'
             )
             num = 4 * np.real(num_temp)
             deno = np.sqrt((4 * np.real(deno_temp_1)) * (4 * np.real(deno_temp_2)))
@@ -420,18 +421,22 @@ class overlap_sis():
                 args = (t_c, phi_c)
             ) 
 
-            deno_temp_1_a, deno_temp_err_1_a = sp.integrate.quad(
+            deno_temp_1_a = cached_norm(
+                self,
                 self.integrand_deno_1_wo,
                 self.limit(self.params_source, self.params_temp)[0],
                 self.get_f_transition(),
-                args = (t_c, phi_c)
+                args = (t_c, phi_c),
+                which = 'source'
             )
 
-            deno_temp_2_a, deno_temp_err_2_a = sp.integrate.quad(
+            deno_temp_2_a = cached_norm(
+                self,
                 self.integrand_deno_2,
                 self.limit(self.params_source, self.params_temp)[0],
                 self.get_f_transition(),
-                args = (t_c, phi_c)
+                args = (t_c, phi_c),
+                which = 'template'
             )
             
             num_temp_b, num_temp_b = sp.integrate.quad(
@@ -441,18 +446,22 @@ class overlap_sis():
                 args = (t_c, phi_c)
             ) 
 
-            deno_temp_1_b, deno_temp_err_1_b = sp.integrate.quad(
+            deno_temp_1_b = cached_norm(
+                self,
                 self.integrand_deno_1_wo,
                 self.get_f_transition(),
                 self.limit(self.params_source, self.params_temp)[2],
-                args = (t_c, phi_c)
+                args = (t_c, phi_c),
+                which = 'source'
             )
 
-            deno_temp_2_b, deno_temp_err_2_b = sp.integrate.quad(
+            deno_temp_2_b = cached_norm(
+                self,
                 self.integrand_deno_2,
                 self.get_f_transition(),
                 self.limit(self.params_source, self.params_temp)[3],
-                args = (t_c, phi_c)
+                args = (t_c, phi_c),
+                which = 'template'
             )
 
             num_a = 4 * np.real(num_temp_a)
@@ -471,18 +480,22 @@ class overlap_sis():
                 args = (t_c, phi_c)
             )
 
-            deno_temp_1, deno_temp_err_1 = sp.integrate.quad(
+            deno_temp_1 = cached_norm(
+                self,
                 self.integrand_deno_1_wo,
-                self.limit(self.params_source, self.params_temp)[0], 
-                self.limit(self.params_source, self.params_temp)[2], 
-                args = (t_c, phi_c)
+                self.limit(self.params_source, self.params_temp)[0],
+                self.limit(self.params_source, self.params_temp)[2],
+                args = (t_c, phi_c),
+                which = 'source'
             )
 
-            deno_temp_2, deno_temp_err_2 = sp.integrate.quad(
+            deno_temp_2 = cached_norm(
+                self,
                 self.integrand_deno_2,
-                self.limit(self.params_source, self.params_temp)[0], 
-                self.limit(self.params_source, self.params_temp)[3], 
-                args = (t_c, phi_c)
+                self.limit(self.params_source, self.params_temp)[0],
+                self.limit(self.params_source, self.params_temp)[3],
+                args = (t_c, phi_c),
+                which = 'template'
             )
             num = 4 * np.real(num_temp)
             deno = np.sqrt((4 * np.real(deno_temp_1)) * (4 * np.real(deno_temp_2)))
@@ -535,41 +548,67 @@ def my_lin(lb, ub, steps, spacing = 3):
     dx = 1.0 / (steps-1)
     return np.array([lb + (i * dx) ** spacing * span for i in range(steps)])
 
-def overlap_multiprocessed_lensing(M_lz_source_range, return_dict):
-
-    bnds = [[-0.2, 0.2], [-np.pi, np.pi]]
-    params_source = initial_params_source
-    params_source['M_lz_source'] = M_lz_source_range
+def overlap_relative_binning(M_lz_source):
+    '''maximized overlap of one lens mass, with the relative binning engine (relative_binning.py) in place of the
+    quad() integrals and a population search over (t_c, phi_c).
+    '''
+    params_source = dict(initial_params_source)
+    params_source['M_lz_source'] = M_lz_source
     overlap_optimized = overlap_sis(params_source = params_source, params_temp = initial_params_template)
-    overlap_max = dual_annealing(overlap_optimized.overlap, bounds = bnds, seed = 42, maxiter = 100)
+    # the source is lensed as in overlap(), but the whole band is normalized once (see the sweep below)
+    engine = rb_from_overlap(
+        overlap_optimized,
+        lambda f: F_hybrid_sis(f, overlap_optimized.M_lz_source, overlap_optimized.y_source),
+        vectorized = True,
+        tc_bounds = (-0.2, 0.2),
+        td = overlap_optimized.time_del()
+    )
+    # the engine only resolves engine.bounds: a t_c on them is flagged, not widened
+    overlap_max = maximize_overlap(engine.overlap_batch, bounds = engine.bounds, max_bounds = engine.bounds, seed = 42,
+                                   maxiter = 100, vectorized = True)
+
+    return [M_lz_source, overlap_max.overlap, overlap_max.x[0], overlap_max.x[1], overlap_max.nfev, overlap_max.on_bound,
+            engine.n_bins()]
 
-    return_dict[M_lz_source_range] = [overlap_max.fun, overlap_max.x[0], overlap_max.x[1]]
-    
 if __name__ == "__main__":
 
     datPath = "/Users/saifali/Desktop/gwlensing/data/"
     #start = time.time()
     start = time.strftime("%H%M%S")
-    manager = multiprocessing.Manager()
-    return_dict = manager.dict()
-    processes = []
     
     M_lz_source_range = np.linspace(2260 * solar_mass, 1e2 * solar_mass, 1)
     #M_lz_source_range = my_lin(1e2 * solar_mass, 1e4 * solar_mass, 15)
     #I_range = np.linspace(0.1, 1, 20)
 
-    for M_lz_source in M_lz_source_range:
-        process = multiprocessing.Process(target = overlap_multiprocessed_lensing, args=(M_lz_source, return_dict))
-        processes.append(process)
-
-        process.start()
-    
-    for proc in processes:
-        proc.join()
-
-    w = csv.writer(open(datPath + "overlap_sis_bigdip_ml_2260_sol.csv", "w"))
-    for key, value in return_dict.items():
-        w.writerow([key, value])
+    # 'sweep': batched FFT over (t_c, phi_c) for all the masses at once, 'relative_binning': one relative binning
+    # engine and population search per mass
+    parser = argparse.ArgumentParser(description = 'optimal overlaps of the SIS source over the lens masses')
+    parser.add_argument('--engine', choices = ['sweep', 'relative_binning'], default = 'sweep')
+    parser.add_argument('--fitting_factor', action = 'store_true',
+                        help = 'also fit the template chirp mass and eta at every mass (a Nelder-Mead search each)')
+    args = parser.parse_args()
+
+    if args.engine == 'relative_binning':
+        df_rb = pd.DataFrame([overlap_relative_binning(M_lz_source) for M_lz_source in M_lz_source_range],
+                             columns = ['M_lz', 'overlap', 'tc', 'phi_c', 'nfev', 'on_bound', 'n_bins'])
+        df_rb.to_csv(datPath + "overlap_sis_bigdip_ml_2260_sol_rb.csv", index = False)
+    else:
+        # All the lens masses at once: the unlensed waveforms are shared and only F changes between points
+        # (see lens_sweep.py). 'sis_hybrid' is the amplification factor of overlap_sis.overlap() (wave optics below
+        # get_f_transition(), geometrical optics above), but with the transition inside the band overlap() adds
+        # the overlaps of the two bands normalized separately while the sweep normalizes the whole band once. The
+        # results are not those of overlap_sis_bigdip_ml_2260_sol.csv and go to a file of their own.
+        df_res = sweep(initial_params_source, initial_params_template, 'sis_hybrid', M_lz = M_lz_source_range, y = initial_params_source['y_source'])
+
+        w = csv.writer(open(datPath + "overlap_sis_bigdip_ml_2260_sol_sweep.csv", "w"))
+        for i in range(len(df_res)):
+            w.writerow([df_res['M_lz'][i], [-1 * df_res['overlap'][i], df_res['tc'][i], df_res['phi_c'][i]]])
+
+    # Fitting factors: the template chirp mass and eta are fitted too (the mcz_range search below, see
+    # fitting_factor.py), the biases of an unlensed search are mcz_temp - mcz_source and eta_temp - eta_source.
+    if args.fitting_factor:
+        df_ff = ff_sweep(initial_params_source, initial_params_template, 'sis_hybrid', M_lz = M_lz_source_range, y = initial_params_source['y_source'])
+        df_ff.to_csv(datPath + "fitting_factor_sis_bigdip_ml_2260_sol.csv", index = False)
     
     print(f'start time: {start}')
 
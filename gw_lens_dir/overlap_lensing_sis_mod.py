@@ -12,6 +12,11 @@ import scipy as sp
 from scipy.optimize import dual_annealing
 from scipy.signal import find_peaks, find_peaks_cwt
 from mpmath import *
+from functools import partial
+from gw_lens_dir.inner_product import from_overlap
+from gw_lens_dir.norm_cache import cached_norm
+from gw_lens_dir import amplification
+from gw_lens_dir.warm_sweep import warm_sweep, global_search
 mp.pretty = True 
 
 #from gwsim.analysis.overlap_optimize import strain
@@ -52,6 +57,9 @@ class overlap_sis():
         self.eta_temp = params_temp['eta_temp']
         #self.tc = params_temp['tc']
         #self.phi_c = params_temp['phi_c']
+
+        # overlap_grid used by overlap_num(), see grid_engine()
+        self.engine = None
         
         
 
@@ -211,27 +219,15 @@ class overlap_sis():
         F_val : float, complex
             Amplification factor for point mass
         '''
-        w = 8 * pi * self.M_lz_source * f
-        pre_factor = exp(1j * (w / 2) * (self.y_source**2 + 2 * (self.y_source + 0.5)))
-        func = lambda n: (gamma(1 + n / 2) / fac(n)) * (2 * w * exp(1j * 3 * (pi / 2))) ** (n / 2) * hyp1f1(1 + n / 2, 1, -1j * (w / 2) * self.y_source ** 2)
-        series_sum = nsum(func, [0, inf])
-
-        F_val_source_sis = np.complex128(pre_factor * series_sum, dtype = np.complex128)
+        # double precision series / quasi geometrical optics instead of mp.nsum (amplification.F_sis_w)
+        F_val_source_sis = amplification.F_sis(f, self.M_lz_source, self.y_source)[()]
 
         return F_val_source_sis
 
     def F_source_pm(self, f):
         
-        w = 8 * np.pi * self.M_lz_source * f
-        x_m = 0.5 * (self.y_source + np.sqrt(self.y_source**2 + 4))
-        phi_m = np.power((x_m - self.y_source) , 2) / 2 - np.log(x_m)
-
-        first_term = np.exp(np.pi * w / 4 + 1j * (w / 2) * (np.log(w / 2) - 2 * phi_m)) 
-        second_term = sc.gamma(1 - 1j * (w / 2)) 
-        third_term = mp.hyp1f1(1j * w / 2, 1, 1j * (w / 2) * (self.y_source**2), maxterms = 10**6)
-
-        F_val_pm_temp = first_term * second_term * third_term
-        F_val_pm = np.complex128(F_val_pm_temp, dtype = np.complex128)
+        # double precision series / quasi geometrical optics instead of mp.hyp1f1 (amplification.F_pm_w)
+        F_val_pm = amplification.F_pm(f, self.M_lz_source, self.y_source)[()]
 
         return F_val_pm
     
@@ -407,18 +403,22 @@ class overlap_sis():
             args = (t_c, phi_c)
         )
 
-        deno_temp_1, deno_temp_err_1 = sp.integrate.quad(
+        deno_temp_1 = cached_norm(
+            self,
             self.integrand_deno_1_wo,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[2], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[2],
+            args = (t_c, phi_c),
+            which = 'source'
         )
 
-        deno_temp_2, deno_temp_err_2 = sp.integrate.quad(
+        deno_temp_2 = cached_norm(
+            self,
             self.integrand_deno_2,
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[3], 
-            args = (t_c, phi_c)
+            self.limit(self.params_source, self.params_temp)[0],
+            self.limit(self.params_source, self.params_temp)[3],
+            args = (t_c, phi_c),
+            which = 'template'
         )
         num = 4 * np.real(num_temp)
         deno = np.sqrt((4 * np.real(deno_temp_1)) * (4 * np.real(deno_temp_2)))
@@ -427,25 +427,22 @@ class overlap_sis():
         
         return -1 * overlap_temp
     
+    def grid_engine(self):
+        """ overlap_grid for the wave optics source, built once and reused by overlap_num()
+        """
+        if self.engine is None:
+            self.engine = from_overlap(self, self.F_source_pm, vectorized = True)
+
+        return self.engine
+
     def overlap_num(self, x):
         t_c = x[0]
         phi_c = x[1]
 
-        num_temp_real, num_err_real = sp.integrate.quad(
-            self.integrand_num_wo_real, 
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[1], 
-            args = (t_c, phi_c)
-        )
-
-        num_temp_imag, num_err_imag = sp.integrate.quad(
-            self.integrand_num_wo_imag, 
-            self.limit(self.params_source, self.params_temp)[0], 
-            self.limit(self.params_source, self.params_temp)[1], 
-            args = (t_c, phi_c)
-        )
+        # overlap_grid.inner() includes the factor of 4 of the inner product
+        num_temp = self.grid_engine().inner(t_c, phi_c) / 4
 
-        return num_temp_real + 1j * num_temp_imag
+        return num_temp
 
 """
 Trying the multiprocessing 
@@ -497,23 +494,19 @@ if __name__ == "__main__":
     M_lz_source_range = np.array([2260 * solar_mass, 1510 * solar_mass, 1119 * solar_mass])
     #M_lz_source_range = my_lin(1e2 * solar_mass, 5e4 * solar_mass, 3)
     #I_range = np.linspace(0.1, 1, 20)
-    df_res = pd.DataFrame(columns=('M_lz', 'overlap', 'tc', 'phi_c'))
-
-    for i in range(len(M_lz_source_range)):
-
-        print(f"working lens mass is {M_lz_source_range[i] / solar_mass}")
-
-        params_source = initial_params_source
-        params_template = initial_params_template
-        params_source['M_lz_source'] = M_lz_source_range[i]
-        params_source['y_source'] = y_source_range[i] 
-        bnds = [[-0.2, 0.2], [-np.pi, np.pi]]
-        overlap_optimized = overlap_sis(params_source = params_source, params_temp = initial_params_template)
-        overlap_max = dual_annealing(overlap_optimized.overlap, bounds = bnds, maxiter = 80)
-        #df_res.loc[i] = [y_source_range[i], M_lz_source_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1]]
-        end = time.time()
-        print(M_lz_source_range[i], np.abs(overlap_max.fun), overlap_max.x[0], overlap_max.x[1])
-        print(f'elapsed time: {(end - start)/60}')
+
+    def make_objective(point):
+        params_source = dict(initial_params_source)
+        params_source['M_lz_source'], params_source['y_source'] = point
+        return overlap_sis(params_source = params_source, params_temp = initial_params_template).overlap
+
+    # warm started sweep along the (M_lz, y) path, see warm_sweep.py
+    # global searches with the budget of the original loop (maxiter = 80, no fixed seed)
+    df_res = warm_sweep(make_objective, np.column_stack([M_lz_source_range, y_source_range]), names = ['M_lz', 'y'],
+                        global_opt = partial(global_search, seed = None, maxiter = 80))
+    end = time.time()
+    print(df_res)
+    print(f'elapsed time: {(end - start)/60}')
     #print(df_res)
     #df_res.to_csv(datPath + "overlap_pm_bigdip_troughs.csv", index = False)
     
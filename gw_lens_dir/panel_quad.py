@@ -0,0 +1,148 @@
+"""
+Adaptive Gauss-Legendre panel integration of the overlap integrals, with an error estimate.
+
+The quad() calls of the overlap classes integrate complex integrands with a real integrator one frequency at a
+time and drop their error estimates. Here the band is split into panels, every panel is integrated with an
+order n Gauss-Legendre rule evaluated as one array, and its error is estimated by comparing it with the sum of
+the same rule on its two halves. Panels whose error is above their share of the tolerance are replaced by
+their halves and refined again, so the evaluations go where the integrand oscillates fastest (low
+frequencies for the chirp, large delays for the lensed signals).
+
+The value returned for an accepted panel is the sum over its halves, and the error is |parent - halves|,
+which bounds the error of the halves once the rule is in its converging regime (one more level of
+refinement of a smooth integrand reduces the error by ~ 2^(2n)).
+"""
+
+import numpy as np
+from functools import lru_cache
+from gw_lens_dir.inner_product import Sn, lensed_strains
+
+@lru_cache(maxsize = 16)
+def gauss_legendre(order):
+    '''nodes and weights of the order point Gauss-Legendre rule on [0, 1].
+    '''
+    x, w = np.polynomial.legendre.leggauss(order)
+
+    return (x + 1) / 2, w / 2
+
+def _panel_rule(func, left, right, order):
+    '''order point rule on every panel [left, right], one call of func for all the panels.
+    '''
+    x, w = gauss_legendre(order)
+    width = right - left
+    f = (left[:, None] + width[:, None] * x[None, :]).ravel()
+    values = np.asarray(func(f))
+    values = values.reshape(values.shape[:-1] + (len(left), order))
+
+    return np.sum(values * w, axis = -1) * width
+
+def panel_quad(func, a, b, tol = 0., rtol = 1e-8, order = 16, n_panels = 16, max_panels = 2**16):
+    '''integral of func over [a, b] with adaptive Gauss-Legendre panels.
+
+    Parameters
+    ----------
+    func : callable
+        func(f) evaluates the integrand on a frequency array, it can return a stack of integrands of shape
+        (..., len(f)) that share the panels (all of them must converge)
+    a, b : float
+        integration limits
+    tol, rtol : float
+        target absolute and relative error of the integral, shared between the panels in proportion to their
+        width
+    order : int
+        number of Gauss-Legendre nodes per panel
+    n_panels : int
+        number of panels to start with
+    max_panels : int
+        refinement stops (with the error reported) once this many panels are active
+
+    Return
+    ----------
+    value : complex or array
+    err : float or array
+        estimated absolute error
+    n_eval : int
+        number of integrand evaluations
+    '''
+    edges = np.linspace(a, b, n_panels + 1)
+    left, right = edges[:-1], edges[1:]
+    parent = _panel_rule(func, left, right, order)
+    n_eval = len(left) * order
+
+    value = np.zeros(parent.shape[:-1], dtype = parent.dtype)
+    err = np.zeros(parent.shape[:-1])
+    while len(left) > 0:
+        middle = (left + right) / 2
+        halves = _panel_rule(func, np.concatenate([left, middle]), np.concatenate([middle, right]), order)
+        n_eval += 2 * len(left) * order
+        children = halves[..., :len(left)] + halves[..., len(left):]
+        panel_err = np.abs(parent - children)
+
+        # error allowed on each panel, estimated with the current total
+        total = np.abs(value + np.sum(children, axis = -1))
+        allowed = np.maximum(tol, rtol * total)[..., None] * (right - left) / (b - a)
+        done = np.all(panel_err <= allowed, axis = tuple(range(panel_err.ndim - 1)))
+        if 2 * np.count_nonzero(~done) > max_panels:
+            done[:] = True
+
+        value = value + np.sum(children[..., done], axis = -1)
+        err = err + np.sum(panel_err[..., done], axis = -1)
+
+        # the halves of the panels left become the new panels
+        keep = ~done
+        parent = np.concatenate([halves[..., :len(left)][..., keep], halves[..., len(left):][..., keep]], axis = -1)
+        left, right = np.concatenate([left[keep], middle[keep]]), np.concatenate([middle[keep], right[keep]])
+
+    return value, err, n_eval
+
+def panel_overlap(overlap_obj, x, amp_fact, amp_fact_temp = None, vectorized = False, rtol = 1e-8, order = 16):
+    '''overlap of one of the overlap classes at x = (t_c, phi_c) from panel_quad, with its error.
+
+    Parameters
+    ----------
+    overlap_obj : object
+        instance of one of the overlap classes
+    x : array
+        (t_c, phi_c)
+    amp_fact : callable
+        amplification factor of the source, e.g. overlap_obj.F_source_pm
+    amp_fact_temp : callable
+        amplification factor of the template (lensed templates only)
+    vectorized : bool
+        set to True if the amplification factors accept a frequency array
+    rtol : float
+        target relative error of the two norms, and of the numerator relative to sqrt(norm_source * norm_temp)
+
+    Return
+    ----------
+    overlap : float
+        -overlap, the sign of the overlap(x) methods of the overlap classes and of the engines (overlap_grid,
+        relative_binning), so that it can be compared with them or minimized directly
+    err : float
+        propagated error of the overlap, from the errors of the numerator and of the two norms
+    n_eval : int
+        number of integrand evaluations
+    '''
+    t_c, phi_c = x
+    low_limit, upper_limit, f_cut_source, f_cut_temp = overlap_obj.limit(overlap_obj.params_source, overlap_obj.params_temp)
+
+    signal_source, template = lensed_strains(overlap_obj, amp_fact, amp_fact_temp = amp_fact_temp,
+                                             vectorized = vectorized)
+    signal_temp = lambda f: template(f, t_c, phi_c)
+
+    # the norms first, the numerator then gets the absolute tolerance rtol * sqrt(norm_source * norm_temp)
+    quad_args = {'rtol': rtol, 'order': order}
+    norm_source, source_err, n_source = panel_quad(lambda f: 4 * np.abs(signal_source(f))**2 / Sn(f),
+                                                   low_limit, f_cut_source, tol = 0., **quad_args)
+    norm_temp, temp_err, n_temp = panel_quad(lambda f: 4 * np.abs(signal_temp(f))**2 / Sn(f),
+                                             low_limit, f_cut_temp, tol = 0., **quad_args)
+    num, num_err, n_num = panel_quad(lambda f: 4 * signal_source(f) * np.conjugate(signal_temp(f)) / Sn(f),
+                                     low_limit, upper_limit, tol = rtol * np.sqrt(np.real(norm_source * norm_temp)),
+                                     **quad_args)
+
+    deno = np.sqrt(np.real(norm_source) * np.real(norm_temp))
+    overlap = np.real(num) / deno
+    # first order propagation of the three errors
+    err = num_err / deno + np.abs(overlap) / 2 * (source_err / np.real(norm_source) + temp_err / np.real(norm_temp))
+
+    return -1 * overlap, err, n_num + n_source + n_temp
@@ -0,0 +1,421 @@
+"""
+Population based global optimization of the overlap, with batched evaluation of the objective.
+
+dual_annealing calls overlap(x) one point at a time. Differential evolution only needs the objective of a whole
+generation at once, so with an objective that takes an array of candidates of shape (n_params, n_candidates),
+e.g. overlap_grid.overlap_batch or relative_binning.overlap_batch, a generation is one array computation.
+
+Several independent populations (one per seed) are evolved in lockstep: the trial vectors of all the
+populations that are still running are evaluated in the same call. The spread of their optima tells how robust
+the global optimum is; a single seed is ordinary differential evolution (best1bin, dithered mutation, latin
+hypercube initialization, as scipy's differential_evolution) followed by a Nelder-Mead polish (L-BFGS-B with
+finite differences stalls on the narrow t_c peak).
+
+Long runs can be checkpointed (checkpoint = path): the populations, their objective, the generation counters,
+the stall history and the states of the random generators are written to a small .npz file every
+checkpoint_interval seconds, and a run started with the same path and problem resumes from it where it stopped
+(with the same result as an uninterrupted run). The caller names the problem with checkpoint_key, e.g.
+problem_key(params_source, params_temp); the key, the seed, the bounds, x0 and the settings of the evolution
+(maxiter, popsize, ...) must all match for a checkpoint to be resumed. The file is removed once the evolution is
+done.
+
+population_optimize takes the arguments of the dual_annealing calls of the drivers (func, bounds, seed,
+maxiter, x0) and returns an OptimizeResult with x, fun and nfev, so it can replace them directly.
+
+lockstep_optimize runs the same evolution for the points of a lens parameter sweep: one population per point,
+and the candidates of all the points go to the objective in one call (overlap_stack.overlap_batch of
+lens_sweep.py evaluates them as a points x candidates x frequency array). The polish is a Nelder-Mead whose
+simplices move in lockstep too.
+"""
+
+import os
+import json
+import hashlib
+import time
+import tempfile
+import numpy as np
+from scipy.optimize import minimize, OptimizeResult
+
+def latin_hypercube(rng, popsize, dim):
+    '''popsize points in the unit cube, one in every 1/popsize slice of every dimension.
+    '''
+    samples = (np.arange(popsize)[:, None] + rng.uniform(size = (popsize, dim))) / popsize
+    for d in range(dim):
+        samples[:, d] = samples[rng.permutation(popsize), d]
+
+    return samples
+
+def batch_objective(func, vectorized = False, args = ()):
+    '''func as an objective of an array of candidates of shape (n_params, n_candidates).
+    '''
+    if vectorized:
+        return lambda X: np.asarray(func(X, *args), dtype = float).reshape(X.shape[1])
+
+    return lambda X: np.array([func(X[:, i], *args) for i in range(X.shape[1])], dtype = float)
+
+def problem_key(*parts):
+    '''checkpoint_key of a problem: hash of its parameter dictionaries (e.g. params_source, params_temp) and of
+    any other json serializable parts (name of the model, lens parameters, ...).
+    '''
+    frozen = [sorted((key, float(np.real(value))) for key, value in part.items()) if isinstance(part, dict) else part
+              for part in parts]
+
+    return hashlib.sha1(json.dumps(frozen).encode()).hexdigest()
+
+def save_checkpoint(path, fingerprint, state, rngs):
+    '''writes the state of an evolution to path (write then rename, a preempted write leaves the previous file).
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok = True)
+    fd, tmp = tempfile.mkstemp(dir = directory, suffix = '.tmp')
+    with os.fdopen(fd, 'wb') as fh:
+        np.savez(fh, fingerprint = fingerprint, rngs = json.dumps([rng.bit_generator.state for rng in rngs]), **state)
+    os.replace(tmp, path)
+
+def load_checkpoint(path, fingerprint, rngs):
+    '''state saved by save_checkpoint, None if there is no checkpoint of this problem at path. The random
+    generators are set to their saved states.
+    '''
+    try:
+        with np.load(path) as data:
+            if str(data['fingerprint']) != fingerprint:
+                return None
+            state = {key: data[key] for key in data.files if key not in ('fingerprint', 'rngs')}
+            rng_states = json.loads(str(data['rngs']))
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+    for rng, rng_state in zip(rngs, rng_states):
+        rng.bit_generator.state = rng_state
+
+    return state
+
+def evolve(evaluate, bounds, rngs, x0 = None, maxiter = 1000, popsize = 15, mutation = (0.5, 1.), recombination = 0.7,
+           tol = 0.01, atol = 0., patience = None, stall_tol = 0., checkpoint = None, checkpoint_interval = 60.,
+           checkpoint_key = None):
+    '''differential evolution of len(rngs) independent populations in lockstep, in the unit cube of bounds.
+
+    Parameters
+    ----------
+    evaluate : callable
+        evaluate(unit, active) returns the objective of the candidates unit, shape (len(active), size, n_params)
+        in the unit cube, of the populations active, shape (len(active), size)
+    rngs : list
+        one random generator per population
+    x0 : array
+        candidate put in every initial population, shape (n_params,) or one per population
+    patience, stall_tol : int, float
+        early stop: a population also stops once its best value has not improved by more than stall_tol in
+        patience generations (off when patience is None)
+    checkpoint : str
+        path of the checkpoint file, the evolution resumes from it when it holds the state of the same problem
+    checkpoint_interval : float
+        seconds between two checkpoints
+    checkpoint_key : str or list
+        identity of the problem (objective and its parameters), required with checkpoint
+
+    Return
+    ----------
+    pop, fun : array
+        final populations (unit cube) and their objective, shapes (n_pop, size, n_params) and (n_pop, size)
+    nit : array
+        number of generations of every population
+    converged : array
+        whether every population met the tolerance (or stalled) before maxiter
+    nfev : array
+        number of evaluations of every population
+    '''
+    bounds = np.asarray(bounds, dtype = float)
+    low, width = bounds[:, 0], bounds[:, 1] - bounds[:, 0]
+    dim = len(bounds)
+    size = max(5, popsize * dim)
+    n_pop = len(rngs)
+
+    if checkpoint is not None and checkpoint_key is None:
+        raise ValueError('a checkpoint needs the checkpoint_key of its problem, '
+                         'e.g. problem_key(params_source, params_temp)')
+    # the problem, the start and the settings of the evolution: a checkpoint of anything else is not resumed
+    start = None if x0 is None else np.asarray(x0, dtype = float).tolist()
+    settings = [maxiter, size, np.ravel(mutation).tolist(), recombination, tol, atol, patience, stall_tol]
+    fingerprint = json.dumps([checkpoint_key, bounds.tolist(), n_pop, start, settings])
+    state = None if checkpoint is None else load_checkpoint(checkpoint, fingerprint, rngs)
+    if state is None:
+        pop = np.array([latin_hypercube(rng, size, dim) for rng in rngs])
+        if x0 is not None:
+            pop[:, 0] = np.clip((np.asarray(x0, dtype = float) - low) / width, 0, 1)
+        fun = np.asarray(evaluate(pop, np.arange(n_pop)), dtype = float)
+        running = np.ones(n_pop, dtype = bool)
+        nit = np.zeros(n_pop, dtype = int)
+        history = [np.min(fun, axis = 1)]
+        first = 0
+    else:
+        pop, fun, running, nit = state['pop'], state['fun'], state['running'], state['nit']
+        history = list(state['history'])
+        first = int(state['generation'])
+
+    def save(generation):
+        save_checkpoint(checkpoint, fingerprint, {'pop': pop, 'fun': fun, 'running': running, 'nit': nit,
+                                                  'history': np.array(history), 'generation': generation}, rngs)
+
+    if checkpoint is not None and state is None:
+        save(0)
+    saved = time.time()
+
+    rows = np.arange(size)
+    for generation in range(first, maxiter):
+        active = np.flatnonzero(running)
+        if len(active) == 0:
+            break
+        trials = np.empty((len(active), size, dim))
+        for j, k in enumerate(active):
+            rng = rngs[k]
+            F = rng.uniform(*mutation) if np.ndim(mutation) else mutation
+            # best1bin: best + F (r1 - r2), r1 != r2 != current member
+            r = np.argsort(rng.uniform(size = (size, size)) + (rows[:, None] == rows[None, :]), axis = 1)[:, :2]
+            mutant = pop[k, np.argmin(fun[k])] + F * (pop[k, r[:, 0]] - pop[k, r[:, 1]])
+            cross = rng.uniform(size = (size, dim)) < recombination
+            cross[rows, rng.integers(dim, size = size)] = True
+            trial = np.where(cross, mutant, pop[k])
+            # members leaving the bounds are drawn again
+            outside = (trial < 0) | (trial > 1)
+            trial[outside] = rng.uniform(size = np.count_nonzero(outside))
+            trials[j] = trial
+
+        trial_fun = np.asarray(evaluate(trials, active), dtype = float)
+        for j, k in enumerate(active):
+            better = trial_fun[j] <= fun[k]
+            pop[k, better], fun[k, better] = trials[j, better], trial_fun[j, better]
+            nit[k] += 1
+            if np.std(fun[k]) <= atol + tol * np.abs(np.mean(fun[k])):
+                running[k] = False
+        history.append(np.min(fun, axis = 1))
+        if patience is not None and generation >= patience:
+            running &= history[-patience - 1] - history[-1] > stall_tol
+
+        if checkpoint is not None and time.time() - saved >= checkpoint_interval:
+            save(generation + 1)
+            saved = time.time()
+
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    return pop, fun, nit, ~running, size * (nit + 1)
+
+def population_optimize(func, bounds, args = (), maxiter = 1000, seed = None, x0 = None, vectorized = False,
+                        n_seeds = 1, popsize = 15, mutation = (0.5, 1.), recombination = 0.7, tol = 0.01, atol = 0.,
+                        patience = None, stall_tol = 0., polish = True, checkpoint = None, checkpoint_interval = 60.,
+                        checkpoint_key = None):
+    '''global minimum of func with differential evolution, n_seeds independent populations at once.
+
+    Parameters
+    ----------
+    func : callable
+        objective, e.g. overlap(x) of the overlap classes (-overlap). With vectorized = True func(X) takes the
+        candidates as an array of shape (n_params, n_candidates) and returns shape (n_candidates,)
+    bounds : list
+        [lower, upper] of every parameter
+    args : tuple
+        extra arguments of func
+    maxiter : int
+        largest number of generations
+    seed : int
+        seed of the first population, the others use seed + 1, seed + 2, ...
+    x0 : array
+        candidate put in every initial population
+    vectorized : bool
+        func evaluates a population in one call
+    n_seeds : int
+        number of independent populations
+    popsize : int
+        population size per parameter
+    mutation : float or tuple
+        differential weight, or the range it is dithered in at every generation
+    recombination : float
+        crossover probability
+    tol, atol : float
+        a population stops once std(fun) <= atol + tol * |mean(fun)| over its members
+    patience, stall_tol : int, float
+        or once its best value has not improved by more than stall_tol in patience generations
+    polish : bool
+        polish the best member of every population with Nelder-Mead
+    checkpoint, checkpoint_interval : str, float
+        checkpoint file of the evolution and seconds between two checkpoints (see evolve)
+    checkpoint_key : str
+        identity of the problem, required with checkpoint, e.g. problem_key(params_source, params_temp)
+
+    Return
+    ----------
+    res : OptimizeResult
+        x, fun, nfev, nit, success and message of the best population, and
+        seeds_x, seeds_fun : best candidate and objective of every population
+        spread : max - min of seeds_fun, ~ 0 when every seed finds the same optimum
+    '''
+    bounds = np.asarray(bounds, dtype = float)
+    low, width = bounds[:, 0], bounds[:, 1] - bounds[:, 0]
+    dim = len(bounds)
+    objective = batch_objective(func, vectorized, args)
+
+    def evaluate(unit, active):
+        # the candidates of all the populations in one call
+        return objective((low + width * unit).reshape(-1, dim).T).reshape(unit.shape[:2])
+
+    rngs = [np.random.default_rng(None if seed is None else seed + k) for k in range(n_seeds)]
+    pop, fun, nit, converged, nfev = evolve(evaluate, bounds, rngs, x0 = x0, maxiter = maxiter, popsize = popsize,
+                                            mutation = mutation, recombination = recombination, tol = tol, atol = atol,
+                                            patience = patience, stall_tol = stall_tol, checkpoint = checkpoint,
+                                            checkpoint_interval = checkpoint_interval,
+                                            checkpoint_key = None if checkpoint_key is None else [checkpoint_key, seed])
+    nfev = np.sum(nfev)
+
+    best = np.argmin(fun, axis = 1)
+    seeds_x = low + width * pop[np.arange(n_seeds), best]
+    seeds_fun = fun[np.arange(n_seeds), best]
+    if polish:
+        for k in range(n_seeds):
+            res = minimize(lambda x: objective(x[:, None])[0], seeds_x[k], method = 'Nelder-Mead', bounds = bounds,
+                           options = {'xatol': 1e-8, 'fatol': 1e-10})
+            nfev += res.nfev
+            if res.fun < seeds_fun[k]:
+                seeds_x[k], seeds_fun[k] = res.x, res.fun
+
+    k = int(np.argmin(seeds_fun))
+
+    return OptimizeResult(x = seeds_x[k], fun = seeds_fun[k], nfev = nfev, nit = int(nit[k]), success = converged[k],
+                          message = 'population converged' if converged[k] else 'maximum number of generations reached',
+                          seeds_x = seeds_x, seeds_fun = seeds_fun, spread = np.ptp(seeds_fun))
+
+def simplex_polish(evaluate, x, fun, bounds, xatol = 1e-8, fatol = 1e-10, maxiter = None):
+    '''Nelder-Mead from the candidates x of every point at once. The simplices of all the points take their
+    steps together: one call of evaluate for the reflections, one for the expansions and contractions and one
+    for the shrinks of the points that need them.
+
+    Parameters
+    ----------
+    evaluate : callable
+        evaluate(X, points) with X of shape (len(points), n_params, n_candidates) returns (len(points), n_candidates)
+    x, fun : array
+        starting candidates (n_points, n_params) and their objective (n_points,)
+    xatol, fatol : float
+        a point stops once its simplex is smaller than xatol and its values agree to fatol (as scipy's Nelder-Mead)
+    maxiter : int
+        largest number of steps, 200 n_params by default
+
+    Return
+    ----------
+    x, fun : array
+    nfev : array
+        number of evaluations of every point
+    '''
+    bounds = np.asarray(bounds, dtype = float)
+    clip = lambda y: np.clip(y, bounds[:, 0], bounds[:, 1])
+    x, fun = np.array(x, dtype = float), np.array(fun, dtype = float)
+    n_points, dim = x.shape
+    maxiter = 200 * dim if maxiter is None else maxiter
+
+    def call(y, points):
+        # y of shape (len(points), n_candidates, n_params)
+        return np.asarray(evaluate(np.swapaxes(y, 1, 2), points), dtype = float)
+
+    # initial simplex of scipy's Nelder-Mead: 5 % along every axis
+    offset = np.where(x != 0, 0.05 * x, 0.00025)
+    sim = clip(np.concatenate([x[:, None], x[:, None] + offset[:, None] * np.eye(dim)], axis = 1))
+    fsim = np.concatenate([fun[:, None], call(sim[:, 1:], np.arange(n_points))], axis = 1)
+    nfev = np.full(n_points, dim)
+
+    active = np.ones(n_points, dtype = bool)
+    for iteration in range(maxiter):
+        order = np.argsort(fsim, axis = 1)
+        sim, fsim = np.take_along_axis(sim, order[..., None], axis = 1), np.take_along_axis(fsim, order, axis = 1)
+        active &= ~((np.max(np.abs(sim[:, 1:] - sim[:, :1]), axis = (1, 2)) <= xatol) &
+                    (np.max(np.abs(fsim[:, 1:] - fsim[:, :1]), axis = 1) <= fatol))
+        points = np.flatnonzero(active)
+        if len(points) == 0:
+            break
+
+        worst, f_worst, f_second = sim[points, -1], fsim[points, -1], fsim[points, -2]
+        xbar = np.mean(sim[points, :-1], axis = 1)
+        xr = clip(2 * xbar - worst)
+        fr = call(xr[:, None], points)[:, 0]
+
+        expand = fr < fsim[points, 0]
+        reflect = ~expand & (fr < f_second)
+        outside = ~expand & ~reflect & (fr < f_worst)
+        inside = ~expand & ~reflect & ~outside
+        # second candidate: expansion, outside or inside contraction
+        second = np.where(expand[:, None], clip(3 * xbar - 2 * worst),
+                          np.where(outside[:, None], clip(1.5 * xbar - 0.5 * worst), clip(0.5 * (xbar + worst))))
+        need = expand | outside | inside
+        f_second_cand = np.full(len(points), np.inf)
+        if np.any(need):
+            f_second_cand[need] = call(second[need, None], points[need])[:, 0]
+        nfev[points] += 1 + need
+
+        new, f_new = xr.copy(), fr.copy()
+        take = (expand & (f_second_cand < fr)) | (outside & (f_second_cand <= fr)) | (inside & (f_second_cand < f_worst))
+        new[take], f_new[take] = second[take], f_second_cand[take]
+        shrink = (outside | inside) & ~take
+        keep = ~shrink
+        sim[points[keep], -1], fsim[points[keep], -1] = new[keep], f_new[keep]
+
+        if np.any(shrink):
+            shrunk = points[shrink]
+            sim[shrunk, 1:] = clip(sim[shrunk, :1] + 0.5 * (sim[shrunk, 1:] - sim[shrunk, :1]))
+            fsim[shrunk, 1:] = call(sim[shrunk, 1:], shrunk)
+            nfev[shrunk] += dim
+
+    best = np.argmin(fsim, axis = 1)
+
+    return sim[np.arange(n_points), best], fsim[np.arange(n_points), best], nfev
+
+def lockstep_optimize(func, bounds, n_points, args = (), maxiter = 1000, seed = None, x0 = None, popsize = 15,
+                      mutation = (0.5, 1.), recombination = 0.7, tol = 0.01, atol = 0., patience = None, stall_tol = 0.,
+                      polish = True, checkpoint = None, checkpoint_interval = 60., checkpoint_key = None):
+    '''global minima of the objectives of n_points sweep points, optimized in lockstep: every generation (and
+    every step of the polish) evaluates the candidates of all the points still running in one call of func.
+
+    Parameters
+    ----------
+    func : callable
+        func(X, points, *args) with X of shape (len(points), n_params, n_candidates) returns the objectives of
+        the candidates of the sweep points points (indices), shape (len(points), n_candidates), e.g.
+        overlap_stack.overlap_batch
+    bounds : list
+        [lower, upper] of every parameter, shared by the points
+    n_points : int
+        number of sweep points
+    seed : int
+        seed of the population of every point, so every point follows population_optimize(..., seed = seed)
+    x0 : array
+        candidate put in the initial populations, shape (n_params,) or (n_points, n_params)
+    polish : bool
+        polish the best member of every point with simplex_polish
+
+    The other parameters are those of population_optimize.
+
+    Return
+    ----------
+    res : OptimizeResult
+        x (n_points, n_params), fun, nfev, nit and success (n_points,) of every point
+    '''
+    bounds = np.asarray(bounds, dtype = float)
+    low, width = bounds[:, 0], bounds[:, 1] - bounds[:, 0]
+
+    def evaluate(unit, points):
+        return func(np.swapaxes(low + width * unit, 1, 2), points, *args)
+
+    rngs = [np.random.default_rng(seed) for k in range(n_points)]
+    pop, fun, nit, converged, nfev = evolve(evaluate, bounds, rngs, x0 = x0, maxiter = maxiter, popsize = popsize,
+                                            mutation = mutation, recombination = recombination, tol = tol, atol = atol,
+                                            patience = patience, stall_tol = stall_tol, checkpoint = checkpoint,
+                                            checkpoint_interval = checkpoint_interval,
+                                            checkpoint_key = None if checkpoint_key is None else [checkpoint_key, seed])
+
+    best = np.argmin(fun, axis = 1)
+    x = low + width * pop[np.arange(n_points), best]
+    fun = fun[np.arange(n_points), best]
+    if polish:
+        x, fun, nfev_polish = simplex_polish(lambda X, points: func(X, points, *args), x, fun, bounds)
+        nfev = nfev + nfev_polish
+
+    return OptimizeResult(x = x, fun = fun, nfev = nfev, nit = nit, success = converged,
+                          message = 'populations converged' if np.all(converged) else 'maximum number of generations reached')
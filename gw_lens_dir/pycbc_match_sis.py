@@ -14,6 +14,9 @@ from multiprocessing import Pool, freeze_support
 from joblib import Parallel, delayed
 from mpmath import *
 import csv
+from gw_lens_dir.amplification_table import F_table
+from gw_lens_dir import amplification
+from gw_lens_dir.amp_fact_cache import cached_F
 #from joblib.externals.loky import set_loky_pickler
 #set_loky_pickler("dill")
 
@@ -171,7 +174,7 @@ for i in range(len(freq_arr)):
     psd_analytical[i] = Sn(freq_arr[i])
 psd_analytical = FrequencySeries(psd_analytical, delta_f = 1/4)
 
-def amp_fact_sis_wo(y, ML, f = freq_arr):
+def amp_fact_sis_wo(y, ML, f = freq_arr, use_table = False, use_cache = False):
         '''computes the amplification factor for source SIS lens.
         Parameters
         ----------
@@ -179,24 +182,29 @@ def amp_fact_sis_wo(y, ML, f = freq_arr):
             frequency
         y : float
             source position
+        use_table : bool
+            interpolate F from the precomputed F(w, y) table (amplification_table.py) instead of
+            evaluating F at every frequency
+        use_cache : bool
+            read / store F in the on-disk cache shared between processes (amp_fact_cache.py)
         Return
         ----------
         F_val : array, complex
             Amplification factor for SIS
         '''
-        F_val_sis = np.zeros_like(f, dtype = np.complex128)
-        for i in range(len(f)):
-            w = 8 * pi * ML * f[i]
-            pre_factor = exp(1j * (w / 2) * (y**2 + 2 * (y + 0.5)))
-            func = lambda n: (gamma(1 + n / 2) / fac(n)) * (2 * w * exp(1j * 3 * (pi / 2))) ** (n / 2) * hyp1f1(1 + n / 2, 1, -1j * (w / 2) * y ** 2)
-            series_sum = nsum(func, [0, inf])
+        if use_table:
+            return F_table(np.asarray(f), ML, y, lens = 'sis')
+        if use_cache:
+            # shared with the other pycbc_match processes and with earlier runs (amp_fact_cache.py)
+            return cached_F('sis', amplification.F_sis, np.asarray(f), ML, y)
 
-            F_val_sis[i] = np.complex128(pre_factor * series_sum, dtype = np.complex128)
+        # double precision series / quasi geometrical optics instead of mp.nsum at every frequency
+        F_val_sis = amplification.F_sis(np.asarray(f), ML, y)
 
         return F_val_sis
 
-def pycbc_match(i, y, ML, return_dict = None, hf = hf):
-    hf_lensed_source = hf * amp_fact_sis_wo(y, ML)
+def pycbc_match(i, y, ML, return_dict = None, hf = hf, use_cache = False):
+    hf_lensed_source = hf * amp_fact_sis_wo(y, ML, use_cache = use_cache)
     pycbc_match = match(hf_lensed_source, hf, psd=psd_analytical, low_frequency_cutoff=20)[0]
     return_dict[i] = [y, ML, pycbc_match]
     #return pycbc_match
@@ -0,0 +1,184 @@
+"""
+Quasi geometrical optics: the stationary phase expansion of the diffraction integral
+
+    F(w, y) = (w / 2 pi i) int d^2x exp(i w (phi(x) - phi_m)),    phi(x) = |x - y|^2 / 2 - psi(|x|)
+
+around each image of an axially symmetric lens, carried to higher orders in 1 / w. Each image contributes
+
+    sqrt|mu_j| exp(i w (phi_j - phi_m) + i pi (sigma_j - 2) / 4) (1 + c_1 / w + c_2 / w^2 + ...)
+
+with sigma_j the signature of the Hessian of phi (2 for a minimum, 0 for a saddle point). The coefficients c_k
+follow from the Taylor expansion of phi around the image: the non Gaussian part of exp(i w phi) is expanded in
+powers of the displacement and integrated term by term against the Gaussian.
+"""
+
+import numpy as np
+from math import factorial
+from scipy.special import gamma
+
+def _poly_mul(p, q, degree):
+    '''product of two bivariate polynomials (coefficient arrays c[i, j] of s1^i s2^j), truncated at a total
+    degree.
+    '''
+    n = degree + 1
+    out = np.zeros((n, n), dtype = np.result_type(p, q))
+    for i, j in zip(*np.nonzero(p)):
+        if i + j > degree:
+            continue
+        sub = q[:n - i, :n - j]
+        out[i:, j:] += p[i, j] * sub
+    # drop the terms above the total degree
+    i_arr, j_arr = np.indices(out.shape)
+    out[i_arr + j_arr > degree] = 0
+
+    return out
+
+def _poly_compose(coeffs, u, degree):
+    '''sum_k coeffs[k] u^k for a bivariate polynomial u without constant term.
+    '''
+    n = degree + 1
+    out = np.zeros((n, n))
+    power = np.zeros((n, n))
+    power[0, 0] = 1.
+    for k, coeff in enumerate(coeffs):
+        if k > 0:
+            power = _poly_mul(power, u, degree)
+        out += coeff * power
+
+    return out
+
+def fermat_taylor(x_image, y, dpsi, degree):
+    '''Taylor expansion of phi(x) - phi(x_image) around an image, in the frame (s1 along the lens axis
+    through the source, s2 perpendicular to it).
+
+    Parameters
+    ----------
+    x_image : float
+        signed image position on the lens axis
+    y : float
+        source position
+    dpsi : callable
+        dpsi(r, n) returns the first n radial derivatives [psi', psi'', ...] of the lensing potential at r
+    degree : int
+        total degree of the expansion
+
+    Return
+    ----------
+    coeffs : array
+        coeffs[i, j] is the coefficient of s1^i s2^j
+    '''
+    n = degree + 1
+    r = np.abs(x_image)
+
+    # u = R^2 / r^2 - 1 with R the distance to the lens centre
+    u = np.zeros((n, n))
+    u[1, 0] = 2 / x_image
+    u[2, 0] = 1 / x_image**2
+    u[0, 2] = 1 / x_image**2
+
+    # R - r = r (sqrt(1 + u) - 1)
+    sqrt_coeffs = [0.] + [r * gamma(1.5) / (factorial(k) * gamma(1.5 - k)) for k in range(1, degree + 1)]
+    delta = _poly_compose(sqrt_coeffs, u, degree)
+
+    # psi(R) - psi(r)
+    psi_coeffs = [0.] + [d / factorial(k + 1) for k, d in enumerate(dpsi(r, degree))]
+    coeffs = -_poly_compose(psi_coeffs, delta, degree)
+
+    # geometric part |x - y|^2 / 2
+    coeffs[1, 0] += x_image - y
+    coeffs[2, 0] += 0.5
+    coeffs[0, 2] += 0.5
+
+    return coeffs
+
+def image_expansion(x_image, y, dpsi, order = 2):
+    '''coefficients of the 1 / w expansion of one image.
+
+    Parameters
+    ----------
+    x_image : float
+        signed image position on the lens axis
+    y : float
+        source position
+    dpsi : callable
+        radial derivatives of the lensing potential, see fermat_taylor()
+    order : int
+        highest power of 1 / w
+
+    Return
+    ----------
+    mu : float
+        magnification (1 / det of the Hessian)
+    morse : complex
+        exp(i pi (sigma - 2) / 4)
+    c : array, complex
+        c[k] multiplies w^-k (c[0] = 1)
+    '''
+    # k cubic factors of the non Gaussian part are needed up to k = 2 order
+    degree = 6 * order
+    taylor = fermat_taylor(x_image, y, dpsi, 2 * order + 2)
+    f_11 = 2 * taylor[2, 0]
+    f_22 = 2 * taylor[0, 2]
+
+    higher = taylor.copy()
+    higher[:2, :2] = 0
+    higher[2, 0] = higher[0, 2] = 0
+    higher = np.pad(higher, (0, degree - 2 * order - 2))
+
+    def moment(m, f):
+        # Gaussian moment of s^(2m) relative to the m = 0 one, times w^m
+        # int s^2m exp(i w f s^2 / 2) ds / int exp(i w f s^2 / 2) ds = Gamma(m + 1/2) / Gamma(1/2) (2 i / (w f))^m
+        return gamma(m + 0.5) / gamma(0.5) * (2j / f)**m
+
+    c = np.zeros(order + 1, dtype = np.complex128)
+    c[0] = 1.
+    # exp(i w H) = sum_k (i w)^k H^k / k!, and s1^2m1 s2^2m2 brings w^-(m1 + m2)
+    power = np.zeros((degree + 1, degree + 1))
+    power[0, 0] = 1.
+    for k in range(1, 2 * order + 1):
+        power = _poly_mul(power, higher, degree)
+        for i, j in zip(*np.nonzero(power)):
+            if i % 2 or j % 2:
+                continue
+            K = (i + j) // 2 - k
+            if 1 <= K <= order:
+                c[K] += 1j**k / factorial(k) * power[i, j] * moment(i // 2, f_11) * moment(j // 2, f_22)
+
+    det = f_11 * f_22
+    sigma = np.sign(f_11) + np.sign(f_22)
+    morse = np.exp(1j * np.pi * (sigma - 2) / 4)
+
+    return 1 / det, morse, c
+
+def F_images(w, y, images, phi_m, order = 2):
+    '''sum of the image contributions.
+
+    Parameters
+    ----------
+    w : array
+        dimensionless frequency
+    y : float
+        source position
+    images : list
+        (x_image, phi_image, mu, morse, c) of each image, see image_expansion()
+    phi_m : float
+        Fermat potential of the minimum image (phase reference)
+    order : int
+        number of 1 / w corrections kept
+
+    Return
+    ----------
+    F_val : array, complex
+    last : array
+        size of the last correction kept, sum_j sqrt|mu_j| |c_order| / w^order (error estimate)
+    '''
+    w = np.asarray(w, dtype = float)
+    F_val = np.zeros(w.shape, dtype = np.complex128)
+    last = np.zeros(w.shape)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        for _, phi_image, mu, morse, c in images:
+            corr = np.polyval(c[:order + 1][::-1], 1 / w)
+            F_val = F_val + np.sqrt(np.abs(mu)) * morse * np.exp(1j * w * (phi_image - phi_m)) * corr
+            last = last + np.sqrt(np.abs(mu)) * np.abs(c[order]) / w**order
+
+    return F_val, last
@@ -0,0 +1,297 @@
+"""
+Relative binning (heterodyning) of the overlap integrals for templates close to a fiducial one.
+
+The optimizers only move the template by small amounts around its best fit, and the ratio of a template to a
+fiducial template h_0,
+
+    r(f) = h_temp(f; x) / h_0(f),
+
+is then a smooth function of f even when the lensed source oscillates. Inside a bin [f_b, f_b+1] r is replaced
+by its polynomial interpolant through order + 1 nodes, r(f) ~ sum_j r(f_bj) L_bj(f), and the integrals become
+
+    <s, h>  = sum_b sum_j A_bj conj(r(f_bj)),          A_bj = 4 sum_f df s conj(h_0) L_bj / Sn
+    <h, h>  = sum_b sum_jk B_bjk r(f_bj) conj(r(f_bk)),  B_bjk = 4 sum_f df |h_0|^2 L_bj L_bk / Sn
+
+The summary coefficients A and B are computed once on the full grid, every overlap after that only needs the
+template at the n_bins * order + 1 nodes. The lensed source enters A exactly, so it does not constrain the
+bins: they only have to resolve the variation of r over the templates that are searched. For a shift of t_c
+by tau that is exp(2 pi i f tau), so the width of the bins follows from the time window, and a lensed source
+whose images are td apart puts the maxima at t_c ~ 0 ... td, i.e. bins of a fraction of 1 / td.
+
+The bins are chosen adaptively: starting from the low limit, every bin is made as wide as possible while the
+interpolant of the ratio of all the sample templates stays within eps of the ratio on the grid.
+"""
+
+import numpy as np
+from gw_lens_dir.inner_product import Sn, grid_weights, fft_maximize, lensed_strains
+
+def lobatto_nodes(order):
+    '''order + 1 Gauss-Lobatto nodes on [0, 1] (the ends included, so neighbouring bins share them).
+    '''
+    if order == 1:
+        return np.array([0., 1.])
+    inner = np.polynomial.legendre.Legendre.basis(order).deriv().roots()
+
+    return (np.concatenate([[-1.], np.sort(inner), [1.]]) + 1) / 2
+
+def lagrange_basis(t, nodes):
+    '''values L_j(t) of the Lagrange polynomials of the nodes, shape (len(nodes), len(t)).
+    '''
+    t = np.asarray(t, dtype = float)
+    basis = np.ones((len(nodes), len(t)))
+    for j, t_j in enumerate(nodes):
+        for k, t_k in enumerate(nodes):
+            if k != j:
+                basis[j] *= (t - t_k) / (t_j - t_k)
+
+    return basis
+
+def choose_bins(f, ratio, low, high, eps = 1e-3, order = 1, max_width = np.inf):
+    '''adaptive bin edges over [low, high].
+
+    Parameters
+    ----------
+    f : array
+        frequency grid
+    ratio : callable
+        ratio(f) returns the ratios of the sample templates to the fiducial one, shape (n_samples, len(f))
+    eps : float
+        largest allowed error of the interpolated ratio on the grid
+    order : int
+        order of the interpolating polynomial in a bin
+    max_width : float
+        largest bin width
+
+    Return
+    ----------
+    edges : array
+    '''
+    nodes = lobatto_nodes(order)
+    f = np.asarray(f, dtype = float)
+    f = f[(f >= low) & (f <= high)]
+
+    def bin_error(left, right):
+        inside = f[(f >= left) & (f <= right)]
+        if len(inside) == 0:
+            return 0.
+        exact = ratio(inside)
+        interp = ratio(left + (right - left) * nodes) @ lagrange_basis((inside - left) / (right - left), nodes)
+        return np.max(np.abs(interp - exact))
+
+    edges = [low]
+    width = min(max_width, high - low)
+    while edges[-1] < high:
+        left = edges[-1]
+        width = min(width, high - left, max_width)
+        # grow the last width until it fails, then bisect between the last good and the first bad width
+        good, bad = 0., None
+        while bad is None:
+            if bin_error(left, left + width) <= eps:
+                good = width
+                if width >= min(high - left, max_width):
+                    break
+                width = min(2 * width, high - left, max_width)
+            else:
+                bad = width
+        if bad is not None:
+            while bad - good > 1e-3 * bad:
+                mid = (good + bad) / 2
+                if bin_error(left, left + mid) <= eps:
+                    good = mid
+                else:
+                    bad = mid
+        # a bin can always hold one grid step
+        good = max(good, np.min(np.diff(f)) if len(f) > 1 else high - left)
+        edges.append(min(left + good, high))
+        width = good
+
+    return np.array(edges)
+
+
+class relative_binning():
+    """ Relative binning approximation of the overlap of a (lensed) source with templates near a fiducial one
+    """
+
+    def __init__(self, f, signal_source, template, x_fid, samples, psd = None, limits = None, eps = 1e-3,
+                 order = 1, max_width = np.inf):
+        '''
+        Parameters
+        ----------
+        f : array
+            frequency grid of the summary coefficients
+        signal_source : array, complex
+            (lensed) source strain on the grid
+        template : callable
+            template(f, x) returns the template strain at the parameters x (e.g. x = (t_c, phi_c))
+        x_fid : array
+            parameters of the fiducial template
+        samples : array
+            parameters of the templates used to choose the bins, shape (n_samples, len(x_fid)). They should
+            span the region searched by the optimizer.
+        psd : array
+            noise curve on the grid (defaults to Sn(f))
+        limits : tuple
+            (low_limit, upper_limit, f_cut_source, f_cut_temp) as returned by limit(). Defaults to the whole grid.
+        eps : float
+            largest error of the interpolated ratio of the sample templates
+        order : int
+            order of the interpolating polynomial in a bin (1 is the usual linear relative binning)
+        max_width : float
+            largest bin width
+        '''
+        self.f = np.asarray(f, dtype = float)
+        self.signal_source = np.asarray(signal_source, dtype = np.complex128)
+        self.template = template
+        self.x_fid = np.asarray(x_fid, dtype = float)
+        self.psd = Sn(self.f) if psd is None else np.asarray(psd, dtype = float)
+        if limits is None:
+            limits = (self.f[0], self.f[-1], self.f[-1], self.f[-1])
+        self.limits = limits
+        self.order = order
+
+        weight_num, weight_source, weight_temp = grid_weights(self.f, self.psd, limits)
+        self.norm_source = np.real(np.sum(weight_source * np.abs(self.signal_source)**2))
+
+        h_fid = template(self.f, self.x_fid)
+        samples = np.atleast_2d(samples)
+        fid = lambda f: template(f, self.x_fid)
+        ratio = lambda f: np.array([template(f, x) for x in samples]) / fid(f)
+
+        # the template norm runs to f_cut_temp, so the bins cover both integrals
+        low_limit, upper_limit, f_cut_source, f_cut_temp = limits
+        self.edges = choose_bins(self.f, ratio, low_limit, max(upper_limit, f_cut_temp), eps = eps, order = order,
+                                 max_width = max_width)
+
+        # nodes of all the bins, the ends are shared: node index of point j of bin b is b * order + j
+        nodes = lobatto_nodes(order)
+        widths = np.diff(self.edges)
+        self.f_nodes = np.append((self.edges[:-1, None] + widths[:, None] * nodes[None, :-1]).ravel(), self.edges[-1])
+        self.h_fid_nodes = fid(self.f_nodes)
+
+        # summary coefficients
+        n_bins = len(widths)
+        # the grid point just above a limit that is not on the grid still carries trapezoid weight, it is
+        # assigned to the last bin (and extrapolated by its polynomial)
+        b = np.clip(np.searchsorted(self.edges, self.f, side = 'right') - 1, 0, n_bins - 1)
+        L = lagrange_basis((self.f - self.edges[b]) / widths[b], nodes)
+        index = b[None, :] * order + np.arange(order + 1)[:, None]
+
+        cross = weight_num * self.signal_source * np.conjugate(h_fid)
+        power = weight_temp * np.abs(h_fid)**2
+        n_nodes = len(self.f_nodes)
+        self.A = np.zeros(n_nodes, dtype = np.complex128)
+        np.add.at(self.A, index.ravel(), (L * cross).ravel())
+        # B_jk only couples nodes of the same bin, stored as bands k - j = 0 ... order
+        self.B = np.zeros((order + 1, n_nodes))
+        for shift in range(order + 1):
+            for j in range(order + 1 - shift):
+                np.add.at(self.B[shift], index[j], L[j] * L[j + shift] * power)
+
+    def n_bins(self):
+
+        return len(self.edges) - 1
+
+    def ratio(self, x):
+        """ ratio of the template at x to the fiducial one at the nodes
+        """
+        return self.template(self.f_nodes, x) / self.h_fid_nodes
+
+    def inner(self, x, r = None):
+        """ Complex numerator 4 int h_source conj(h_temp(x)) / Sn df, r = ratio(x) if it is already known
+        """
+        r = self.ratio(x) if r is None else r
+
+        return np.sum(self.A * np.conjugate(r), axis = -1)
+
+    def norm_temp(self, x, r = None):
+
+        r = self.ratio(x) if r is None else r
+        norm = np.sum(self.B[0] * np.abs(r)**2, axis = -1)
+        n = r.shape[-1]
+        for shift in range(1, self.order + 1):
+            norm += 2 * np.sum(self.B[shift][:n - shift] * np.real(r[..., :n - shift] * np.conjugate(r[..., shift:])), axis = -1)
+
+        return norm
+
+    def overlap(self, x):
+        """ Drop-in replacement for the overlap(x) methods of the overlap classes (returns -overlap)
+        """
+        r = self.ratio(x)
+        num = np.real(self.inner(x, r))
+        if num == 0:
+            return 0.
+
+        return -1 * num / np.sqrt(self.norm_source * self.norm_temp(x, r))
+
+    def overlap_batch(self, x):
+        '''-overlap of a population of candidates x, shape (n_params, n_candidates), in one array computation.
+        The template has to broadcast over parameters of shape (n_candidates, 1).
+        '''
+        x = np.asarray(x, dtype = float)
+        r = self.ratio(tuple(x[:, None] if x.ndim == 1 else x[:, :, None]))
+        r = r[0] if x.ndim == 1 else r
+        num = np.real(self.inner(x, r))
+
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            return np.where(num == 0, 0., -1 * num / np.sqrt(self.norm_source * self.norm_temp(x, r)))
+
+
+def from_overlap(overlap_obj, amp_fact, amp_fact_temp = None, df = 1/16, vectorized = False, tc_bounds = (-0.2, 0.2),
+                 tc_span = None, td = 0., eps = 1e-4, order = 2, f = None):
+    '''relative binning engine of one of the overlap classes, for the (t_c, phi_c) search of the drivers.
+
+    The fiducial template is put at the best t_c of the full grid (fft_maximize), and the bins resolve shifts
+    of t_c up to tc_span around it.
+
+    Parameters
+    ----------
+    overlap_obj : object
+        instance of one of the overlap classes
+    amp_fact : callable
+        amplification factor of the source, e.g. overlap_obj.F_source_pm
+    amp_fact_temp : callable
+        amplification factor of the template (lensed templates only)
+    df : float
+        frequency resolution of the summary coefficients
+    vectorized : bool
+        set to True if the amplification factors accept a frequency array
+    tc_bounds : tuple
+        window of the search for the fiducial t_c
+    tc_span : float
+        largest shift of t_c from the fiducial one the bins resolve. Defaults to td + 2 / upper_limit (the
+        image delays plus the width of the overlap peak)
+    td : float
+        largest time delay between the images of the source
+    f : array
+        frequency grid of the summary coefficients instead of the uniform one, e.g. from multiband_grid()
+
+    Return
+    ----------
+    engine : relative_binning
+        engine.bounds are the (t_c, phi_c) bounds it resolves, to be passed to the optimizer. engine.overlap(x)
+        returns -overlap, like the overlap(x) methods of the overlap classes, overlap_grid and panel_overlap
+    '''
+    limits = overlap_obj.limit(overlap_obj.params_source, overlap_obj.params_temp)
+    low_limit, upper_limit, f_cut_source, f_cut_temp = limits
+    if f is None:
+        f = np.arange(low_limit, max(f_cut_source, f_cut_temp) + df, df)
+
+    source, signal_temp = lensed_strains(overlap_obj, amp_fact, amp_fact_temp = amp_fact_temp, vectorized = vectorized)
+    signal_source = source(f)
+    template = lambda f, x: signal_temp(f, x[0], x[1])
+
+    # fiducial t_c from the FFT of the full cross spectrum
+    weight_num = grid_weights(f, Sn(f), limits)[0]
+    t_fid, phi_fid, _ = fft_maximize(weight_num * signal_source * np.conjugate(template(f, (0., 0.))), f,
+                                     tc_bounds = tc_bounds)
+
+    if tc_span is None:
+        tc_span = td + 2 / upper_limit
+    # phi_c is an overall phase of the ratio, only the extreme t_c shifts matter for the bins
+    samples = [(t_fid - tc_span, phi_fid), (t_fid + tc_span, phi_fid)]
+
+    engine = relative_binning(f, signal_source, template, (t_fid, phi_fid), samples, limits = limits, eps = eps,
+                              order = order)
+    engine.bounds = [[max(tc_bounds[0], t_fid - tc_span), min(tc_bounds[1], t_fid + tc_span)], [-np.pi, np.pi]]
+
+    return engine
@@ -0,0 +1,303 @@
+"""
+Reduced order quadrature (ROQ) for the 1.5PN TaylorF2 strain() family.
+
+Over a prior range of (mcz, eta, t_c) the waveforms h(f) span a space of small dimension m. A reduced basis
+is built greedily from a training set, and the empirical interpolation method picks m frequency nodes F_k
+such that
+
+    h(f) ~ sum_k B_k(f) h(F_k)
+
+for every waveform of the family. The numerator of the overlap of a (lensed) source d with a template then
+only needs the template at the nodes,
+
+    4 sum_f df d(f) conj(h(f)) / Sn(f) ~ sum_k omega_k conj(h(F_k)),    omega_k = 4 sum_f df d conj(B_k) / Sn,
+
+with omega computed once per source. |h|^2 gets its own (smaller, t_c independent) basis and nodes for the
+template norm. phi_c is a global phase and is not part of the training set.
+
+Both weights are stored with their prefix sums over the frequency grid, so an upper limit of the integrals
+(which depends on the template through f_cut_temp) is a lookup plus the partial interval up to it, the same
+integral as trapz_weights(f, low_limit, f_high).
+
+A basis is built, validated and saved with
+
+    python -m gw_lens_dir.roq --mcz 15 25 --eta 0.2 0.25 --tc -0.2 0.2 --path roq_15_25.npz
+"""
+
+import argparse
+import numpy as np
+from gw_lens_dir.inner_product import strain, Sn, trapz_weights, cumulative_trapz, cumulative_at
+
+solar_mass = 4.92624076 * 10**-6 #[solar_mass] = sec
+
+# generic sky and orientation angles: they only give a constant complex factor
+ANGLES = (0.8, 0.6, 0.4, 1.2)
+
+def waveform(f, mcz, eta, tc):
+    '''strain() with generic angles, unit distance and phi_c = 0.
+    '''
+    return strain(f, *ANGLES, mcz, 1., eta, tc, 0.)
+
+def draw_params(prior, n, rng):
+    '''n uniform draws of (mcz, eta, tc) from prior = {'mcz': (lo, hi), 'eta': (lo, hi), 'tc': (lo, hi)}.
+    '''
+    return np.column_stack([rng.uniform(*prior[name], n) for name in ['mcz', 'eta', 'tc']])
+
+def greedy_basis(train, weights, tol, basis = None, max_basis = 1000):
+    '''orthonormal reduced basis of the training set (rows, normalised) by greedy selection: the worst
+    represented training vector is added until the largest squared projection error is below tol.
+
+    Parameters
+    ----------
+    basis : array, complex
+        basis to extend (defaults to an empty one)
+
+    Return
+    ----------
+    basis : array, complex
+        (m, n_freq), orthonormal in the inner product sum(weights * a * conj(b))
+    n_added : int
+        number of vectors added
+    '''
+    if basis is None:
+        basis = np.zeros((0, train.shape[1]), dtype = np.complex128)
+    proj_err = 1 - np.sum(np.abs(train @ (weights * np.conjugate(basis)).T)**2, axis = 1)
+
+    n_added = 0
+    i = int(np.argmax(proj_err))
+    while proj_err[i] >= tol and len(basis) < max_basis:
+        vec = train[i].copy()
+        # twice, for the orthogonality of the Gram-Schmidt step
+        for _ in range(2):
+            vec -= (np.conjugate(basis) @ (weights * vec)) @ basis
+        vec /= np.sqrt(np.sum(weights * np.abs(vec)**2))
+        basis = np.vstack([basis, vec])
+        n_added += 1
+
+        proj_err -= np.abs(train @ (weights * np.conjugate(vec)))**2
+        i = int(np.argmax(proj_err))
+
+    return basis, n_added
+
+def empirical_interpolation(basis):
+    '''nodes and interpolant of the empirical interpolation method.
+
+    Return
+    ----------
+    nodes : array
+        indices of the m frequency nodes
+    B : array, complex
+        (n_freq, m) interpolant, h ~ B @ h[nodes]
+    '''
+    nodes = [int(np.argmax(np.abs(basis[0])))]
+    for j in range(1, len(basis)):
+        V = basis[:j, nodes].T
+        coeffs = np.linalg.solve(V, basis[j, nodes])
+        residual = basis[j] - coeffs @ basis[:j]
+        nodes.append(int(np.argmax(np.abs(residual))))
+
+    nodes = np.array(nodes)
+    V = basis[:, nodes].T
+    B = np.linalg.solve(V.T, basis).T
+
+    return nodes, B
+
+
+class roq_basis():
+    """ Linear (h) and quadratic (|h|^2) empirical interpolants of strain() on a frequency grid
+    """
+
+    def __init__(self, f, nodes, B, quad_nodes, C, prior = None, report = None):
+
+        self.f = np.asarray(f, dtype = float)
+        self.nodes = np.asarray(nodes)
+        self.B = np.asarray(B)
+        self.quad_nodes = np.asarray(quad_nodes)
+        self.C = np.asarray(C)
+        self.prior = prior
+        self.report = report
+
+    @property
+    def f_nodes(self):
+
+        return self.f[self.nodes]
+
+    @property
+    def f_quad_nodes(self):
+
+        return self.f[self.quad_nodes]
+
+    def save(self, path):
+
+        np.savez(path, f = self.f, nodes = self.nodes, B = self.B, quad_nodes = self.quad_nodes, C = self.C,
+                 prior = np.array([self.prior[name] for name in ['mcz', 'eta', 'tc']]),
+                 report = np.array(list(self.report.items()), dtype = object) if self.report else np.array([]))
+
+    @classmethod
+    def load(cls, path):
+
+        data = np.load(path, allow_pickle = True)
+        prior = dict(zip(['mcz', 'eta', 'tc'], map(tuple, data['prior'])))
+        report = dict(data['report']) if len(data['report']) else None
+
+        return cls(data['f'], data['nodes'], data['B'], data['quad_nodes'], data['C'], prior = prior, report = report)
+
+    def weights(self, data, psd = None, low_limit = 20):
+        '''ROQ weights of a (lensed) source, with their prefix sums over the grid.
+
+        Parameters
+        ----------
+        data : array, complex
+            source strain on the grid
+        psd : array
+            noise curve on the grid (defaults to Sn(f))
+
+        Return
+        ----------
+        omega : tuple
+            (integrand, prefix sums from low_limit) of the numerator weights, both (m, n_freq) complex
+        psi : tuple
+            (integrand, prefix sums from low_limit) of the norm weights, both (m_quad, n_freq)
+        '''
+        psd = Sn(self.f) if psd is None else psd
+        with np.errstate(divide = 'ignore'):
+            inv_psd = np.where(np.isinf(psd), 0., 1 / psd)
+
+        omega = self._prefix(4 * inv_psd * data * np.conjugate(self.B.T), low_limit)
+        psi = self._prefix(4 * inv_psd * np.real(self.C.T), low_limit)
+
+        return omega, psi
+
+    def _prefix(self, g, low_limit):
+
+        C = cumulative_trapz(self.f, g)
+        return g, C - cumulative_at(self.f, g, C, low_limit)[..., None]
+
+    def _integral(self, weights, f_high):
+        """ int_low_limit^f_high of the weights, exact for f_high between grid points
+        """
+        return cumulative_at(self.f, weights[0], weights[1], f_high)
+
+    def inner(self, omega, h_nodes, f_high):
+        """ 4 int^f_high d conj(h) / Sn df from the template at the nodes
+        """
+        return np.sum(self._integral(omega, f_high) * np.conjugate(h_nodes))
+
+    def norm(self, psi, h_quad_nodes, f_high):
+        """ 4 int^f_high |h|^2 / Sn df from the template at the quadratic nodes
+        """
+        return np.sum(self._integral(psi, f_high) * np.abs(h_quad_nodes)**2)
+
+def build_roq(prior, df = 1/16, f_low = 20, n_train = 1000, max_rounds = 20, tol = 1e-10, quad_tol = 1e-12, n_test = 200,
+              psd = None, seed = 0):
+    '''builds the linear and quadratic ROQ of strain() over prior and validates it on random draws.
+
+    Parameters
+    ----------
+    prior : dict
+        {'mcz': (lo, hi), 'eta': (lo, hi), 'tc': (lo, hi)}, mcz in seconds
+    df : float
+        frequency resolution of the grid (up to the ISCO frequency of the lightest binary of the prior)
+    n_train : int
+        size of each training set
+    max_rounds : int
+        largest number of training sets (a new set is drawn while the previous one still added vectors)
+    tol, quad_tol : float
+        largest squared projection error of the training set onto the linear and quadratic bases
+    n_test : int
+        number of random draws of the validation report
+
+    Return
+    ----------
+    roq : roq_basis
+        roq.report holds the size of the bases and the largest relative representation errors on the
+        validation draws (of h, of |h|^2 and of the overlap numerator with a shifted template)
+    '''
+    rng = np.random.default_rng(seed)
+    M_min = prior['mcz'][0] / np.power(prior['eta'][1], 3/5)
+    f_high = 1 / (np.power(6, 3/2) * np.pi * M_min)
+    f = np.arange(f_low, f_high + df, df)
+
+    psd = Sn(f) if psd is None else psd
+    with np.errstate(divide = 'ignore'):
+        inv_psd = np.where(np.isinf(psd), 0., 1 / psd)
+    weights = 4 * trapz_weights(f, f_low, f[-1]) * inv_psd
+
+    def normalised(h):
+        return h / np.sqrt(np.sum(weights * np.abs(h)**2, axis = -1, keepdims = True))
+
+    # training sets of n_train draws until a whole new set is represented to tol
+    basis = quad_basis = None
+    for _ in range(max_rounds):
+        train = normalised(np.array([waveform(f, *params) for params in draw_params(prior, n_train, rng)]))
+        basis, n_added = greedy_basis(train, weights, tol, basis = basis)
+        # |h|^2 does not depend on t_c
+        quad_basis, n_quad_added = greedy_basis(normalised(np.abs(train)**2 + 0j), weights, quad_tol, basis = quad_basis)
+        if n_added == 0 and n_quad_added == 0:
+            break
+
+    nodes, B = empirical_interpolation(basis)
+    quad_nodes, C = empirical_interpolation(quad_basis)
+
+    roq = roq_basis(f, nodes, B, quad_nodes, C, prior = prior)
+    roq.report = validate(roq, n_test = n_test, psd = psd, seed = seed + 1)
+
+    return roq
+
+def validate(roq, n_test = 200, psd = None, seed = 1):
+    '''largest representation errors of the interpolants on random draws from the prior.
+
+    Return
+    ----------
+    report : dict
+        'n_basis', 'n_quad_basis', 'max_err_h' (weighted relative L2 error of h), 'max_err_norm' (relative
+        error of <h, h>) and 'max_err_inner' (error of the normalised numerator <h_1, h_2>). The norms and the
+        numerator are integrated up to an f_high drawn uniformly in the upper half of the band, as the
+        template cuts of the overlaps are never on the grid
+    '''
+    rng = np.random.default_rng(seed)
+    f = roq.f
+    psd = Sn(f) if psd is None else psd
+    with np.errstate(divide = 'ignore'):
+        inv_psd = np.where(np.isinf(psd), 0., 1 / psd)
+    weights = 4 * trapz_weights(f, f[0], f[-1]) * inv_psd
+
+    err_h, err_norm, err_inner = [], [], []
+    params_arr = draw_params(roq.prior, 2 * n_test, rng)
+    f_high_arr = rng.uniform((f[0] + f[-1]) / 2, f[-1], n_test)
+    for params_1, params_2, f_high in zip(params_arr[:n_test], params_arr[n_test:], f_high_arr):
+        h_1 = waveform(f, *params_1)
+        h_2 = waveform(f, *params_2)
+        err_h.append(np.sqrt(np.sum(weights * np.abs(h_1 - roq.B @ h_1[roq.nodes])**2) / np.sum(weights * np.abs(h_1)**2)))
+
+        weights_cut = 4 * trapz_weights(f, f[0], f_high) * inv_psd
+        norm_1 = np.sum(weights_cut * np.abs(h_1)**2)
+        norm_2 = np.sum(weights_cut * np.abs(h_2)**2)
+        omega, psi = roq.weights(h_1, psd = psd, low_limit = f[0])
+        err_norm.append(np.abs(roq.norm(psi, h_1[roq.quad_nodes], f_high) - norm_1) / norm_1)
+        exact = np.sum(weights_cut * h_1 * np.conjugate(h_2))
+        err_inner.append(np.abs(roq.inner(omega, h_2[roq.nodes], f_high) - exact) / np.sqrt(norm_1 * norm_2))
+
+    return {'n_basis': len(roq.nodes), 'n_quad_basis': len(roq.quad_nodes), 'n_freq': len(f),
+            'max_err_h': float(np.max(err_h)), 'max_err_norm': float(np.max(err_norm)),
+            'max_err_inner': float(np.max(err_inner))}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = 'build and validate a ROQ basis of strain()')
+    parser.add_argument('--mcz', type = float, nargs = 2, required = True, help = 'chirp mass range (solar masses)')
+    parser.add_argument('--eta', type = float, nargs = 2, default = [0.2, 0.25])
+    parser.add_argument('--tc', type = float, nargs = 2, default = [-0.2, 0.2])
+    parser.add_argument('--df', type = float, default = 1/16)
+    parser.add_argument('--n_train', type = int, default = 1000)
+    parser.add_argument('--tol', type = float, default = 1e-10)
+    parser.add_argument('--path', default = 'roq.npz')
+    args = parser.parse_args()
+
+    prior = {'mcz': (args.mcz[0] * solar_mass, args.mcz[1] * solar_mass), 'eta': tuple(args.eta), 'tc': tuple(args.tc)}
+    roq = build_roq(prior, df = args.df, n_train = args.n_train, tol = args.tol)
+    roq.save(args.path)
+    print(f'saved {args.path}')
+    for key, value in roq.report.items():
+        print(f'{key}: {value}')
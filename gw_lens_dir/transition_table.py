@@ -0,0 +1,160 @@
+"""
+Transition frequency of the SIS lens from a precomputed table.
+
+get_f_transition() used to evaluate F_source_sis at 500 frequencies and look for the first peak of |F| on
+every call. F only depends on w = 8 pi M_lz f and y, so the first peak sits at w_peak(y) and the transition
+frequency is f_transition = w_peak(y) / (8 pi M_lz). w_peak(y) is tabulated once, saved to disk and
+interpolated; y outside the table falls back to a scan plus a bounded refinement of the peak.
+
+The table is committed in tables/w_peak_sis.npz and (re)built with
+
+    python -m gw_lens_dir.transition_table
+
+A missing table raises instead of being built by every worker of a sweep.
+"""
+
+import os
+import argparse
+import tempfile
+import numpy as np
+from scipy.interpolate import CubicSpline
+from scipy.optimize import minimize_scalar
+from scipy.signal import find_peaks
+from gw_lens_dir import amplification
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables', 'w_peak_sis.npz')
+
+def abs_F_sis(w, y):
+    """ |F| of the SIS lens as a function of the dimensionless frequency
+    """
+    return np.abs(amplification.F_sis(np.asarray(w) / (8 * np.pi), 1., y))
+
+def find_w_peak(y, n_w = 30, xtol = 1e-6):
+    '''position of the first peak of |F_sis(w, y)|.
+
+    The peak is first bracketed on a coarse grid around w ~ 1 / y (the interference period of the two
+    images is pi / y) and then refined with a bounded scalar maximization.
+
+    Parameters
+    ----------
+    y : float
+        source position
+    n_w : int
+        number of points of the coarse grid
+    xtol : float
+        tolerance of the refinement
+
+    Return
+    ----------
+    w_peak : float
+    '''
+    w_low = 0.
+    w_high = 3 / y
+    while True:
+        w_arr = np.linspace(w_low, w_high, n_w + 1)[1:]
+        peaks, _ = find_peaks(abs_F_sis(w_arr, y))
+        if len(peaks) > 0:
+            break
+        # no peak yet, keep the last two points so a peak at the edge is not missed
+        w_low = w_arr[-3]
+        w_high = w_high + 3 / y
+
+    i = peaks[0]
+    res = minimize_scalar(lambda w: -abs_F_sis(w, y), bounds = (w_arr[i - 1], w_arr[i + 1]), method = 'bounded',
+                          options = {'xatol': xtol})
+
+    return res.x
+
+def build_table(y_arr = np.geomspace(0.02, 2, 48), path = TABLE_PATH):
+    '''tabulates w_peak(y) and saves it to path.
+    '''
+    w_peak_arr = np.array([find_w_peak(y) for y in y_arr])
+
+    # write then rename, so a process loading the table never sees a partial file
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok = True)
+    fd, tmp = tempfile.mkstemp(dir = directory, suffix = '.tmp')
+    with os.fdopen(fd, 'wb') as fh:
+        np.savez(fh, y = y_arr, w_peak = w_peak_arr)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+    return y_arr, w_peak_arr
+
+
+class w_peak_table():
+    """ w_peak(y) interpolated from the table on disk
+    """
+
+    def __init__(self, path = TABLE_PATH):
+
+        self.path = path
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"no table at {path}, build it with python -m gw_lens_dir.transition_table")
+
+        data = np.load(path)
+        self.y_arr = data['y']
+        self.w_peak_arr = data['w_peak']
+
+        # w_peak ~ 1 / y, so the table is interpolated in log-log
+        self.spline = CubicSpline(np.log(self.y_arr), np.log(self.w_peak_arr))
+
+    def __call__(self, y):
+
+        if self.y_arr[0] <= y <= self.y_arr[-1]:
+            return float(np.exp(self.spline(np.log(y))))
+
+        return find_w_peak(y)
+
+
+_table = None
+
+def f_transition(M_lz, y):
+    '''frequency of the first peak of |F_sis| (after which geometrical optics is valid).
+
+    Parameters
+    ----------
+    M_lz : float
+        redshifted lens mass (in seconds)
+    y : float
+        source position
+    '''
+    global _table
+    if _table is None:
+        _table = w_peak_table()
+
+    return _table(y) / (8 * np.pi * M_lz)
+
+def F_hybrid_sis(f, M_lz, y):
+    '''SIS amplification factor of overlap_sis.overlap(): wave optics (amplification.F_sis) below f_transition,
+    geometrical optics (amplification.F_geo_sis) above it.
+
+    Parameters
+    ----------
+    f : array
+        frequency
+    M_lz : float
+        redshifted lens mass (in seconds)
+    y : float
+        source position
+    '''
+    f = np.asarray(f, dtype = float)
+    wave = f < f_transition(M_lz, y)
+    F_val = np.array(amplification.F_geo_sis(f, M_lz, y), dtype = np.complex128)
+    if np.any(wave):
+        F_val[wave] = amplification.F_sis(f[wave], M_lz, y)
+
+    return F_val
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = 'build the w_peak(y) table of the SIS lens')
+    parser.add_argument('--y_min', type = float, default = 0.02)
+    parser.add_argument('--y_max', type = float, default = 2)
+    parser.add_argument('--n_y', type = int, default = 48)
+    parser.add_argument('--path', default = TABLE_PATH)
+    args = parser.parse_args()
+
+    y_arr, w_peak_arr = build_table(np.geomspace(args.y_min, args.y_max, args.n_y), path = args.path)
+    print(f'saved {args.path}: w_peak(y) at {len(y_arr)} source positions')
@@ -0,0 +1,142 @@
+"""
+Warm-started sweeps of the (t_c, phi_c) optimization along a path in lens parameters.
+
+The optimal (t_c, phi_c) moves continuously with M_lz, y or the SIE source position, so instead of a global
+search at every grid point the points are ordered along the path and each one starts a local
+Nelder-Mead search from the optimum of its neighbour. A global search is only run for the first point and
+where the local result looks discontinuous: the overlap jumps by more than jump_tol from the previous point,
+or the local optimum sits on a t_c bound. A backward pass then restarts every point from the optimum of the
+point after it, which carries a better peak found further down the path back to the points before it. The
+optima are returned with the results, and a previous result table can seed a new sweep (seeds).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from gw_lens_dir.population import population_optimize
+from gw_lens_dir.maximize import BOUNDS
+
+def path_order(points):
+    '''order of the points along the sweep: sorted for a 1d sweep, greedy nearest neighbour (in coordinates
+    scaled to the range of each parameter) starting from the smallest first coordinate otherwise.
+    '''
+    points = np.asarray(points, dtype = float)
+    if points.ndim == 1:
+        return np.argsort(points, kind = 'stable')
+
+    span = np.ptp(points, axis = 0)
+    scaled = points / np.where(span > 0, span, 1)
+    order = [int(np.argmin(points[:, 0]))]
+    left = set(range(len(points))) - set(order)
+    while left:
+        left_arr = np.array(sorted(left))
+        nearest = left_arr[np.argmin(np.sum((scaled[left_arr] - scaled[order[-1]])**2, axis = 1))]
+        order.append(int(nearest))
+        left.remove(nearest)
+
+    return np.array(order)
+
+def wrap_phase(phi_c):
+    '''phi_c in [-pi, pi).
+    '''
+    return (phi_c + np.pi) % (2 * np.pi) - np.pi
+
+def local_search(objective, x0, bounds = BOUNDS, steps = (2e-3, 0.3)):
+    '''Nelder-Mead from x0. phi_c is periodic, so its bound is widened by a period and the result wrapped.
+
+    Return
+    ----------
+    res : OptimizeResult
+    '''
+    x0 = np.array(x0, dtype = float)
+    local_bounds = [bounds[0], [bounds[1][0] - np.pi, bounds[1][1] + np.pi]]
+    simplex = x0 + np.vstack([np.zeros(2), np.diag(steps)])
+    simplex[:, 0] = np.clip(simplex[:, 0], *bounds[0])
+    res = minimize(objective, x0, method = 'Nelder-Mead', bounds = local_bounds,
+                   options = {'initial_simplex': simplex, 'xatol': 1e-8, 'fatol': 1e-10})
+    res.x[1] = wrap_phase(res.x[1])
+
+    return res
+
+def global_search(objective, bounds = BOUNDS, x0 = None, seed = 42, maxiter = 100, **options):
+    '''the global search of the drivers (population_optimize), started from x0 when there is one.
+
+    seed, maxiter and the other options of population_optimize are the budget of the search, a driver passes
+    its own with functools.partial(global_search, maxiter = ...) as the global_opt of warm_sweep.
+    '''
+    return population_optimize(objective, bounds = bounds, seed = seed, maxiter = maxiter, x0 = x0, **options)
+
+def warm_sweep(make_objective, points, names = None, bounds = BOUNDS, jump_tol = 0.02, seeds = None,
+               global_opt = global_search, backward = True):
+    '''optimal overlaps of a sweep, each point warm started from its neighbour.
+
+    Parameters
+    ----------
+    make_objective : callable
+        make_objective(point) returns the objective of a point, e.g. overlap_sis(...).overlap (-overlap)
+    points : array
+        lens parameters of the sweep, shape (n,) or (n, n_params)
+    names : list
+        column names of the lens parameters in the results
+    bounds : list
+        (t_c, phi_c) bounds
+    jump_tol : float
+        a change of the overlap larger than this between neighbours triggers a global search
+    seeds : DataFrame
+        results of a previous sweep (same names, 'tc' and 'phi_c'): every point starts from the optimum of the
+        nearest seed, and the first point does not need a global search
+    global_opt : callable
+        global_opt(objective, bounds, x0) returns an OptimizeResult
+    backward : bool
+        run the backward pass
+
+    Return
+    ----------
+    df_res : DataFrame
+        in the order of points: lens parameters, overlap, tc, phi_c, the search that gave the optimum
+        ('local', 'global' or 'backward') and the number of objective evaluations
+    '''
+    points = np.asarray(points, dtype = float)
+    coords = points[:, None] if points.ndim == 1 else points
+    if names is None:
+        names = ['param_' + str(i) for i in range(coords.shape[1])]
+    if seeds is not None:
+        seed_coords = seeds[list(names)].to_numpy(dtype = float)
+        seed_x = seeds[['tc', 'phi_c']].to_numpy(dtype = float)
+
+    objectives = {}
+    results = {}
+    x_prev, overlap_prev = None, None
+    order = path_order(points)
+    for i in order:
+        objective = objectives[i] = make_objective(points[i])
+        x0 = x_prev
+        if seeds is not None:
+            x0 = seed_x[np.argmin(np.sum((seed_coords - coords[i])**2, axis = 1))]
+
+        if x0 is None:
+            res = global_opt(objective, bounds, None)
+            search, nfev = 'global', res.nfev
+        else:
+            res = local_search(objective, x0, bounds = bounds)
+            search, nfev = 'local', res.nfev
+            on_bound = np.isclose(res.x[0], bounds[0][0]) or np.isclose(res.x[0], bounds[0][1])
+            jumped = overlap_prev is not None and np.abs(-res.fun - overlap_prev) > jump_tol
+            if on_bound or jumped or not np.isfinite(res.fun):
+                res_global = global_opt(objective, bounds, res.x if np.isfinite(res.fun) else None)
+                nfev += res_global.nfev
+                if not np.isfinite(res.fun) or res_global.fun < res.fun:
+                    res, search = res_global, 'global'
+
+        x_prev, overlap_prev = np.array(res.x, dtype = float), -res.fun
+        results[i] = [-res.fun, res.x[0], wrap_phase(res.x[1]), search, nfev]
+
+    if backward:
+        for i_next, i in zip(order[::-1][:-1], order[::-1][1:]):
+            res = local_search(objectives[i], results[i_next][1:3], bounds = bounds)
+            results[i][4] += res.nfev
+            if -res.fun > results[i][0] + 1e-12:
+                results[i][:4] = [-res.fun, res.x[0], res.x[1], 'backward']
+
+    return pd.DataFrame([list(coords[i]) + results[i] for i in range(len(points))],
+                        columns = list(names) + ['overlap', 'tc', 'phi_c', 'search', 'nfev'])
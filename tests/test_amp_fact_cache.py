@@ -0,0 +1,39 @@
+import os
+import numpy as np
+from gw_lens_dir.amp_fact_cache import amp_fact_cache, cache_key
+
+def test_hits_misses_and_version(tmp_path):
+    cache = amp_fact_cache(path = str(tmp_path))
+    f = np.linspace(20, 100, 50)
+    F_val = cache.get('sis', {'M_lz': 1e-2, 'y': 0.3}, f, lambda: np.exp(1j * f))
+    F_hit = cache.get('sis', {'M_lz': 1e-2, 'y': 0.3}, f, lambda: np.zeros_like(f))
+    assert np.array_equal(F_hit, F_val)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # arrays of another implementation or tolerance of F are not served
+    params = {'M_lz': 1e-2, 'y': 0.3}
+    assert cache_key('sis', params, f) != cache_key('sis', params, f, version = 'mpmath')
+
+def test_load_from_read_only_cache(tmp_path, monkeypatch):
+    cache = amp_fact_cache(path = str(tmp_path))
+    f = np.linspace(20, 100, 50)
+    cache.get('pm', {'M_lz': 1e-2, 'y': 0.3}, f, lambda: np.exp(1j * f))
+
+    def read_only(path, times = None):
+        raise PermissionError(path)
+    monkeypatch.setattr(os, 'utime', read_only)
+    assert cache.load(cache_key('pm', {'M_lz': 1e-2, 'y': 0.3}, f)) is not None
+
+def test_prune_from_size_estimate(tmp_path, monkeypatch):
+    f = np.linspace(20, 100, 1000)
+    entry_bytes = 16 * len(f) + 128
+    cache = amp_fact_cache(path = str(tmp_path), max_bytes = 3 * entry_bytes)
+    n_listed = []
+    entries = cache.entries
+    monkeypatch.setattr(cache, 'entries', lambda: n_listed.append(1) or entries())
+
+    for i in range(6):
+        cache.get('sis', {'M_lz': 1e-2, 'y': 0.1 * (i + 1)}, f, lambda: np.exp(1j * f))
+    # listed once for the first estimate and once per prune, not on every miss
+    assert len(n_listed) < 6
+    assert cache.size() <= 3 * entry_bytes
@@ -0,0 +1,26 @@
+import numpy as np
+from gw_lens_dir import amplification
+
+def test_F_pm_w_matches_mpmath():
+    w = np.array([0.05, 0.5, 3., 12., 40., 90.])
+    methods = set()
+    for y in [0.1, 0.6, 1.5]:
+        F_val, method = amplification.F_pm_w(w, y, return_method = True)
+        F_ref = np.array([amplification.F_pm_mpmath(w_val, y) for w_val in w])
+        assert np.max(np.abs(F_val - F_ref)) < amplification.TOL
+        methods.update(method)
+    assert {'series', 'asymptotic'} <= methods
+
+def test_F_sis_w_matches_mpmath():
+    methods = set()
+    for y, w in [(0.1, [0.05, 0.5, 3., 12., 40.]), (0.6, [40., 60.]), (0.3, [100.])]:
+        F_val, method = amplification.F_sis_w(np.array(w), y, return_method = True)
+        F_ref = amplification.F_sis_mpmath_grid(np.array(w), y)
+        assert np.max(np.abs(F_val - F_ref)) < amplification.TOL
+        methods.update(method)
+    assert methods == {'series', 'asymptotic', 'quadrature'}
+
+def test_F_sis_mpmath_grid_matches_nsum():
+    w = np.array([0.3, 2., 8.])
+    F_ref = np.array([amplification.F_sis_mpmath(w_val, 0.4) for w_val in w])
+    assert np.allclose(amplification.F_sis_mpmath_grid(w, 0.4), F_ref, rtol = 0, atol = 1e-10)
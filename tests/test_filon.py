@@ -0,0 +1,27 @@
+import numpy as np
+from gw_lens_dir.filon import legendre_panels
+from gw_lens_dir.panel_quad import panel_quad
+
+def reference(g, a, b, tau):
+    '''int_a^b g(f) exp(2 pi i f tau) df, resolving every oscillation (QUADPACK's cos / sin weights are only
+    good to ~1e-9 here).
+    '''
+    return panel_quad(lambda f: g(f) * np.exp(2j * np.pi * f * tau), a, b, rtol = 1e-14, n_panels = 2048)[0]
+
+def test_filon_matches_reference():
+    g = lambda f: f**(-7 / 3) * (1 + 0.1 * np.sin(f / 30))
+    a, b = 20., 300.
+    expansion = legendre_panels(g, a, b)
+    tau = np.array([0., 1e-3, 0.05, 2., -2., 300.])
+    G = expansion.integral(tau)
+    G_ref = np.array([reference(g, a, b, t) for t in tau])
+    assert np.allclose(G, G_ref, rtol = 0, atol = 1e-10 * expansion.abs_integral)
+
+def test_filon_incoherent_limit():
+    g = lambda f: f**(-7 / 3)
+    expansion = legendre_panels(g, 20., 300.)
+    tau_max = expansion.incoherent_delay(1e-6)
+    G = expansion.oscillatory_integral([0.5 * tau_max, 2 * tau_max], tol = 1e-6)
+    # the bound holds where G is resolved and G is zero beyond it
+    assert np.abs(G[0]) <= 1e-6 * expansion.abs_integral * 2
+    assert G[1] == 0
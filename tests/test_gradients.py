@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from gw_lens_dir.gradients import differentiable_overlap
+
+solar_mass = 4.92624076 * 10**-6 #[solar_mass] = sec
+giga_parsec = 1.02927125 * 10**17 #[giga_parsec] = sec
+
+params_source = {'theta_s_source': 0.0, 'phi_s_source': 0.0, 'theta_l_source': 0.0, 'phi_l_source': 0.0,
+                 'mcz_source': 18.79 * solar_mass, 'dist_source': 1.58 * giga_parsec, 'eta_source': 0.25,
+                 't0': 0.0, 'phi_0': 0.0}
+params_temp = {'theta_s_temp': 0.0, 'phi_s_temp': 0.0, 'theta_l_temp': 0.0, 'phi_l_temp': 0.0,
+               'mcz_temp': 18.85 * solar_mass, 'dist_temp': 1.58 * giga_parsec, 'eta_temp': 0.24}
+
+CASES = [
+    (None, None, ('tc', 'phi_c', 'mcz_temp', 'eta_temp', 'dist_temp'),
+     [2e-3, 0.4, 18.85 * solar_mass, 0.24, 1.58 * giga_parsec]),
+    ('pm_geo', {'M_lz': 500 * solar_mass, 'y': 0.6}, ('tc', 'phi_c', 'M_lz', 'y'), [1e-3, -0.3, 500 * solar_mass, 0.6]),
+    ('sis_geo', {'M_lz': 800 * solar_mass, 'y': 0.4}, ('tc', 'M_lz', 'y'), [1e-3, 800 * solar_mass, 0.4]),
+    ('sie', {'mu': [3., -2.5, 1.5, -1.], 'td': [0., 3e-3, 5e-3, 8e-3]}, ('phi_c', 'mu_2', 'td_3', 'mcz_temp'),
+     [0.2, -2.5, 5e-3, 18.85 * solar_mass]),
+]
+
+@pytest.mark.parametrize('lens, lens_params, names, x', CASES)
+def test_gradient_matches_finite_differences(lens, lens_params, names, x):
+    model = differentiable_overlap(params_source, params_temp, lens = lens, lens_params = lens_params, names = names)
+    x = np.array(x, dtype = float)
+    overlap, grad = model.value_and_grad(x)
+    assert np.isclose(overlap, -model.overlap(x))
+
+    for i in range(len(x)):
+        step = 1e-6 * max(abs(x[i]), 1e-3)
+        up, down = x.copy(), x.copy()
+        up[i] += step
+        down[i] -= step
+        numeric = (model.value_and_grad(up)[0] - model.value_and_grad(down)[0]) / (2 * step)
+        # the overlap does not depend on dist_temp, its derivative is only rounding
+        assert np.isclose(grad[i], numeric, rtol = 1e-6, atol = 1e-12), names[i]
+
+def test_jac_is_the_gradient_of_overlap():
+    model = differentiable_overlap(params_source, params_temp, names = ('tc', 'phi_c'))
+    x = np.array([1e-3, 0.5])
+    np.testing.assert_array_equal(model.jac(x), -1 * model.value_and_grad(x)[1])
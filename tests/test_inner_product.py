@@ -0,0 +1,58 @@
+import numpy as np
+from scipy.integrate import quad
+from gw_lens_dir.inner_product import Sn, strain, limit, overlap_grid
+
+solar_mass = 4.92624076 * 10**-6 #[solar_mass] = sec
+giga_parsec = 1.02927125 * 10**17 #[giga_parsec] = sec
+
+def source(f):
+    return strain(f, 0.1, 0.2, 0.3, 0.4, 18.79 * solar_mass, 1.58 * giga_parsec, 0.25, 0., 0.)
+
+def temp(f, t_c = 0., phi_c = 0.):
+    return strain(f, 0.1, 0.2, 0.3, 0.4, 18.9 * solar_mass, 1.58 * giga_parsec, 0.24, t_c, phi_c)
+
+def engine(df = 1/16):
+    limits = limit(18.79 * solar_mass, 0.25, 18.9 * solar_mass, 0.24)
+    f = np.arange(limits[0], max(limits[2:]) + df, df)
+    return overlap_grid(f, source(f), temp(f), limits = limits), limits
+
+def quad_overlap(t_c, phi_c, limits):
+    low_limit, upper_limit, f_cut_source, f_cut_temp = limits
+    integral = lambda g, high: quad(lambda f: np.real(g(f)) / Sn(f), low_limit, high, limit = 2000)[0]
+    num = 4 * integral(lambda f: source(f) * np.conjugate(temp(f, t_c, phi_c)), upper_limit)
+    norm_source = 4 * integral(lambda f: np.abs(source(f))**2, f_cut_source)
+    norm_temp = 4 * integral(lambda f: np.abs(temp(f))**2, f_cut_temp)
+
+    return num / np.sqrt(norm_source * norm_temp)
+
+def test_overlap_grid_matches_quad():
+    grid, limits = engine()
+    for x in [(0., 0.), (1e-3, 0.5), (-2e-3, -1.)]:
+        assert np.isclose(-grid.overlap(x), quad_overlap(*x, limits), rtol = 0, atol = 1e-4)
+
+def test_overlap_batch_matches_overlap():
+    grid, _ = engine()
+    x = np.array([[0., 1e-3, -2e-3], [0., 0.5, -1.]])
+    assert np.allclose(grid.overlap_batch(x), [grid.overlap(x[:, i]) for i in range(3)], rtol = 1e-12, atol = 0)
+
+def test_fft_maximize_matches_brute_force():
+    grid, _ = engine()
+    res = grid.maximize()
+
+    # dense scan of t_c, phi_c maximized analytically at every t_c
+    tc_arr = np.linspace(-0.2, 0.2, 40001)
+    num = np.abs(np.exp(-2j * np.pi * np.outer(tc_arr, grid.f)) @ grid.cross)
+    i = np.argmax(num)
+    tc_arr = np.linspace(tc_arr[i] - 1e-5, tc_arr[i] + 1e-5, 2001)
+    num = np.abs(np.exp(-2j * np.pi * np.outer(tc_arr, grid.f)) @ grid.cross)
+    overlap_max = np.max(num) / np.sqrt(grid.norm_source * grid.norm_temp)
+
+    assert np.isclose(-res.fun, overlap_max, rtol = 1e-9, atol = 0)
+    assert np.isclose(res.x[0], tc_arr[np.argmax(num)], rtol = 0, atol = 1e-8)
+    assert np.isclose(grid.overlap(res.x), res.fun, rtol = 1e-10, atol = 0)
+
+def test_fft_maximize_non_uniform_grid():
+    grid, limits = engine()
+    f = np.concatenate([np.arange(limits[0], 60, 1/32), np.arange(60, max(limits[2:]) + 1/8, 1/8)])
+    multiband = overlap_grid(f, source(f), temp(f), limits = limits)
+    assert np.isclose(multiband.maximize().fun, grid.maximize().fun, rtol = 1e-4, atol = 0)
@@ -0,0 +1,29 @@
+import numpy as np
+from gw_lens_dir.norm_cache import norm_cache, cached_norm
+
+
+class dummy_overlap():
+
+    def __init__(self, params_source = None, params_temp = None):
+
+        self.params_source = params_source
+        self.params_temp = params_temp
+        self.scale = params_source['scale']
+
+    def integrand(self, f):
+
+        return self.scale * f**2
+
+def test_cached_norm_reuses_and_separates_sources():
+    cache = norm_cache()
+    params_source, params_temp = {'scale': 1.}, {'mcz_temp': 1.}
+    first = dummy_overlap(params_source, params_temp)
+    assert np.isclose(cached_norm(first, first.integrand, 0, 3, (), cache = cache), 9.)
+    assert np.isclose(cached_norm(dummy_overlap(params_source, params_temp), first.integrand, 0, 3, (), cache = cache), 9.)
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+    # the drivers mutate the shared dictionary for the next point: the first object keeps its own key
+    params_source['scale'] = 2.
+    second = dummy_overlap(params_source, params_temp)
+    assert np.isclose(cached_norm(second, second.integrand, 0, 3, (), cache = cache), 18.)
+    assert np.isclose(cached_norm(first, first.integrand, 0, 3, (), cache = cache), 9.)
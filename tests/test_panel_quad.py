@@ -0,0 +1,23 @@
+import numpy as np
+from gw_lens_dir.panel_quad import panel_quad
+
+def test_panel_quad_polynomial_and_oscillatory():
+    value, err, _ = panel_quad(np.sin, 0, np.pi)
+    assert np.isclose(value, 2, rtol = 1e-12, atol = 0)
+
+    # int_a^b exp(i k f) df, many oscillations across the band
+    k, a, b = 40., 20., 250.
+    exact = (np.exp(1j * k * b) - np.exp(1j * k * a)) / (1j * k)
+    value, err, _ = panel_quad(lambda f: np.exp(1j * k * f), a, b, tol = 1e-10, rtol = 0)
+    assert np.abs(value - exact) < 1e-10
+    assert err < 1e-10
+
+def test_panel_quad_stack_and_error_estimate():
+    # a chirp like integrand and its norm share the panels
+    a, b = 20., 200.
+    func = lambda f: np.array([f**(-7 / 3), f**(-7 / 3) * np.exp(1j * 1e3 * f**(-5 / 3))])
+    value, err, _ = panel_quad(func, a, b, rtol = 1e-9)
+    assert np.isclose(value[0], 3 / 4 * (a**(-4 / 3) - b**(-4 / 3)), rtol = 1e-9, atol = 0)
+
+    fine, _, _ = panel_quad(func, a, b, rtol = 1e-13)
+    assert np.all(np.abs(value - fine) <= np.maximum(err, 1e-9 * np.abs(fine)))
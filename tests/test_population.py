@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from gw_lens_dir.population import population_optimize, problem_key
+
+BOUNDS = [[-0.2, 0.2], [-np.pi, np.pi]]
+OPTIONS = dict(bounds = BOUNDS, seed = 3, maxiter = 40, tol = 0., vectorized = True, polish = False)
+
+def objective(X):
+    return (X[0] - 0.05)**2 * 100 + np.cos(3 * X[1]) + 0.1 * X[1]**2
+
+class preempted(Exception):
+    pass
+
+def interrupt_after(n_calls):
+    calls = []
+    def func(X):
+        calls.append(X.shape[1])
+        if len(calls) > n_calls:
+            raise preempted
+        return objective(X)
+    return func, calls
+
+def test_resumed_run_matches_uninterrupted_run(tmp_path):
+    path = str(tmp_path / 'checkpoint.npz')
+    key = problem_key({'radius': 0.1, 'mcz_source': 1.}, {'mcz_temp': 1.})
+    reference = population_optimize(objective, **OPTIONS)
+
+    func, calls = interrupt_after(15)
+    with pytest.raises(preempted):
+        population_optimize(func, checkpoint = path, checkpoint_key = key, checkpoint_interval = 0., **OPTIONS)
+
+    func, calls = interrupt_after(np.inf)
+    res = population_optimize(func, checkpoint = path, checkpoint_key = key, **OPTIONS)
+    np.testing.assert_array_equal(res.x, reference.x)
+    assert res.fun == reference.fun and res.nit == reference.nit and res.nfev == reference.nfev
+    # the resumed run only evaluated the generations after the checkpoint
+    assert len(calls) == reference.nit - 14
+    assert not (tmp_path / 'checkpoint.npz').exists()
+
+@pytest.mark.parametrize('change', [{'key': 'other'}, {'seed': 4}, {'maxiter': 41}, {'x0': [0., 0.]}])
+def test_checkpoint_of_another_problem_is_not_resumed(tmp_path, change):
+    path = str(tmp_path / 'checkpoint.npz')
+    key = problem_key({'radius': 0.1}, {'mcz_temp': 1.})
+    func, calls = interrupt_after(15)
+    with pytest.raises(preempted):
+        population_optimize(func, checkpoint = path, checkpoint_key = key, checkpoint_interval = 0., **OPTIONS)
+
+    options = dict(OPTIONS, **{name: value for name, value in change.items() if name != 'key'})
+    func, calls = interrupt_after(np.inf)
+    res = population_optimize(func, checkpoint = path, checkpoint_key = change.get('key', key), **options)
+    # started from scratch: the initial population is evaluated too
+    assert len(calls) == res.nit + 1
+
+def test_problem_key():
+    params = {'radius': 0.1, 'mcz_source': 1.}
+    assert problem_key(params, {'mcz_temp': 1.}) == problem_key(dict(reversed(params.items())), {'mcz_temp': 1.})
+    assert problem_key(params, {'mcz_temp': 1.}) != problem_key(dict(params, radius = 0.2), {'mcz_temp': 1.})
+
+def test_checkpoint_needs_a_key(tmp_path):
+    with pytest.raises(ValueError):
+        population_optimize(objective, checkpoint = str(tmp_path / 'checkpoint.npz'), **OPTIONS)
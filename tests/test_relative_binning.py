@@ -0,0 +1,25 @@
+import numpy as np
+from gw_lens_dir.inner_product import strain, limit, overlap_grid
+from gw_lens_dir.relative_binning import relative_binning
+
+solar_mass = 4.92624076 * 10**-6 #[solar_mass] = sec
+giga_parsec = 1.02927125 * 10**17 #[giga_parsec] = sec
+
+def test_relative_binning_matches_grid():
+    limits = limit(20 * solar_mass, 0.25, 20 * solar_mass, 0.25)
+    f = np.arange(limits[0], max(limits[2:]) + 1/16, 1/16)
+    unlensed = lambda f, t_c = 0., phi_c = 0.: strain(f, 0., 0., 0., 0., 20 * solar_mass, giga_parsec, 0.25, t_c, phi_c)
+    # two geometrical optics images 5 ms apart
+    source = unlensed(f) * (1.2 - 0.6j * np.exp(2j * np.pi * f * 5e-3))
+    template = lambda f, x: unlensed(f, x[0], x[1])
+
+    grid = overlap_grid(f, source, unlensed(f), limits = limits)
+    x_fid = grid.maximize().x
+    samples = [(x_fid[0] - 8e-3, x_fid[1]), (x_fid[0] + 8e-3, x_fid[1])]
+    engine = relative_binning(f, source, template, x_fid, samples, limits = limits, eps = 1e-4, order = 2)
+    assert engine.n_bins() < len(f) / 10
+
+    x = np.array([x_fid[0] + np.array([-6e-3, -1e-3, 0., 2e-3, 7e-3]), x_fid[1] + np.array([0.3, -0.2, 0., 1., -2.])])
+    expected = grid.overlap_batch(x)
+    assert np.allclose(engine.overlap_batch(x), expected, rtol = 0, atol = 1e-4)
+    assert np.isclose(engine.overlap(x[:, 2]), expected[2], rtol = 0, atol = 1e-4)
@@ -0,0 +1,26 @@
+import numpy as np
+from gw_lens_dir import roq
+
+solar_mass = roq.solar_mass
+PRIOR = {'mcz': (19.5 * solar_mass, 20.5 * solar_mass), 'eta': (0.24, 0.25), 'tc': (-0.01, 0.01)}
+
+def test_validate_error_bounds(tmp_path):
+    tol = 1e-8
+    basis = roq.build_roq(PRIOR, df = 1/4, n_train = 200, tol = tol, quad_tol = 1e-10, n_test = 50)
+    report = basis.report
+
+    # the squared projection error is below tol on the training sets, the interpolation error of h and of the
+    # numerator is of order sqrt(tol) on new draws
+    assert report['max_err_h'] < 10 * np.sqrt(tol)
+    assert report['max_err_inner'] < 10 * np.sqrt(tol)
+    assert report['max_err_norm'] < 1e-8
+    assert report['n_basis'] < report['n_freq']
+
+    # the bounds hold on an independent set of draws, and the basis survives a save / load
+    path = str(tmp_path / 'roq.npz')
+    basis.save(path)
+    loaded = roq.roq_basis.load(path)
+    other = roq.validate(loaded, n_test = 50, seed = 7)
+    assert other['max_err_h'] < 10 * np.sqrt(tol)
+    assert other['max_err_inner'] < 10 * np.sqrt(tol)
+    assert loaded.prior == basis.prior
@@ -0,0 +1,29 @@
+import numpy as np
+from gw_lens_dir import amplification
+from gw_lens_dir.warm_sweep import warm_sweep, global_search
+from gw_lens_dir.inner_product import strain, limit, overlap_grid
+
+solar_mass = 4.92624076 * 10**-6 #[solar_mass] = sec
+giga_parsec = 1.02927125 * 10**17 #[giga_parsec] = sec
+
+def engines(M_lz_arr, y = 0.3):
+    limits = limit(20 * solar_mass, 0.25, 20 * solar_mass, 0.25)
+    f = np.arange(limits[0], max(limits[2:]) + 1/16, 1/16)
+    h = strain(f, 0., 0., 0., 0., 20 * solar_mass, giga_parsec, 0.25, 0., 0.)
+    return [overlap_grid(f, h * amplification.F_geo_sis(f, M_lz, y), h, limits = limits) for M_lz in M_lz_arr]
+
+def test_warm_sweep_matches_global_optima():
+    M_lz_arr = np.linspace(200, 3000, 12) * solar_mass
+    grids = dict(zip(M_lz_arr, engines(M_lz_arr)))
+    df_res = warm_sweep(lambda M_lz: grids[M_lz].overlap, M_lz_arr[::-1], names = ['M_lz'])
+
+    overlap_max = np.array([-grids[M_lz].maximize().fun for M_lz in df_res['M_lz']])
+    assert np.all(df_res['overlap'] > overlap_max - 1e-8)
+    # only the first point (and jumps) need a global search
+    assert np.count_nonzero(df_res['search'] == 'global') < len(M_lz_arr) / 2
+
+def test_global_search_takes_the_driver_budget():
+    grid = engines([1000 * solar_mass])[0]
+    res = global_search(grid.overlap, maxiter = 3, seed = 1, tol = 0.)
+    assert res.nit == 3
+    assert np.array_equal(res.x, global_search(grid.overlap, maxiter = 3, seed = 1, tol = 0.).x)